@@ -2,14 +2,30 @@
 # -*- coding: utf-8 -*-
 
 import argparse
+import glob
+import hashlib
+import os
+import pickle
 import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from dataclasses import dataclass
 from datetime import datetime, date
 from pathlib import Path
-from typing import Optional, Tuple, List
+from typing import Dict, Optional, Tuple, List
 
+import numpy as np
 import pandas as pd
 
+CACHE_VERSION = 1            # Subir si cambia el formato del DataFrame normalizado
+CACHE_SUFFIX = ".cache.pkl"  # historial.txt -> historial.txt.cache.pkl
+SNIFF_BYTES = 64 * 1024      # Bytes leídos para detectar encoding, header y separador
+TXT_SEPARATORS = ["\t", ";", ",", "|"]
+PDF_CACHE_DIR = ".pdf_cache"  # Tablas extraídas de PDFs, una por hash del contenido
+PDF_CACHE_VERSION = 1
+PDF_PARALLEL_MIN_PAGES = 16   # Páginas por proceso como mínimo (menos: un solo proceso)
+
+_COLUMN_SPLIT_RE = re.compile(r"\s{2,}")  # Columnas alineadas con espacios (PDF / TXT sin separador)
+
 # --------- Helpers ---------
 
 def _to_float(x: str) -> float:
@@ -78,6 +94,111 @@ def _parse_date_from_dt(s: str) -> Optional[date]:
     return None
 
 
+_FLOAT_RE = re.compile(r"[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?")
+_YMD_HEAD_RE = re.compile(r"\d{4}[-./]\d{2}[-./]\d{2}")
+
+
+def _to_float_series(values: pd.Series) -> pd.Series:
+    """
+    Versión vectorizada de _to_float (mismo resultado). Los valores que ya son un número limpio
+    ('-174.62', lo habitual en el export de MT4) se convierten en bloque; solo el resto pasa
+    por las reglas de separadores de _to_float.
+    """
+    s = values.astype(str)
+    clean = s.str.fullmatch(_FLOAT_RE).fillna(False).astype(bool)
+    out = pd.Series(0.0, index=values.index)
+    if clean.any():
+        out[clean] = np.array(s[clean].tolist(), dtype=float)
+    if not clean.all():
+        rest = s[~clean]
+        codes, uniques = pd.factorize(rest)
+        out[~clean] = np.array([_to_float(u) for u in uniques], dtype=float)[codes]
+    return out
+
+
+def _parse_date_series(values: pd.Series) -> pd.Series:
+    """
+    Versión vectorizada de _parse_date_from_dt: si el valor empieza por yyyy-mm-dd (separadores
+    . / -) se parsea una vez por día distinto; el resto, una vez por valor distinto.
+    Fechas imposibles (mes 13...) -> None.
+    """
+    raw = values.astype(str).str.strip()
+    heads = raw.str.slice(0, 10)
+    codes, uniques = pd.factorize(heads)
+    parsed_heads = [_safe_parse_date(u) if _YMD_HEAD_RE.fullmatch(u) else False for u in uniques]
+    out = [parsed_heads[c] for c in codes]
+
+    pending = [i for i, v in enumerate(out) if v is False]
+    if pending:
+        codes, uniques = pd.factorize(raw.iloc[pending])
+        parsed = [_safe_parse_date(u) for u in uniques]
+        for i, c in zip(pending, codes):
+            out[i] = parsed[c]
+    return pd.Series(out, index=values.index, dtype=object)
+
+
+def _safe_parse_date(s: str) -> Optional[date]:
+    try:
+        return _parse_date_from_dt(s)
+    except ValueError:
+        return None
+
+
+def _sniff_txt(path: Path) -> Optional[Tuple[str, int, str]]:
+    """
+    Detecta (encoding, línea del header, separador) leyendo solo el inicio del archivo.
+    None si no hay un header con TYPE separado por un delimitador conocido.
+    """
+    with open(path, "rb") as f:
+        head = f.read(SNIFF_BYTES)
+    if len(head) == SNIFF_BYTES and b"\n" in head:
+        head = head[:head.rfind(b"\n")]  # No cortar un carácter multibyte
+    try:
+        text, encoding = head.decode("utf-8"), "utf-8"
+    except UnicodeDecodeError:
+        text, encoding = head.decode("latin-1"), "latin-1"
+
+    lines = text.splitlines()
+    header_idx = None
+    seen = 0
+    for i, ln in enumerate(lines):
+        if not ln.strip():
+            continue
+        if "TYPE" in ln and ("PROFIT" in ln or "SWAP" in ln or "COMMISSION" in ln):
+            header_idx = i
+            break
+        seen += 1
+        if seen >= 50:
+            break
+    if header_idx is None:
+        header_idx = next((i for i, ln in enumerate(lines) if ln.strip()), 0)
+
+    header = lines[header_idx].lstrip("\ufeff") if lines else ""
+    for sep in TXT_SEPARATORS:
+        cols = header.split(sep)
+        if len(cols) >= 4 and any(c.strip().upper() == "TYPE" for c in cols):
+            return encoding, header_idx, sep
+    return None
+
+
+def _read_txt_fast(path: Path) -> Optional[pd.DataFrame]:
+    """
+    Lectura con el motor C: encoding/header/separador detectados una vez y todas las columnas
+    como texto (la conversión numérica la hace normalize_columns). None si hay que usar la ruta lenta.
+    """
+    sniffed = _sniff_txt(path)
+    if sniffed is None:
+        return None
+    encoding, header_idx, sep = sniffed
+    try:
+        return pd.read_csv(
+            path, sep=sep, engine="c", skiprows=header_idx, encoding=encoding,
+            dtype=str, keep_default_na=False, skip_blank_lines=True,
+        )
+    except (ValueError, UnicodeDecodeError, pd.errors.ParserError):
+        return None
+
+
 def _guess_delimiter_and_read_txt(path: Path) -> pd.DataFrame:
     """
     Intenta leer TXT con delimitador tab/;/, o espacios múltiples.
@@ -112,7 +233,7 @@ def _guess_delimiter_and_read_txt(path: Path) -> pd.DataFrame:
     # Fallback: espacios múltiples
     # Convertimos a "CSV" con separador | en base a 2+ espacios
     lines = raw[header_idx:]
-    split_lines = [re.split(r"\s{2,}", ln.strip()) for ln in lines]
+    split_lines = [_COLUMN_SPLIT_RE.split(ln.strip()) for ln in lines]
     # Usa la primera fila como header
     header = split_lines[0]
     rows = split_lines[1:]
@@ -124,28 +245,82 @@ def _guess_delimiter_and_read_txt(path: Path) -> pd.DataFrame:
     return df
 
 
-def _read_pdf_as_text_table(path: Path) -> pd.DataFrame:
+def _file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _pdf_page_rows(task: Tuple[str, int, int]) -> List[List[str]]:
     """
-    Extrae texto de PDF y reconstruye una tabla por heurística.
-    Requiere pdfplumber.
+    Filas de las páginas [inicio, fin) de un PDF, ya separadas en campos (2+ espacios).
+    Nivel de módulo: es la tarea de cada proceso (cada uno abre el PDF por su cuenta).
     """
-    try:
-        import pdfplumber
-    except ImportError as e:
-        raise RuntimeError("Falta dependencia: pip install pdfplumber") from e
+    import pdfplumber
 
-    all_lines: List[str] = []
-    with pdfplumber.open(str(path)) as pdf:
-        for page in pdf.pages:
+    path, start, end = task
+    rows: List[List[str]] = []
+    with pdfplumber.open(path) as pdf:
+        for page in pdf.pages[start:end]:
             txt = page.extract_text() or ""
             for ln in txt.splitlines():
                 ln = ln.strip()
                 if ln:
-                    all_lines.append(ln)
+                    rows.append(_COLUMN_SPLIT_RE.split(ln))
+    return rows
+
+
+def _extract_pdf_rows(path: Path, max_processes: Optional[int] = None) -> List[List[str]]:
+    """Todas las filas del PDF en orden; por bloques de páginas en paralelo si hay bastantes."""
+    import pdfplumber
+
+    with pdfplumber.open(str(path)) as pdf:
+        n_pages = len(pdf.pages)
+    processes = min(max_processes or os.cpu_count() or 1, n_pages // PDF_PARALLEL_MIN_PAGES)
+    if processes < 2:
+        return _pdf_page_rows((str(path), 0, n_pages))
+
+    # Bloques contiguos (uno por proceso); pool.map conserva el orden de las páginas
+    bounds = [n_pages * i // processes for i in range(processes + 1)]
+    tasks = [(str(path), bounds[i], bounds[i + 1]) for i in range(processes)]
+    try:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            parts = list(pool.map(_pdf_page_rows, tasks))
+    except Exception as e:
+        print(f"(Extracción en paralelo no disponible: {e}; se lee en un solo proceso)")
+        return _pdf_page_rows((str(path), 0, n_pages))
+    return [row for part in parts for row in part]
 
-    # Busca header
+
+def _read_pdf_as_text_table(path: Path, max_processes: Optional[int] = None) -> pd.DataFrame:
+    """
+    Extrae texto de PDF y reconstruye una tabla por heurística.
+    Requiere pdfplumber. La tabla se cachea en .pdf_cache/<sha256>.pkl junto al PDF: el mismo
+    extracto (aunque se copie o se renombre) no se vuelve a procesar.
+    """
+    try:
+        import pdfplumber  # noqa: F401
+    except ImportError as e:
+        raise RuntimeError("Falta dependencia: pip install pdfplumber") from e
+
+    cache = path.parent / PDF_CACHE_DIR / f"{_file_sha256(path)}.pkl"
+    if cache.exists():
+        try:
+            with open(cache, "rb") as f:
+                cached = pickle.load(f)
+            if cached.get("version") == PDF_CACHE_VERSION:
+                return cached["df"]
+        except Exception:
+            pass  # Caché corrupta: se regenera
+
+    all_rows = _extract_pdf_rows(path, max_processes)
+
+    # Busca header ("TYPE" no contiene espacios: buscar por campo equivale a buscar en la línea)
     header_idx = None
-    for i, ln in enumerate(all_lines[:200]):
+    for i, fields in enumerate(all_rows[:200]):
+        ln = "  ".join(fields)
         if "TYPE" in ln and ("PROFIT" in ln or "SWAP" in ln or "COMMISSION" in ln):
             header_idx = i
             break
@@ -153,26 +328,72 @@ def _read_pdf_as_text_table(path: Path) -> pd.DataFrame:
         # Si no hay header claro, intenta con la primera línea
         header_idx = 0
 
-    lines = all_lines[header_idx:]
-    split_lines = [re.split(r"\s{2,}", ln.strip()) for ln in lines]
-
+    split_lines = all_rows[header_idx:]
+    if len(split_lines) < 2:
+        return pd.DataFrame()
     header = split_lines[0]
     rows = split_lines[1:]
-    if not rows:
-        return pd.DataFrame()
 
     max_len = max(len(r) for r in rows)
     header = header + [f"COL_{i}" for i in range(len(header), max_len)]
     norm_rows = [r + [""] * (max_len - len(r)) for r in rows]
     df = pd.DataFrame(norm_rows, columns=header)
+
+    try:
+        cache.parent.mkdir(exist_ok=True)
+        tmp = cache.with_name(cache.name + ".tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump({"version": PDF_CACHE_VERSION, "df": df}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, cache)
+    except OSError as exc:
+        print(f"(No se pudo guardar la caché del PDF: {exc})")
     return df
 
 
 def load_any(path: Path) -> pd.DataFrame:
     if path.suffix.lower() == ".pdf":
         return _read_pdf_as_text_table(path)
-    else:
-        return _guess_delimiter_and_read_txt(path)
+    df = _read_txt_fast(path)
+    if df is None or df.shape[1] < 4:
+        df = _guess_delimiter_and_read_txt(path)
+    return df
+
+
+def _cache_path(path: Path) -> Path:
+    return path.with_name(path.name + CACHE_SUFFIX)
+
+
+def _cache_key(path: Path) -> Tuple[int, int, int]:
+    st = path.stat()
+    return CACHE_VERSION, st.st_mtime_ns, st.st_size
+
+
+def load_history(path: Path, use_cache: bool = True) -> pd.DataFrame:
+    """
+    load_any + normalize_columns, con caché binaria junto al fichero (historial.txt.cache.pkl).
+    La caché se invalida si cambia la fecha de modificación o el tamaño del fichero.
+    """
+    cache = _cache_path(path)
+    key = _cache_key(path)
+    if use_cache and cache.exists():
+        try:
+            with open(cache, "rb") as f:
+                cached = pickle.load(f)
+            if cached.get("key") == key:
+                return cached["df"]
+        except Exception:
+            pass  # Caché corrupta o de otra versión de pandas: se regenera
+
+    df = normalize_columns(load_any(path))
+    if use_cache:
+        tmp = cache.with_name(cache.name + ".tmp")
+        try:
+            with open(tmp, "wb") as f:
+                pickle.dump({"key": key, "df": df}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, cache)
+        except OSError as exc:
+            print(f"(No se pudo guardar la caché {cache.name}: {exc})")
+    return df
 
 
 def normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
@@ -221,29 +442,29 @@ def normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
 
     # Profit / comm / swap
     if col_profit:
-        out["PROFIT"] = df[col_profit].apply(_to_float)
+        out["PROFIT"] = _to_float_series(df[col_profit])
     else:
         out["PROFIT"] = 0.0
 
     if col_comm:
-        out["COMMISSION"] = df[col_comm].apply(_to_float)
+        out["COMMISSION"] = _to_float_series(df[col_comm])
     else:
         out["COMMISSION"] = 0.0
 
     if col_swap:
-        out["SWAP"] = df[col_swap].apply(_to_float)
+        out["SWAP"] = _to_float_series(df[col_swap])
     else:
         out["SWAP"] = 0.0
 
     # Amount (para depósitos), si existe
     if col_amount:
-        out["AMOUNT"] = df[col_amount].apply(_to_float)
+        out["AMOUNT"] = _to_float_series(df[col_amount])
     else:
         # muchos extractos meten el importe del depósito en PROFIT
         out["AMOUNT"] = out["PROFIT"]
 
     # Fecha (solo día)
-    out["DATE"] = out["CLOSE_TIME_RAW"].apply(_parse_date_from_dt)
+    out["DATE"] = _parse_date_series(out["CLOSE_TIME_RAW"])
     out = out.dropna(subset=["DATE"])
 
     return out
@@ -263,50 +484,69 @@ class Summary:
     injection_needed_vs_contributed: float
 
 
-def compute_summary(df_std: pd.DataFrame, exclude_types: str, target_daily: float, initial_capital: float = 0.0) -> Summary:
+def build_daily_table(df_std: pd.DataFrame, exclude_types: str, initial_capital: float = 0.0) -> Tuple[pd.DataFrame, float]:
+    """
+    Tabla diaria alineada: un día por fecha con aportaciones o trades, ordenada.
+    Columnas: DEPOSIT, PNL, TRADES, BAL_START, BAL_END (índice DatetimeIndex "DATE").
+    Retorna (tabla, capital aportado).
+    """
     # Deposits / aportaciones (puede ser una lista separada por comas: "DEPOSIT,CREDIT")
     exclude_list = [t.strip().upper() for t in exclude_types.split(",")]
     is_deposit = df_std["TYPE"].astype(str).str.upper().isin(exclude_list)
-    deposits = df_std[is_deposit].copy()
+    deposits = df_std[is_deposit]
+    trades = df_std[~is_deposit]
     # Un deposito suele ser positivo; si hubiera negativos (retiradas), tambien los contariamos.
-    deposits_by_day = deposits.groupby("DATE")["AMOUNT"].sum().sort_index() if len(deposits) > 0 else pd.Series(dtype=float)
     capital_contributed = float(deposits["AMOUNT"].sum()) if len(deposits) > 0 else initial_capital
 
-    # Trades (excluyendo UNKNOWN)
-    trades = df_std[~is_deposit].copy()
-    trades["NET"] = trades["PROFIT"] + trades["COMMISSION"] + trades["SWAP"]
-    pnl_by_day = trades.groupby("DATE")["NET"].sum().sort_index()
+    net = trades["PROFIT"] + trades["COMMISSION"] + trades["SWAP"]
+    daily = pd.concat(
+        {
+            "DEPOSIT": deposits.groupby("DATE")["AMOUNT"].sum(),
+            "PNL": net.groupby(trades["DATE"]).sum(),
+            "TRADES": trades.groupby("DATE").size(),
+        },
+        axis=1,
+    ).sort_index().fillna(0.0)
+    daily["TRADES"] = daily["TRADES"].astype(int)
+    daily.index = pd.DatetimeIndex(pd.to_datetime(list(daily.index)), name="DATE")
+
+    # Balance: suma acumulada de [inicial, dep1, pnl1, dep2, pnl2, ...] en el mismo orden que
+    # el recorrido día a día (saldo + aportación = inicio de día; + PnL = fin de día)
+    n = len(daily)
+    steps = np.empty(2 * n + 1)
+    steps[0] = initial_capital if len(deposits) == 0 else 0.0
+    steps[1::2] = daily["DEPOSIT"].to_numpy(dtype=float)
+    steps[2::2] = daily["PNL"].to_numpy(dtype=float)
+    running = np.cumsum(steps)
+    daily["BAL_START"] = running[1::2]
+    daily["BAL_END"] = running[2::2]
+    return daily, capital_contributed
 
+
+def compute_summary(df_std: pd.DataFrame, exclude_types: str, target_daily: float, initial_capital: float = 0.0) -> Summary:
+    daily, capital_contributed = build_daily_table(df_std, exclude_types, initial_capital)
+    return summary_from_daily(daily, capital_contributed, target_daily)
+
+
+def summary_from_daily(daily: pd.DataFrame, capital_contributed: float, target_daily: float) -> Summary:
+    """Summary a partir de una tabla diaria (de una cuenta o combinada con combine_daily_tables)."""
     # Días con trading (al menos 1 trade)
-    trade_days = int((trades.groupby("DATE").size() > 0).sum())
+    traded = daily[daily["TRADES"] > 0]
+    pnl_by_day = traded["PNL"]
+    trade_days = len(traded)
     net_total = float(pnl_by_day.sum())
     avg_net = net_total / trade_days if trade_days > 0 else 0.0
 
     # Mejor/peor día
     if len(pnl_by_day) > 0:
-        best_day = (pnl_by_day.idxmax(), float(pnl_by_day.max()))
-        worst_day = (pnl_by_day.idxmin(), float(pnl_by_day.min()))
+        best_day = (pnl_by_day.idxmax().date(), float(pnl_by_day.max()))
+        worst_day = (pnl_by_day.idxmin().date(), float(pnl_by_day.min()))
     else:
         best_day = (date.today(), 0.0)
         worst_day = (date.today(), 0.0)
 
-    # Reconstruccion de balance diario (balance inicial = capital_contributed o initial_capital)
-    all_days = sorted(set(deposits_by_day.index).union(set(pnl_by_day.index)))
-    bal = initial_capital if len(deposits) == 0 else 0.0
-    balance_start = {}
-    for d in all_days:
-        dep = float(deposits_by_day.get(d, 0.0)) if len(deposits_by_day) > 0 else 0.0
-        pnl = float(pnl_by_day.get(d, 0.0))
-        bal_start = bal + dep
-        balance_start[d] = bal_start
-        bal = bal_start + pnl
-
-    # Capital medio al inicio de días con trading (días donde hay pnl_by_day)
-    if len(pnl_by_day) > 0:
-        starts = [balance_start[d] for d in pnl_by_day.index if d in balance_start]
-        avg_capital_start = float(sum(starts) / len(starts)) if starts else 0.0
-    else:
-        avg_capital_start = 0.0
+    # Capital medio al inicio de días con trading
+    avg_capital_start = float(traded["BAL_START"].mean()) if trade_days > 0 else 0.0
 
     # ROI diario estimado (solo días con trading)
     roi_daily = (avg_net / avg_capital_start) if avg_capital_start > 0 else 0.0
@@ -329,6 +569,233 @@ def compute_summary(df_std: pd.DataFrame, exclude_types: str, target_daily: floa
     )
 
 
+# --------- Métricas ---------
+
+TRADING_DAYS_PER_YEAR = 252   # Anualización de Sharpe/Sortino
+ROLLING_WINDOWS = (7, 30)     # Ventanas (días naturales) de ROI móvil
+
+
+@dataclass
+class Metrics:
+    daily: pd.DataFrame          # Tabla diaria + ROI, ROI_7D, ROI_30D, DRAWDOWN, DRAWDOWN_PCT, DRAWDOWN_DAYS
+    max_drawdown: float          # EUR (<= 0), sobre el PnL acumulado (sin aportaciones)
+    max_drawdown_pct: float      # Fracción del balance en el pico
+    max_drawdown_days: int       # Días naturales desde el pico hasta la recuperación (o hasta el último día de la tabla)
+    sharpe: float                # Sobre el ROI de días con trading, anualizado
+    sortino: float
+    win_days: int
+    loss_days: int
+    best_win_streak: int         # Días con trading consecutivos en positivo
+    worst_loss_streak: int
+    current_streak: int          # > 0 racha ganadora en curso, < 0 perdedora
+
+
+def _runs(sign: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Rachas de valores iguales consecutivos: (longitud, valor) por racha."""
+    if len(sign) == 0:
+        return np.zeros(0, dtype=int), np.zeros(0)
+    starts = np.r_[0, np.flatnonzero(sign[1:] != sign[:-1]) + 1]
+    lengths = np.diff(np.r_[starts, len(sign)])
+    return lengths, sign[starts]
+
+
+def compute_metrics_from_daily(daily: pd.DataFrame) -> Metrics:
+    """Métricas vectorizadas sobre la tabla de build_daily_table (no modifica la original)."""
+    daily = daily.copy()
+    traded = daily["TRADES"].to_numpy() > 0
+    pnl = daily["PNL"].to_numpy(dtype=float)
+    bal_start = daily["BAL_START"].to_numpy(dtype=float)
+
+    # ROI diario y móvil (PnL de la ventana / capital medio al inicio de día), solo días con trading
+    with np.errstate(divide="ignore", invalid="ignore"):
+        roi = np.where(traded & (bal_start > 0), pnl / bal_start, np.nan)
+    daily["ROI"] = roi
+    tdaily = daily[traded]
+    for w in ROLLING_WINDOWS:
+        pnl_w = tdaily["PNL"].rolling(f"{w}D").sum()
+        cap_w = tdaily["BAL_START"].rolling(f"{w}D").mean()
+        daily[f"ROI_{w}D"] = (pnl_w / cap_w.where(cap_w > 0)).reindex(daily.index)
+
+    # Drawdown del PnL acumulado; el punto de partida (0) cuenta como pico
+    cum = np.cumsum(pnl)
+    peak = np.maximum.accumulate(np.maximum(cum, 0.0)) if len(cum) else cum
+    dd = cum - peak
+    under = dd < 0
+    peak_balance = daily["BAL_END"].to_numpy(dtype=float) - dd
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dd_pct = np.where(under & (peak_balance > 0), dd / peak_balance, 0.0)
+    idx = np.arange(len(dd))
+    last_peak = np.maximum.accumulate(np.where(under, 0, idx)) if len(dd) else idx
+    days = daily.index.to_numpy(dtype="datetime64[D]")
+    dd_days = np.where(under, (days - days[last_peak]).astype(int), 0) if len(dd) else idx
+    daily["DRAWDOWN"] = dd
+    daily["DRAWDOWN_PCT"] = dd_pct
+    daily["DRAWDOWN_DAYS"] = dd_days
+
+    # Sharpe / Sortino sobre el ROI de días con trading
+    r = roi[~np.isnan(roi)]
+    sharpe = sortino = 0.0
+    if len(r) >= 2:
+        std = r.std(ddof=1)
+        downside = np.sqrt(np.mean(np.minimum(r, 0.0) ** 2))
+        scale = np.sqrt(TRADING_DAYS_PER_YEAR)
+        sharpe = float(r.mean() / std * scale) if std > 0 else 0.0
+        sortino = float(r.mean() / downside * scale) if downside > 0 else 0.0
+
+    # Rachas sobre días con trading
+    lengths, signs = _runs(np.sign(pnl[traded]))
+    best_win = int(lengths[signs > 0].max(initial=0))
+    worst_loss = int(lengths[signs < 0].max(initial=0))
+    current = int(lengths[-1] * signs[-1]) if len(lengths) else 0
+
+    return Metrics(
+        daily=daily,
+        max_drawdown=float(dd.min(initial=0.0)),
+        max_drawdown_pct=float(dd_pct.min(initial=0.0)),
+        max_drawdown_days=int(dd_days.max(initial=0)),
+        sharpe=sharpe,
+        sortino=sortino,
+        win_days=int((pnl[traded] > 0).sum()),
+        loss_days=int((pnl[traded] < 0).sum()),
+        best_win_streak=best_win,
+        worst_loss_streak=worst_loss,
+        current_streak=current,
+    )
+
+
+def compute_metrics(df_std: pd.DataFrame, exclude_types: str, initial_capital: float = 0.0) -> Metrics:
+    daily, _ = build_daily_table(df_std, exclude_types, initial_capital)
+    return compute_metrics_from_daily(daily)
+
+
+# --------- Modo batch (varias cuentas) ---------
+
+BATCH_DEFAULT_PATTERN = "historial*.txt"  # Patrón si --batch recibe una carpeta
+MIN_CORR_DAYS = 5                         # Días en común mínimos para correlacionar dos cuentas
+
+
+def find_history_files(target: str) -> List[Path]:
+    """Carpeta (historial*.txt dentro) o glob ('C:/exports/*.txt'). Sin cachés ni duplicados."""
+    p = Path(target)
+    if p.is_dir():
+        files = p.glob(BATCH_DEFAULT_PATTERN)
+    else:
+        files = (Path(f) for f in glob.glob(target))
+    return sorted({f for f in files if f.is_file() and not f.name.endswith(CACHE_SUFFIX)})
+
+
+def account_name(path: Path) -> str:
+    """Nombre de cuenta a partir del fichero: historialActivTrades.txt -> ActivTrades."""
+    stem = path.stem
+    rest = stem[len("historial"):].lstrip("_- ") if stem.lower().startswith("historial") else stem
+    return rest or stem
+
+
+def _load_history_task(task: Tuple[str, bool]) -> pd.DataFrame:
+    """Tarea del pool (nivel de módulo para poder enviarse a otro proceso)."""
+    path, use_cache = task
+    return load_history(Path(path), use_cache=use_cache)
+
+
+def load_histories(paths: List[Path], use_cache: bool = True, max_processes: Optional[int] = None) -> pd.DataFrame:
+    """
+    Carga varios historiales (un fichero por proceso si hay más de uno) y los une en un solo
+    DataFrame con la columna ACCOUNT. Los ficheros que fallan se avisan y se omiten.
+    """
+    tasks = [(str(p), use_cache) for p in paths]
+    processes = min(max_processes or os.cpu_count() or 1, len(tasks))
+    frames: List[Optional[pd.DataFrame]] = [None] * len(tasks)
+    if processes > 1:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            futures = {pool.submit(_load_history_task, t): i for i, t in enumerate(tasks)}
+            for fut in as_completed(futures):
+                i = futures[fut]
+                try:
+                    frames[i] = fut.result()
+                except Exception as e:
+                    print(f"(Omitido {paths[i].name}: {e})")
+    else:
+        for i, t in enumerate(tasks):
+            try:
+                frames[i] = _load_history_task(t)
+            except Exception as e:
+                print(f"(Omitido {paths[i].name}: {e})")
+
+    names: List[str] = []
+    seen: Dict[str, int] = {}  # Nombre base -> último sufijo usado
+    for p in paths:
+        name = candidate = account_name(p)
+        while candidate in names:
+            seen[name] = seen.get(name, 1) + 1
+            candidate = f"{name}#{seen[name]}"
+        names.append(candidate)
+    tagged = [df.assign(ACCOUNT=n) for n, df in zip(names, frames) if df is not None and not df.empty]
+    if not tagged:
+        return pd.DataFrame(columns=["ACCOUNT", "TYPE", "PROFIT", "COMMISSION", "SWAP", "AMOUNT", "DATE"])
+    return pd.concat(tagged, ignore_index=True)
+
+
+def combine_daily_tables(tables: List[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Suma tablas diarias de varias cuentas sobre el índice de días común. En los días sin
+    actividad de una cuenta su balance es el del último día (o el inicial, antes del primero).
+    """
+    if not tables:
+        return pd.DataFrame(columns=["DEPOSIT", "PNL", "TRADES", "BAL_START", "BAL_END"])
+    index = tables[0].index
+    for t in tables[1:]:
+        index = index.union(t.index)
+    total = pd.DataFrame(0.0, index=index, columns=["DEPOSIT", "PNL", "TRADES", "BAL_START", "BAL_END"])
+    for t in tables:
+        if t.empty:
+            continue
+        d = t.reindex(index)
+        initial = float(t["BAL_START"].iloc[0] - t["DEPOSIT"].iloc[0])
+        end = d["BAL_END"].ffill().fillna(initial)
+        total["DEPOSIT"] += d["DEPOSIT"].fillna(0.0)
+        total["PNL"] += d["PNL"].fillna(0.0)
+        total["TRADES"] += d["TRADES"].fillna(0)
+        total["BAL_START"] += d["BAL_START"].fillna(end)
+        total["BAL_END"] += end
+    total["TRADES"] = total["TRADES"].astype(int)
+    return total
+
+
+@dataclass
+class BatchResult:
+    accounts: List[str]
+    summaries: dict               # cuenta -> Summary
+    metrics: dict                 # cuenta -> Metrics
+    portfolio_summary: Summary
+    portfolio_metrics: Metrics
+    correlation: pd.DataFrame     # PnL diario cuenta x cuenta (días con actividad en ambas)
+
+
+def analyze_batch(df_all: pd.DataFrame, exclude_types: str, target_daily: float, initial_capital: float = 0.0) -> BatchResult:
+    """Resumen y métricas por cuenta y de la cartera completa + matriz de correlación del PnL diario."""
+    summaries, metrics, tables, pnl_cols = {}, {}, [], {}
+    contributed = 0.0
+    accounts = list(dict.fromkeys(df_all["ACCOUNT"]))
+    for account, df in df_all.groupby("ACCOUNT", sort=False):
+        daily, capital = build_daily_table(df, exclude_types, initial_capital)
+        summaries[account] = summary_from_daily(daily, capital, target_daily)
+        metrics[account] = compute_metrics_from_daily(daily)
+        tables.append(daily)
+        contributed += capital
+        pnl_cols[account] = daily["PNL"].where(daily["TRADES"] > 0)
+
+    portfolio = combine_daily_tables(tables)
+    correlation = pd.DataFrame(pnl_cols).corr(min_periods=MIN_CORR_DAYS) if pnl_cols else pd.DataFrame()
+    return BatchResult(
+        accounts=accounts,
+        summaries=summaries,
+        metrics=metrics,
+        portfolio_summary=summary_from_daily(portfolio, contributed, target_daily),
+        portfolio_metrics=compute_metrics_from_daily(portfolio),
+        correlation=correlation,
+    )
+
+
 def fmt_eur(x: float) -> str:
     if x == float("inf"):
         return "INF"
@@ -350,6 +817,69 @@ def get_mt4_common_files_path() -> Path:
     return Path("C:/Users") / os.environ.get("USERNAME", "Administrator") / "AppData/Roaming/MetaQuotes/Terminal/Common/Files"
 
 
+def fmt_pct(x) -> str:
+    return "N/A" if x is None or pd.isna(x) else f"{x*100:.2f}%"
+
+
+def print_metrics(metrics: Metrics) -> None:
+    # Último día con trading: en un día solo de depósitos/retiros el ROI móvil es NaN
+    traded = metrics.daily[metrics.daily["TRADES"] > 0]
+    last = traded.iloc[-1] if len(traded) else None
+    print("\n=== MÉTRICAS ===")
+    for w in ROLLING_WINDOWS:
+        print(f"ROI últimos {w} días: {fmt_pct(None if last is None else last[f'ROI_{w}D'])}")
+    print(f"Drawdown máximo: {fmt_eur(metrics.max_drawdown)} ({fmt_pct(metrics.max_drawdown_pct)}), "
+          f"duración máxima {metrics.max_drawdown_days} días")
+    print(f"Sharpe (anualizado): {metrics.sharpe:.2f} | Sortino: {metrics.sortino:.2f}")
+    print(f"Días ganadores/perdedores: {metrics.win_days}/{metrics.loss_days} | "
+          f"Mejor racha: {metrics.best_win_streak} | Peor racha: {metrics.worst_loss_streak} | "
+          f"Racha actual: {metrics.current_streak:+d}")
+
+
+def run_batch(args) -> None:
+    """Modo --batch: todas las cuentas de una carpeta/glob en una sola ejecución."""
+    paths = find_history_files(args.batch)
+    if not paths:
+        raise SystemExit(f"No se encontraron historiales en: {args.batch}")
+    print(f"(Modo batch: {len(paths)} ficheros)")
+    df_all = load_histories(paths, use_cache=not args.no_cache, max_processes=args.procesos)
+    if df_all.empty:
+        raise SystemExit("No pude extraer filas válidas (DATE) de ningún fichero.")
+
+    res = analyze_batch(df_all, exclude_types=args.exclude_type, target_daily=args.target, initial_capital=args.capital)
+
+    print("\n=== POR CUENTA ===")
+    print(f"{'Cuenta':<20} {'Aportado':>18} {'PnL neto':>18} {'Días':>5} {'Media/día':>16} {'ROI diario':>10} {'Max DD':>18} {'Sharpe':>7}")
+    for account in res.accounts:
+        summ, m = res.summaries[account], res.metrics[account]
+        print(f"{account:<20} {fmt_eur(summ.capital_contributed):>18} {fmt_eur(summ.net_total):>18} {summ.trade_days:>5} "
+              f"{fmt_eur(summ.avg_net_per_trade_day):>16} {summ.roi_daily_est*100:>9.3f}% {fmt_eur(m.max_drawdown):>18} {m.sharpe:>7.2f}")
+
+    summ = res.portfolio_summary
+    print(f"\n=== CARTERA ({len(res.accounts)} cuentas) ===")
+    print(f"Aportaciones (TYPE in [{args.exclude_type}]): {fmt_eur(summ.capital_contributed)}")
+    print(f"PnL neto total (sin aportaciones): {fmt_eur(summ.net_total)}")
+    print(f"Días con trading: {summ.trade_days}")
+    print(f"Media diaria (solo días con trading): {fmt_eur(summ.avg_net_per_trade_day)}")
+    print(f"Mejor día: {summ.best_day[0].isoformat()} -> {fmt_eur(summ.best_day[1])}")
+    print(f"Peor día:  {summ.worst_day[0].isoformat()} -> {fmt_eur(summ.worst_day[1])}")
+    print(f"Capital medio (inicio de día en días con trading): {fmt_eur(summ.avg_capital_start_trade_days)}")
+    print(f"ROI diario estimado (media/ capital medio): {summ.roi_daily_est*100:.3f}%")
+    print(f"Capital requerido para {fmt_eur(args.target)} / día (aprox): {fmt_eur(summ.capital_needed_for_target)}")
+    print_metrics(res.portfolio_metrics)
+
+    print(f"\n=== CORRELACIÓN PnL DIARIO (mín. {MIN_CORR_DAYS} días en común) ===")
+    width = max([len(a) for a in res.accounts] + [6])
+    print(" " * width + "".join(f" {a[:10]:>10}" for a in res.accounts))
+    for a in res.accounts:
+        cells = "".join(
+            f" {'N/A' if pd.isna(res.correlation.at[a, b]) else format(res.correlation.at[a, b], '.2f'):>10}"
+            for b in res.accounts
+        )
+        print(f"{a:<{width}}{cells}")
+    print()
+
+
 def main():
     # Ruta por defecto: historial.txt en Common\Files de MT4
     mt4_common = get_mt4_common_files_path()
@@ -365,8 +895,16 @@ def main():
     ap.add_argument("--exclude-type", type=str, default="DEPOSIT,CREDIT", help="Valores de TYPE que se consideran aportacion, separados por coma (default: DEPOSIT,CREDIT)")
     ap.add_argument("--target", type=float, default=320.0, help="Objetivo de media diaria (EUR/dia) para calcular capital necesario (default: 320)")
     ap.add_argument("--capital", type=float, default=0.0, help="Capital inicial de la cuenta (si no hay depositos en historial)")
+    ap.add_argument("--no-cache", action="store_true", help="No usar ni guardar la caché binaria (<fichero>.cache.pkl)")
+    ap.add_argument("--batch", type=str, default=None,
+                    help=f"Carpeta ({BATCH_DEFAULT_PATTERN}) o glob con historiales de varias cuentas: resumen por cuenta, cartera y correlación")
+    ap.add_argument("--procesos", type=int, default=None, help="Procesos para cargar ficheros en modo batch (default: nº de CPUs)")
     args = ap.parse_args()
 
+    if args.batch:
+        run_batch(args)
+        return
+
     # Determinar qué archivo usar
     if args.file:
         path = Path(args.file)
@@ -382,8 +920,7 @@ def main():
     if not path.exists():
         raise SystemExit(f"No existe el fichero: {path}")
 
-    df_raw = load_any(path)
-    df = normalize_columns(df_raw)
+    df = load_history(path, use_cache=not args.no_cache)
 
     if df.empty:
         raise SystemExit("No pude extraer filas válidas (DATE) del fichero. Revisa formato o pásame otro export.")
@@ -406,6 +943,8 @@ def main():
     print(f"Capital requerido (aprox): {fmt_eur(summ.capital_needed_for_target)}")
     print(f"Inyección necesaria vs capital aportado: {fmt_eur(summ.injection_needed_vs_contributed)}")
 
+    print_metrics(compute_metrics(df, exclude_types=args.exclude_type, initial_capital=args.capital))
+
     print("\n(Notas) NET = PROFIT + COMMISSION + SWAP. Aportaciones excluidas por TYPE.")
     print("Si tu PDF/TXT no trae COMMISSION o SWAP, se asumen 0.\n")
 
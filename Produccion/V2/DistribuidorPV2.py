@@ -26,14 +26,32 @@ from dataclasses import dataclass
 from pathlib import Path
 from typing import List, Optional, Dict
 
+from configuracion import CONFIG_FILENAME, load_file_config
+from metricas import REGISTRY, RateWindow, start_metrics_server
+from relojes import ClockOffsetEstimator
+
 # Configuración por defecto
 DEFAULT_SPOOL_FOLDER = "PROD\\Phoenix\\V2\\Spool"
 DEFAULT_WORKER_IDS = ["01"]
 DEFAULT_POLL_SECONDS = 1.0
-CONFIG_FILENAME = "distribuidor_config.txt"
 DEFAULT_RELOAD_MINUTES = 15.0
 PURGE_HOUR = 0  # 00:xx
 PURGE_MINUTE = 1  # xx:01
+DEFAULT_METRICS_PORT = 0  # 0 = endpoint /metrics desactivado
+
+# Métricas (se exponen solo si metrics_port > 0)
+M_SPOOL_DEPTH = REGISTRY.gauge("phoenix_spool_eventos", "Eventos pendientes en el spool al inicio del ciclo")
+M_EVENTS = REGISTRY.counter("phoenix_eventos_total", "Eventos del spool procesados", ["event_type", "resultado"])
+M_EVENTS_RATE = REGISTRY.gauge("phoenix_eventos_por_segundo", "Eventos procesados por segundo (ventana 60s)")
+M_STAGE_LATENCY = REGISTRY.histogram("phoenix_etapa_latencia_segundos", "Latencia por etapa del pipeline", ["etapa"])
+M_QUEUE_WRITE = REGISTRY.histogram("phoenix_cola_escritura_segundos", "Latencia de escritura en cola_WORKER_XXX.csv", ["worker"])
+M_CYCLE = REGISTRY.histogram("phoenix_ciclo_segundos", "Duración de un ciclo completo del distribuidor")
+M_PURGE_DURATION = REGISTRY.gauge("phoenix_purga_duracion_segundos", "Duración de la última purga nocturna")
+M_PURGE_LAST = REGISTRY.gauge("phoenix_purga_ultima_timestamp", "Epoch (s) de la última purga nocturna")
+M_CLOCK_OFFSET = REGISTRY.gauge("phoenix_reloj_desfase_ms", "Desfase de reloj estimado por fuente (mediana móvil)", ["fuente"])
+_EVENTS_WINDOW = RateWindow(60)
+# Desfase PC MT4 (EXPORT_TIME / OPEN_TIME_UTC_MS) vs PC del distribuidor, aprendido de read - export
+_CLOCKS = ClockOffsetEstimator()
 
 
 def default_common_files_dir() -> Path:
@@ -59,74 +77,6 @@ def env_float(name: str) -> float | None:
         return None
 
 
-def load_file_config(cfg_path: Path) -> dict:
-    """
-    Lee un fichero plano key=value (una clave por línea).
-    Formato esperado:
-      common_files_dir=C:\\Users\\...\\Common\\Files
-      spool_folder=PROD\\Phoenix\\V2\\Spool
-      worker_ids=01,02,03
-      worker_id=71617942|xaudusd-std=XAUUSD|eurusd-std=EURUSD
-      poll_seconds=1.0
-    Líneas vacías o que empiezan por # se ignoran.
-    """
-    cfg: dict = {}
-    workers: List[str] = []
-    symbol_mappings: dict[str, dict[str, str]] = {}
-    if not cfg_path.exists():
-        cfg["worker_ids_list"] = workers
-        cfg["symbol_mappings"] = symbol_mappings
-        return cfg
-    try:
-        for raw in cfg_path.read_text(encoding="utf-8").splitlines():
-            line = raw.strip()
-            if not line or line.startswith("#"):
-                continue
-            if "=" not in line:
-                continue
-            key, value = line.split("=", 1)
-            key = key.strip()
-            value = value.strip()
-            if not key:
-                continue
-            if key == "worker_id":
-                # Formato: worker_id=<id>|<symbol_origen>=<symbol_destino>|...
-                if "|" in value:
-                    parts = value.split("|", 1)
-                    worker_id = parts[0].strip()
-                    workers.append(worker_id)
-                    
-                    if len(parts) > 1 and parts[1].strip():
-                        mappings_str = parts[1].strip()
-                        worker_mappings: dict[str, str] = {}
-                        for mapping_pair in mappings_str.split("|"):
-                            mapping_pair = mapping_pair.strip()
-                            if "=" in mapping_pair:
-                                symbol_orig, symbol_dest = mapping_pair.split("=", 1)
-                                symbol_orig = symbol_orig.strip().upper()
-                                symbol_dest = symbol_dest.strip().upper()
-                                if symbol_orig and symbol_dest:
-                                    worker_mappings[symbol_orig] = symbol_dest
-                        if worker_mappings:
-                            symbol_mappings[worker_id] = worker_mappings
-                else:
-                    workers.append(value)
-            else:
-                cfg[key] = value
-    except Exception as exc:
-        print(f"[WARN] No se pudo leer {cfg_path}: {exc}")
-    cfg["worker_ids_list"] = workers
-    cfg["symbol_mappings"] = symbol_mappings
-    
-    # Debug: mostrar qué se encontró
-    if workers:
-        print(f"[DEBUG] load_file_config: Encontrados {len(workers)} workers: {workers}")
-    else:
-        print(f"[DEBUG] load_file_config: No se encontraron workers en config")
-    
-    return cfg
-
-
 @dataclass
 class Config:
     common_dir: Path
@@ -135,6 +85,7 @@ class Config:
     symbol_mappings: dict[str, dict[str, str]]
     poll_seconds: float
     reload_minutes: float
+    metrics_port: int = DEFAULT_METRICS_PORT
 
 
 def load_config() -> Config:
@@ -206,6 +157,17 @@ def load_config() -> Config:
     if reload_minutes is None:
         reload_minutes = DEFAULT_RELOAD_MINUTES
 
+    metrics_port = env_float("METRICS_PORT")
+    if metrics_port is None:
+        file_port = file_cfg.get("metrics_port")
+        if file_port:
+            try:
+                metrics_port = float(file_port)
+            except ValueError:
+                metrics_port = None
+    if metrics_port is None:
+        metrics_port = DEFAULT_METRICS_PORT
+
     return Config(
         common_dir=common_dir,
         spool_folder=spool_folder,
@@ -213,6 +175,7 @@ def load_config() -> Config:
         symbol_mappings=symbol_mappings,
         poll_seconds=float(poll_seconds),
         reload_minutes=float(reload_minutes),
+        metrics_port=int(metrics_port),
     )
 
 
@@ -409,9 +372,11 @@ def append_to_queues(valid_lines: List[str], queues_dir: Path, worker_ids: List[
         
         queue_path = queues_dir / f"cola_WORKER_{worker_id}.csv"
         ok = True
+        write_start = time.perf_counter()
         try:
             with open(queue_path, "a", encoding="utf-8", newline="") as fh:
                 fh.writelines(mapped_lines)
+            M_QUEUE_WRITE.observe(time.perf_counter() - write_start, worker=worker_id)
         except Exception as exc:
             ok = False
             pending_path = queues_dir / f"pendientes_worker_{worker_id}.csv"
@@ -462,6 +427,36 @@ def append_hist_clonacion(valid_lines: List[str], worker_ids: List[str], status:
         fh.writelines(lines_out)
 
 
+def record_event_metrics(event_type: str, resultado: str, export_time_ms: str = "", read_time_ms: str = "", distribute_time_ms: str = "") -> None:
+    """
+    Registra contador y latencias por etapa de un evento (timestamps en ms epoch como string).
+    Las etapas sin timestamp válido o con valor negativo (desfase de reloj) se omiten.
+    """
+    M_EVENTS.inc(event_type=event_type or "DESCONOCIDO", resultado=resultado)
+    _EVENTS_WINDOW.add(1)
+    if resultado != "OK":
+        return
+    stages = (
+        ("export_read", export_time_ms, read_time_ms),
+        ("read_distribute", read_time_ms, distribute_time_ms),
+    )
+    for stage, start, end in stages:
+        try:
+            diff_ms = int(end) - int(start)
+        except (TypeError, ValueError):
+            continue
+        if stage == "export_read":
+            diff_ms += _CLOCKS.correction_ms("extractor", diff_ms)
+        if diff_ms >= 0:
+            M_STAGE_LATENCY.observe(diff_ms / 1000.0, etapa=stage)
+    try:
+        done_ms = int(time.time() * 1000) - int(distribute_time_ms)
+        if done_ms >= 0:
+            M_STAGE_LATENCY.observe(done_ms / 1000.0, etapa="distribute_historico")
+    except (TypeError, ValueError):
+        pass
+
+
 def process_spool_event(event_path: Path, config: Config) -> bool:
     """
     Procesa un evento completo: leer, parsear, distribuir, historizar, borrar.
@@ -482,14 +477,25 @@ def process_spool_event(event_path: Path, config: Config) -> bool:
         ticket = event_dict.get("TICKET", "")
         event_time_ms = event_dict.get("EVENT_TIME", "")
         export_time_ms = event_dict.get("EXPORT_TIME", "")
+        try:
+            _CLOCKS.observe("extractor", int(read_time_ms) - int(export_time_ms))
+            M_CLOCK_OFFSET.set(_CLOCKS.offset_ms("extractor"), fuente="extractor")
+        except ValueError:
+            pass
 
         # Regla 30s SOLO para eventos OPEN (antes de distribuir)
-        # Usa OPEN_TIME_UTC_MS (ms epoch UTC) vs "ahora" (ms epoch UTC) del servidor del distribuidor
+        # Usa OPEN_TIME_UTC_MS (ms epoch UTC) vs "ahora" (ms epoch UTC) del servidor del distribuidor,
+        # corregido con el desfase estimado entre ambos PCs. Los dos relojes son epoch UTC: la
+        # corrección es solo el residual negativo acotado de la mediana móvil, nunca horas (un
+        # evento que lleva 1h en el spool no debe "corregirse" a fresco).
         if event_type == "OPEN":
             now_ms_int = int(time.time() * 1000)
+            clock_ms = _CLOCKS.correction_ms("extractor")
+            if clock_ms:
+                print(f"[INFO] Regla 30s con corrección de reloj extractor/distribuidor: {clock_ms:+d} ms")
             try:
                 open_ms_int = int(event_dict.get("OPEN_TIME_UTC_MS", "") or "")
-                diff_seconds = int(max(0, (now_ms_int - open_ms_int) / 1000))
+                diff_seconds = int(max(0, (now_ms_int - open_ms_int + clock_ms) / 1000))
                 open_dt_str = datetime.fromtimestamp(open_ms_int / 1000).strftime("%Y.%m.%d %H:%M:%S")
             except Exception:
                 # Si no podemos calcular, NO distribuimos por seguridad y lo dejamos registrado
@@ -544,6 +550,7 @@ def process_spool_event(event_path: Path, config: Config) -> bool:
                 # para evitar inconsistencias con EVENT_TIME (server time) del archivo.
                 hist_event_time_ms = str(open_ms_int) if diff_seconds != -1 else event_time_ms
                 append_hist_master(valid_lines, hist_master_path, hist_event_time_ms, export_time_ms, read_time_ms, distribute_time_ms)
+                record_event_metrics("OPEN_INVALIDATE_BYTIME30SEG", "INVALIDADO")
 
                 print(
                     f"[OPEN][INVALIDADO_30S] ticket={ticket} open_time (real)={open_real_dt_str} "
@@ -579,6 +586,7 @@ def process_spool_event(event_path: Path, config: Config) -> bool:
             hist_master_path = config.common_dir / "PROD" / "Phoenix" / "V2" / "Historico_Master.csv"
             distribute_time_ms = str(int(time.time() * 1000))
             append_hist_master(valid_lines, hist_master_path, event_time_ms, export_time_ms, read_time_ms, distribute_time_ms)
+            record_event_metrics(event_type, "INVALIDADO")
             print(f"[OK] Orden invalidada por tiempo registrada en histórico: {event_path.name} (EVENT={event_type} TICKET={ticket})")
         else:
             # 5. Distribuir a workers (en PROD/Phoenix/V2) para eventos normales
@@ -593,6 +601,7 @@ def process_spool_event(event_path: Path, config: Config) -> bool:
             all_ok = all(status.values())
             if not all_ok:
                 print(f"[WARN] No se procesó {event_path.name} por errores en distribución (EVENT={event_type} TICKET={ticket})")
+                record_event_metrics(event_type, "ERROR")
                 return False
             
             # 7. Escribir históricos SOLO si la distribución fue exitosa
@@ -601,6 +610,7 @@ def process_spool_event(event_path: Path, config: Config) -> bool:
             
             append_hist_master(valid_lines, hist_master_path, event_time_ms, export_time_ms, read_time_ms, distribute_time_ms)
             append_hist_clonacion(valid_lines, config.worker_ids, status, hist_clonacion_path)
+            record_event_metrics(event_type, "OK", export_time_ms, read_time_ms, distribute_time_ms)
         
         # 7. Borrar archivo de evento (solo si todo fue exitoso)
         try:
@@ -672,6 +682,7 @@ def purga_nocturna(config: Config) -> None:
     """
     phoenix_dir = config.common_dir / "PROD" / "Phoenix" / "V2"
     purge_timestamp = datetime.now().strftime("%Y.%m.%d %H:%M:%S")
+    purge_start = time.perf_counter()
     
     print(f"[PURGA] Iniciando purga nocturna para {len(config.worker_ids)} workers...")
     
@@ -779,7 +790,10 @@ def purga_nocturna(config: Config) -> None:
             except Exception:
                 pass
     
-    print(f"[PURGA] Purga nocturna completada")
+    purge_seconds = time.perf_counter() - purge_start
+    M_PURGE_DURATION.set(purge_seconds)
+    M_PURGE_LAST.set(time.time())
+    print(f"[PURGA] Purga nocturna completada en {purge_seconds:.2f}s")
 
 
 def check_and_run_purge(config: Config) -> bool:
@@ -827,6 +841,7 @@ def run_service() -> None:
     print(f"[INIT] Intervalo de sondeo: {cfg.poll_seconds}s")
     print(f"[INIT] Recarga config cada: {cfg.reload_minutes} minutos")
     print(f"[INIT] Purga nocturna programada para: {PURGE_HOUR:02d}:{PURGE_MINUTE:02d}")
+    start_metrics_server(cfg.metrics_port)
     
     if not cfg.worker_ids:
         print(f"[ERROR] No hay workers configurados! El distribuidor no funcionará.")
@@ -843,6 +858,7 @@ def run_service() -> None:
 
             # Escanear spool
             event_files = scan_spool_directory(spool_dir)
+            M_SPOOL_DEPTH.set(len(event_files))
             
             if event_files:
                 print(f"[CICLO] Encontrados {len(event_files)} eventos en spool")
@@ -861,6 +877,8 @@ def run_service() -> None:
                 print(f"[CICLO] Procesados: {processed} | Errores: {errors}")
 
             elapsed_ms = int((time.time() - cycle_start) * 1000)
+            M_CYCLE.observe(elapsed_ms / 1000.0)
+            M_EVENTS_RATE.set(_EVENTS_WINDOW.rate())
             if processed > 0:
                 print(f"[CICLO] Tiempo procesamiento: {elapsed_ms} ms")
 
@@ -7,18 +7,32 @@ Uso:
     python LogMonitorPV2.py                 # Modo normal
     python LogMonitorPV2.py --test          # Enviar mensaje de prueba
     python LogMonitorPV2.py --daemon        # Correr como daemon (sin ventana)
+    python LogMonitorPV2.py --watch         # Reaccionar a cambios en errores/estados (requiere watchdog)
+
+Multi-despliegue: si existe monitor_targets.txt (o MONITOR_TARGETS_FILE) se monitorizan
+todas sus carpetas desde un único proceso (un bucle asyncio, una tarea por despliegue).
+
+Métricas: si MONITOR_METRICS_PORT > 0 expone /metrics (formato texto Prometheus).
 """
 
 import os
 import sys
 import time
 import csv
+import asyncio
+import threading
 import requests
 import warnings
 from datetime import datetime, timedelta
 from pathlib import Path
 from collections import defaultdict
 
+from metricas import REGISTRY, start_metrics_server
+from anomalias import AnomalyDetector
+from tiempos import TimestampColumn, parse_epoch, parse_mt4_date
+from lectura_incremental import TailReader
+from configuracion import CONFIG_FILENAME, load_file_config
+
 # Suprimir warnings de SSL
 warnings.filterwarnings('ignore', message='Unverified HTTPS request')
 
@@ -35,6 +49,12 @@ LOGS_BASE_PATH = Path(os.environ.get('APPDATA', '')) / "MetaQuotes" / "Terminal"
 # Intervalo de monitoreo (segundos)
 MONITOR_INTERVAL = 30
 
+# Modo watch: ventana para agrupar ráfagas de escrituras antes de revisar (segundos)
+WATCH_DEBOUNCE_SECONDS = 0.3
+
+# Archivos que disparan una revisión inmediata en modo watch
+WATCH_PREFIXES = ("errores_WORKER_", "estados_WORKER_")
+
 # Hora del resumen diario (formato 24h)
 DAILY_SUMMARY_HOUR = 8  # 08:00
 
@@ -42,19 +62,37 @@ DAILY_SUMMARY_HOUR = 8  # 08:00
 HOURLY_REPORT_START = 8
 HOURLY_REPORT_END = 20
 
+# Config del distribuidor (lista de workers)
+CONFIG_PATH = Path(__file__).parent / CONFIG_FILENAME
+
+# Lista de despliegues a monitorizar (opcional). Formato por línea:
+#   target=<nombre>|<carpeta_logs>|<distribuidor_config>|<chat_id opcional>
+# carpeta_logs relativa se resuelve contra Common\Files (p.ej. V3\Phoenix o PROD\Phoenix\V2)
+MONITOR_TARGETS_FILE = Path(os.environ.get('MONITOR_TARGETS_FILE', '') or Path(__file__).parent / "monitor_targets.txt")
+COMMON_FILES_PATH = Path(os.environ.get('APPDATA', '')) / "MetaQuotes" / "Terminal" / "Common" / "Files"
+
 # Archivo para guardar estado del monitor
 STATE_FILE = Path(__file__).parent / "monitor_state.json"
 
+# Puerto del endpoint /metrics (0 = desactivado)
+METRICS_PORT = int(os.environ.get('MONITOR_METRICS_PORT', '0') or 0)
+
+# Métricas del monitor
+M_PENDING = REGISTRY.gauge("phoenix_worker_pendientes", "Comandos en cola_WORKER sin estado completado", ["despliegue", "worker"])
+M_LAG = REGISTRY.gauge("phoenix_worker_lag_segundos", "Segundos desde la última escritura en estados con comandos pendientes", ["despliegue", "worker"])
+M_ALERTS = REGISTRY.counter("phoenix_monitor_alertas_total", "Alertas enviadas por el monitor", ["despliegue", "worker", "tipo"])
+M_CHECK = REGISTRY.histogram("phoenix_monitor_check_segundos", "Duración de una verificación completa del monitor", ["despliegue"])
+
 # =============================================================================
 # TELEGRAM
 # =============================================================================
 
-def send_telegram(message: str, parse_mode: str = None) -> bool:
-    """Envía mensaje a Telegram"""
+def send_telegram(message: str, parse_mode: str = None, chat_id: str = None) -> bool:
+    """Envía mensaje a Telegram (chat por defecto: TELEGRAM_CHAT_ID)"""
     try:
         url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
         data = {
-            "chat_id": TELEGRAM_CHAT_ID,
+            "chat_id": chat_id or TELEGRAM_CHAT_ID,
             "text": message,
         }
         if parse_mode:
@@ -95,16 +133,219 @@ def get_file_mod_time(filepath: Path) -> float:
     except:
         return 0
 
+# =============================================================================
+# REGISTRO DE WORKERS Y LECTURA INCREMENTAL
+# =============================================================================
+
+class WorkerEntry:
+    """Estado por worker: lectores incrementales y comandos pendientes"""
+    
+    def __init__(self, worker_id: str, base_path: Path):
+        self.worker_id = worker_id
+        self.base_path = base_path
+        self.tails = {}
+        self.completed = set()  # ticket_EVENT con estado=2
+        self.pending = set()    # ticket_EVENT en cola sin estado=2
+    
+    def tail(self, kind: str) -> TailReader:
+        """kind: errores | estados | cola"""
+        reader = self.tails.get(kind)
+        if reader is None:
+            reader = TailReader(self.base_path / f"{kind}_WORKER_{self.worker_id}.csv")
+            self.tails[kind] = reader
+        return reader
+    
+    def read_estados(self) -> list:
+        """Filas nuevas de estados; actualiza completados/pendientes"""
+        reader = self.tail('estados')
+        rows = reader.read_rows()
+        if reader.was_reset:
+            self.completed.clear()
+        for row in rows:
+            if len(row) >= 3 and row[2].strip() == "2":
+                key = f"{row[0].strip()}_{row[1].strip().upper()}"
+                self.completed.add(key)
+                self.pending.discard(key)
+        return rows
+    
+    def read_cola(self) -> list:
+        """Filas nuevas de cola; actualiza pendientes"""
+        reader = self.tail('cola')
+        rows = reader.read_rows()
+        if reader.was_reset:
+            self.pending.clear()
+        for row in rows:
+            if len(row) < 2:
+                continue
+            key = f"{row[1].strip()}_{row[0].strip().upper()}"
+            if key not in self.completed:
+                self.pending.add(key)
+        return rows
+    
+    def close(self):
+        for reader in self.tails.values():
+            reader.close()
+
+
+class WorkerRegistry:
+    """
+    Workers monitorizados = worker_id del distribuidor_config.txt (mismo parser que
+    el distribuidor) + los que tengan estados_/cola_WORKER_*.csv en la carpeta.
+    Solo se vuelve a descubrir cuando cambia el mtime de la carpeta o del config,
+    así que en régimen estable cuesta dos stat() por verificación.
+    """
+    
+    def __init__(self, base_path: Path, config_path: Path = CONFIG_PATH):
+        self.base_path = base_path
+        self.config_path = config_path
+        self._dir_mtime = None
+        self._cfg_mtime = None
+        self._config_workers = []
+        self._entries = {}
+    
+    def refresh(self, force: bool = False) -> bool:
+        """Re-descubre si cambió la carpeta o el config. Retorna True si hubo rescan"""
+        dir_mtime = get_file_mod_time(self.base_path)
+        cfg_mtime = get_file_mod_time(self.config_path)
+        if not force and dir_mtime == self._dir_mtime and cfg_mtime == self._cfg_mtime:
+            return False
+        
+        if cfg_mtime != self._cfg_mtime:
+            self._config_workers = load_file_config(self.config_path).get("worker_ids_list", [])
+        self._dir_mtime = dir_mtime
+        self._cfg_mtime = cfg_mtime
+        
+        found = list(self._config_workers)
+        if self.base_path.exists():
+            for pattern, prefix in (("estados_WORKER_*.csv", "estados_WORKER_"), ("cola_WORKER_*.csv", "cola_WORKER_")):
+                for f in self.base_path.glob(pattern):
+                    worker_id = f.stem.replace(prefix, "")
+                    if worker_id not in found:
+                        found.append(worker_id)
+        
+        for worker_id in list(self._entries):
+            if worker_id not in found:
+                self._entries.pop(worker_id).close()
+        for worker_id in found:
+            if worker_id not in self._entries:
+                self._entries[worker_id] = WorkerEntry(worker_id, self.base_path)
+        return True
+    
+    def worker_ids(self) -> list:
+        self.refresh()
+        return list(self._entries)
+    
+    def get(self, worker_id: str) -> WorkerEntry:
+        entry = self._entries.get(worker_id)
+        if entry is None:
+            entry = WorkerEntry(worker_id, self.base_path)
+            self._entries[worker_id] = entry
+        return entry
+    
+    def close(self):
+        for entry in self._entries.values():
+            entry.close()
+
+# =============================================================================
+# NOTIFICACIONES DEL SISTEMA DE ARCHIVOS (modo --watch)
+# =============================================================================
+
+def worker_id_from_filename(name: str) -> str:
+    """Extrae el worker_id de errores_WORKER_XXX.csv / estados_WORKER_XXX.csv ('' si no aplica)"""
+    if not name.endswith(".csv"):
+        return ""
+    for prefix in WATCH_PREFIXES:
+        if name.startswith(prefix):
+            return name[len(prefix):-len(".csv")]
+    return ""
+
+
+class LogChangeWatcher:
+    """
+    Observa la carpeta de logs con notificaciones del SO (watchdog: ReadDirectoryChangesW
+    en Windows, inotify en Linux) y acumula los workers con archivos modificados.
+    El hilo principal espera en wait() sin consumir CPU hasta que llega un cambio
+    o vence el timeout (que actúa como temporizador de respaldo).
+    """
+    
+    def __init__(self, path: Path):
+        self.path = path
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._dirty = set()
+        self._observer = None
+    
+    def start(self) -> bool:
+        """Arranca el observer. Retorna False si watchdog no está disponible."""
+        try:
+            from watchdog.observers import Observer
+            from watchdog.events import FileSystemEventHandler
+        except ImportError:
+            print("[WARN] Modo watch requiere: pip install watchdog. Usando temporizador.")
+            return False
+        
+        watcher = self
+        
+        class _Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if event.is_directory:
+                    return
+                for p in (getattr(event, 'src_path', ''), getattr(event, 'dest_path', '')):
+                    worker_id = worker_id_from_filename(os.path.basename(p or ''))
+                    if worker_id:
+                        watcher.notify(worker_id)
+        
+        try:
+            self._observer = Observer()
+            self._observer.schedule(_Handler(), str(self.path), recursive=False)
+            self._observer.daemon = True
+            self._observer.start()
+        except Exception as e:
+            print(f"[WARN] No se pudo iniciar watch en {self.path}: {e}. Usando temporizador.")
+            self._observer = None
+            return False
+        return True
+    
+    def stop(self):
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join(timeout=5)
+            self._observer = None
+    
+    def notify(self, worker_id: str):
+        with self._lock:
+            self._dirty.add(worker_id)
+        self._event.set()
+    
+    def wait(self, timeout: float, debounce: float = WATCH_DEBOUNCE_SECONDS) -> set:
+        """
+        Bloquea hasta un cambio o hasta timeout. Tras el primer cambio espera
+        `debounce` segundos para agrupar la ráfaga. Retorna los workers modificados
+        (vacío si venció el temporizador).
+        """
+        if self._event.wait(timeout) and debounce > 0:
+            time.sleep(debounce)
+        with self._lock:
+            self._event.clear()
+            dirty, self._dirty = self._dirty, set()
+        return dirty
+
 # =============================================================================
 # DETECCIÓN DE ANOMALÍAS
 # =============================================================================
 
 class LogMonitor:
-    def __init__(self):
+    def __init__(self, base_path: Path = None, name: str = "", config_path: Path = None, chat_id: str = None):
+        self.base_path = Path(base_path) if base_path else LOGS_BASE_PATH
+        self.name = name                        # Nombre del despliegue ('' = monitor único)
+        self.chat_id = chat_id or TELEGRAM_CHAT_ID
         self.last_check_time = time.time()
         self.known_errors = set()  # Errores ya notificados
         self.last_activity = {}    # Última actividad por worker
-        self.last_file_sizes = {}  # Tamaños de archivo conocidos
+        self.registry = WorkerRegistry(self.base_path, config_path or CONFIG_PATH)  # Workers + lectores incrementales
+        self.master_tail = TailReader(self.base_path / "Historico_Master.csv")
+        self.anomalies = AnomalyDetector()  # Latencia/tasa de error por worker (memoria constante)
+        self.ts_distribute = TimestampColumn()  # distribute_time de Historico_Master
         self.startup_time = time.time()
         
         # Estadísticas para resumen diario
@@ -124,12 +365,7 @@ class LogMonitor:
     def check_errors_file(self, worker_id: str) -> list:
         """Revisa el archivo de errores de un worker"""
         alerts = []
-        filepath = LOGS_BASE_PATH / f"errores_WORKER_{worker_id}.csv"
-        
-        if not filepath.exists():
-            return alerts
-        
-        rows = read_csv_file(filepath)
+        rows = self.registry.get(worker_id).tail('errores').read_rows()
         
         for row in rows:
             if len(row) < 5:
@@ -160,19 +396,15 @@ class LogMonitor:
     def check_estados_file(self, worker_id: str) -> list:
         """Revisa el archivo de estados buscando errores críticos"""
         alerts = []
-        filepath = LOGS_BASE_PATH / f"estados_WORKER_{worker_id}.csv"
-        
-        if not filepath.exists():
-            return alerts
+        entry = self.registry.get(worker_id)
+        rows = entry.read_estados()
         
         # Actualizar última actividad
-        mod_time = get_file_mod_time(filepath)
+        mod_time = entry.tail('estados').mtime
         if mod_time > 0:
             self.last_activity[worker_id] = mod_time
         
-        rows = read_csv_file(filepath)
-        
-        # Buscar errores críticos recientes
+        # Buscar errores críticos en las filas nuevas
         for row in rows:
             if len(row) < 5:
                 continue
@@ -186,6 +418,15 @@ class LogMonitor:
             # Extraer tipo base del evento (MODIFY_0.00_4640.00 -> MODIFY)
             event_base = event_type.split("_")[0] if "_" in event_type else event_type
             
+            # Estadísticas de degradación (latencia y tasa de error) sobre estados finales
+            if estado.strip() == "2":
+                worker_ms = parse_epoch(row[3].strip())  # Solo ms epoch: una fecha MT4 va en hora servidor
+                for alert in self.anomalies.record_result(
+                    worker_id, f"{ticket.strip()}_{event_base}", not resultado.startswith("ERR_"), worker_ms
+                ):
+                    if time.time() - self.startup_time > 60:
+                        alerts.append(alert)
+            
             # Detectar errores según tipo de evento
             if resultado.startswith("ERR_"):
                 error_key = f"estado_{worker_id}_{ticket}_{event_type}_{resultado}"
@@ -248,61 +489,93 @@ class LogMonitor:
         """Verifica tickets del Master pendientes de procesar"""
         alerts = []
         
-        master_file = LOGS_BASE_PATH / "Historico_Master.csv"
-        if not master_file.exists():
-            return alerts
+        # Leer solo las distribuciones nuevas (distribute_time = último campo)
+        # para emparejarlas con los estados de los workers
+        rows = self.master_tail.read_rows()
+        for row in rows:
+            if len(row) < 5:
+                continue
+            distribute_ms = self.ts_distribute(row[-1])
+            if distribute_ms is None:
+                continue
+            self.anomalies.record_distribution(f"{row[1].strip()}_{row[0].strip().upper()}", distribute_ms)
         
-        # Por ahora solo verificar que el archivo existe y se actualiza
-        mod_time = get_file_mod_time(master_file)
+        mod_time = self.master_tail.mtime
         if mod_time > 0:
             self.last_activity['MASTER'] = mod_time
         
         return alerts
     
-    def discover_workers(self) -> list:
-        """Descubre los workers configurados mirando archivos existentes"""
-        workers = set()
-        
-        if not LOGS_BASE_PATH.exists():
-            return list(workers)
+    def check_pending_lag(self, worker_id: str) -> None:
+        """
+        Calcula comandos pendientes del worker (en cola sin estado=2) y su lag:
+        segundos desde la última escritura en estados mientras hay pendientes.
+        """
+        entry = self.registry.get(worker_id)
+        entry.read_cola()
+        pendientes = len(entry.pending)
         
-        for f in LOGS_BASE_PATH.glob("estados_WORKER_*.csv"):
-            worker_id = f.stem.replace("estados_WORKER_", "")
-            workers.add(worker_id)
+        lag = 0.0
+        if pendientes > 0:
+            last_write = entry.tail('estados').mtime or entry.tail('cola').mtime
+            if last_write > 0:
+                lag = max(0.0, time.time() - last_write)
         
-        for f in LOGS_BASE_PATH.glob("cola_WORKER_*.csv"):
-            worker_id = f.stem.replace("cola_WORKER_", "")
-            workers.add(worker_id)
-        
-        return list(workers)
+        M_PENDING.set(pendientes, despliegue=self.name, worker=worker_id)
+        M_LAG.set(lag, despliegue=self.name, worker=worker_id)
+    
+    def discover_workers(self) -> list:
+        """Workers del config y de archivos existentes (cacheado por mtime en el registro)"""
+        return self.registry.worker_ids()
     
-    def run_check(self) -> list:
-        """Ejecuta una verificación completa"""
+    def run_check(self, only_workers: set = None) -> list:
+        """Ejecuta una verificación completa (o solo de only_workers, en modo watch)"""
         all_alerts = []
+        check_start = time.perf_counter()
         
         workers = self.discover_workers()
+        if only_workers:
+            workers = [w for w in workers if w in only_workers] + [w for w in only_workers if w not in workers]
+        
+        # Master primero: las distribuciones nuevas deben estar antes de leer estados
+        all_alerts.extend(self.check_pending_tickets())
         
         for worker_id in workers:
             all_alerts.extend(self.check_errors_file(worker_id))
             all_alerts.extend(self.check_estados_file(worker_id))
+            if METRICS_PORT:
+                self.check_pending_lag(worker_id)
         
-        all_alerts.extend(self.check_pending_tickets())
-        
+        M_CHECK.observe(time.perf_counter() - check_start, despliegue=self.name)
         return all_alerts
     
     def format_alert(self, alert: dict) -> str:
         """Formatea una alerta para Telegram"""
         return (
             f"{alert['severity']} {alert['type']}\n"
-            f"Worker: {alert['worker']}\n"
+            + (f"Despliegue: {self.name}\n" if self.name else "")
+            + f"Worker: {alert['worker']}\n"
             f"{alert['message']}"
         )
     
+    def notify(self, message: str) -> bool:
+        """Envía un mensaje al chat de este despliegue"""
+        return send_telegram(message, chat_id=self.chat_id)
+    
+    def title(self, text: str) -> str:
+        """Cabecera de reporte con el nombre del despliegue si lo hay"""
+        return f"{text} [{self.name}]" if self.name else text
+    
     def update_stats(self, alert: dict):
         """Actualiza las estadísticas con una nueva alerta"""
-        self.stats['errors_today'] += 1
-        
         alert_type = alert.get('type', '')
+        M_ALERTS.inc(despliegue=self.name, worker=alert.get('worker', '?'), tipo=alert_type or '?')
+        
+        # Las alertas de degradación no son errores de ejecución
+        if alert_type in ('LATENCY_DEGRADED', 'ERROR_RATE_HIGH'):
+            return
+        
+        self.stats['errors_today'] += 1
         if 'OPEN' in alert_type:
             self.stats['open_failed'] += 1
         elif 'MODIFY' in alert_type:
@@ -353,11 +626,12 @@ class LogMonitor:
             'trades_lost': 0,
         }
         
-        filepath = LOGS_BASE_PATH / f"historico_WORKER_{worker_id}.csv"
+        filepath = self.base_path / f"historico_WORKER_{worker_id}.csv"
         if not filepath.exists():
             return stats
         
-        today = datetime.now().date()
+        now = datetime.now()
+        today = (now.year, now.month, now.day)
         rows = read_csv_file(filepath)
         
         for row in rows:
@@ -365,10 +639,8 @@ class LogMonitor:
                 continue
             
             # Formato: fecha;ticket;tipo;intentos;timestamp;resultado;profit
-            try:
-                fecha_str = row[0].split()[0]  # "2026.01.17" -> solo fecha
-                fecha = datetime.strptime(fecha_str, "%Y.%m.%d").date()
-            except:
+            fecha = parse_mt4_date(row[0])  # "2026.01.17 10:00:00" -> (2026, 1, 17)
+            if fecha is None:
                 continue
             
             # Solo contar operaciones de hoy
@@ -420,7 +692,7 @@ class LogMonitor:
             'close_err': 0,
         }
         
-        filepath = LOGS_BASE_PATH / f"estados_WORKER_{worker_id}.csv"
+        filepath = self.base_path / f"estados_WORKER_{worker_id}.csv"
         if not filepath.exists():
             return stats
         
@@ -481,7 +753,7 @@ class LogMonitor:
         
         # Construir mensaje
         lines = [
-            f"📊 OmegaInversiones - Reporte Horario",
+            self.title("📊 OmegaInversiones - Reporte Horario"),
             f"━━━━━━━━━━━━━━━━━━━━━",
             f"🕐 {now.strftime('%d/%m/%Y %H:%M')}",
             ""
@@ -532,7 +804,7 @@ class LogMonitor:
         lines.append(f"💵 Total día: ${total_gained:.2f} - ${total_lost:.2f} = {total_sign}${total_balance:.2f}")
         
         message = "\n".join(lines)
-        send_telegram(message)
+        self.notify(message)
         
         # Marcar como enviado
         self.last_hourly_report = f"{now.date()}_{now.hour}"
@@ -562,7 +834,7 @@ class LogMonitor:
         total_ops = self.stats['open_ok'] + self.stats['modify_ok'] + self.stats['close_ok']
         
         message = (
-            f"📊 OmegaInversiones - Resumen Diario\n"
+            f"{self.title('📊 OmegaInversiones - Resumen Diario')}\n"
             f"━━━━━━━━━━━━━━━━━━━━━\n"
             f"{status_icon} Estado: {status_text}\n"
             f"⏱️ Uptime: {uptime_hours}h {uptime_mins}m\n"
@@ -583,7 +855,7 @@ class LogMonitor:
             f"🕐 {datetime.now().strftime('%d/%m/%Y %H:%M')}"
         )
         
-        send_telegram(message)
+        self.notify(message)
         
         # Marcar como enviado y resetear stats
         self.last_summary_date = datetime.now().date()
@@ -591,54 +863,173 @@ class LogMonitor:
         
         print(f"[{datetime.now().strftime('%H:%M:%S')}] Resumen diario enviado")
     
-    def run(self):
-        """Loop principal del monitor"""
-        print(f"[{datetime.now()}] OmegaInversiones LogMonitor iniciado")
-        print(f"[INFO] Monitoreando: {LOGS_BASE_PATH}")
-        print(f"[INFO] Intervalo: {MONITOR_INTERVAL}s")
-        print(f"[INFO] Telegram: {TELEGRAM_CHAT_ID}")
+    def start_watcher(self, watch: bool):
+        """Crea el LogChangeWatcher si se pidió modo watch y está disponible"""
+        if not watch:
+            return None
+        watcher = LogChangeWatcher(self.base_path)
+        return watcher if watcher.start() else None
+    
+    def announce_start(self, watcher):
+        """Log de arranque y notificación de inicio a Telegram"""
+        prefix = f"[{self.name}] " if self.name else ""
+        print(f"[{datetime.now()}] {prefix}OmegaInversiones LogMonitor iniciado")
+        print(f"[INFO] {prefix}Monitoreando: {self.base_path}")
+        print(f"[INFO] {prefix}Intervalo: {MONITOR_INTERVAL}s")
+        print(f"[INFO] {prefix}Modo: {'watch (notificaciones SO)' if watcher else 'temporizador'}")
+        print(f"[INFO] {prefix}Telegram: {self.chat_id}")
         print("-" * 50)
         
-        # Notificar inicio
         workers = self.discover_workers()
-        send_telegram(
-            f"🟢 **OmegaInversiones Monitor iniciado**\n"
+        self.notify(
+            f"🟢 **{self.title('OmegaInversiones Monitor iniciado')}**\n"
             f"Workers detectados: {len(workers)}\n"
             f"IDs: {', '.join(workers) if workers else 'Ninguno'}\n"
             f"Intervalo: {MONITOR_INTERVAL}s"
         )
+    
+    def tick(self, changed_workers: set = None):
+        """Una iteración: reportes programados + verificación + envío de alertas"""
+        # Verificar si es hora del resumen diario (8:00)
+        if self.should_send_summary():
+            self.send_daily_summary()
+        
+        # Verificar si es hora del reporte horario (8:00-20:00)
+        if self.should_send_hourly_report():
+            self.send_hourly_report()
+        
+        # Verificar errores (en modo watch, solo los workers que cambiaron)
+        alerts = self.run_check(changed_workers)
+        
+        for alert in alerts:
+            msg = self.format_alert(alert)
+            print(f"[ALERT] {msg}")
+            self.notify(msg)
+            self.update_stats(alert)
         
+        if not alerts and not changed_workers:
+            prefix = f" [{self.name}]" if self.name else ""
+            print(f"[{datetime.now().strftime('%H:%M:%S')}]{prefix} OK - Sin alertas")
+    
+    def run(self, watch: bool = False):
+        """
+        Loop principal del monitor.
+        Con watch=True reacciona a escrituras en errores/estados (con debounce) y
+        mantiene MONITOR_INTERVAL como temporizador de respaldo.
+        """
+        watcher = self.start_watcher(watch)
+        self.announce_start(watcher)
+        start_metrics_server(METRICS_PORT)
+        
+        changed_workers = set()
         while True:
             try:
-                # Verificar si es hora del resumen diario (8:00)
-                if self.should_send_summary():
-                    self.send_daily_summary()
-                
-                # Verificar si es hora del reporte horario (8:00-20:00)
-                if self.should_send_hourly_report():
-                    self.send_hourly_report()
-                
-                # Verificar errores
-                alerts = self.run_check()
+                self.tick(changed_workers)
                 
-                for alert in alerts:
-                    msg = self.format_alert(alert)
-                    print(f"[ALERT] {msg}")
-                    send_telegram(msg)
-                    self.update_stats(alert)
-                
-                if not alerts:
-                    print(f"[{datetime.now().strftime('%H:%M:%S')}] OK - Sin alertas")
-                
-                time.sleep(MONITOR_INTERVAL)
+                if watcher:
+                    changed_workers = watcher.wait(MONITOR_INTERVAL)
+                else:
+                    time.sleep(MONITOR_INTERVAL)
                 
             except KeyboardInterrupt:
                 print("\n[INFO] Monitor detenido por usuario")
-                send_telegram("🔴 OmegaInversiones Monitor detenido")
+                self.notify("🔴 OmegaInversiones Monitor detenido")
                 break
             except Exception as e:
                 print(f"[ERROR] {e}")
+                changed_workers = set()
                 time.sleep(MONITOR_INTERVAL)
+        
+        if watcher:
+            watcher.stop()
+        self.registry.close()
+        self.master_tail.close()
+    
+    async def run_async(self, watch: bool = False):
+        """
+        Versión asyncio de run() para monitorizar varios despliegues en un proceso.
+        La E/S de archivos y Telegram se ejecuta en hilos (asyncio.to_thread) para
+        que un despliegue lento no retrase la verificación de los demás.
+        """
+        watcher = self.start_watcher(watch)
+        await asyncio.to_thread(self.announce_start, watcher)
+        
+        changed_workers = set()
+        try:
+            while True:
+                started = time.monotonic()
+                try:
+                    await asyncio.to_thread(self.tick, changed_workers)
+                except Exception as e:
+                    print(f"[ERROR] [{self.name}] {e}")
+                
+                elapsed = time.monotonic() - started
+                if elapsed > MONITOR_INTERVAL:
+                    print(f"[WARN] [{self.name}] Verificación tardó {elapsed:.1f}s (> {MONITOR_INTERVAL}s)")
+                
+                if watcher:
+                    changed_workers = await asyncio.to_thread(watcher.wait, MONITOR_INTERVAL)
+                else:
+                    changed_workers = set()
+                    await asyncio.sleep(max(0.0, MONITOR_INTERVAL - elapsed))
+        finally:
+            if watcher:
+                watcher.stop()
+            self.registry.close()
+            self.master_tail.close()
+
+# =============================================================================
+# MULTI-DESPLIEGUE
+# =============================================================================
+
+def load_monitor_targets(targets_path: Path = None) -> list:
+    """
+    Lee monitor_targets.txt y retorna lista de LogMonitor (uno por despliegue).
+    Formato: target=<nombre>|<carpeta_logs>|<distribuidor_config>|<chat_id opcional>
+    Líneas vacías o que empiezan por # se ignoran. Si no hay targets retorna [].
+    """
+    targets_path = targets_path or MONITOR_TARGETS_FILE
+    monitors = []
+    if not targets_path.exists():
+        return monitors
+    
+    try:
+        for raw in targets_path.read_text(encoding="utf-8").splitlines():
+            line = raw.strip()
+            if not line or line.startswith("#") or not line.startswith("target="):
+                continue
+            parts = [p.strip() for p in line.split("=", 1)[1].split("|")]
+            if len(parts) < 2 or not parts[0] or not parts[1]:
+                print(f"[WARN] Target inválido en {targets_path}: {line}")
+                continue
+            name, logs_dir = parts[0], Path(parts[1].replace("\\", os.sep))
+            if not logs_dir.is_absolute():
+                logs_dir = COMMON_FILES_PATH / logs_dir
+            config_path = Path(parts[2]) if len(parts) > 2 and parts[2] else CONFIG_PATH
+            if not config_path.is_absolute():
+                config_path = Path(__file__).parent / config_path
+            chat_id = parts[3] if len(parts) > 3 and parts[3] else None
+            monitors.append(LogMonitor(logs_dir, name=name, config_path=config_path, chat_id=chat_id))
+    except Exception as e:
+        print(f"[ERROR] Leyendo {targets_path}: {e}")
+    
+    return monitors
+
+
+def run_all(monitors: list, watch: bool = False):
+    """Ejecuta todos los despliegues en un único bucle asyncio"""
+    print(f"[INFO] Multi-despliegue: {', '.join(m.name for m in monitors)}")
+    start_metrics_server(METRICS_PORT)
+    
+    async def _main():
+        await asyncio.gather(*(m.run_async(watch) for m in monitors))
+    
+    try:
+        asyncio.run(_main())
+    except KeyboardInterrupt:
+        print("\n[INFO] Monitor detenido por usuario")
+        for m in monitors:
+            m.notify(m.title("🔴 OmegaInversiones Monitor detenido"))
 
 # =============================================================================
 # MAIN
@@ -651,32 +1042,40 @@ def main():
         print("OK" if success else "FALLO")
         return
     
+    monitors = load_monitor_targets() or [LogMonitor()]
+    
     if "--summary" in sys.argv:
         print("Enviando resumen de prueba...")
-        monitor = LogMonitor()
-        monitor.send_daily_summary()
+        for monitor in monitors:
+            monitor.send_daily_summary()
         print("OK")
         return
     
     if "--hourly" in sys.argv:
         print("Enviando reporte horario de prueba...")
-        monitor = LogMonitor()
-        monitor.send_hourly_report()
+        for monitor in monitors:
+            monitor.send_hourly_report()
         print("OK")
         return
     
     if "--status" in sys.argv:
-        print(f"Ruta de logs: {LOGS_BASE_PATH}")
-        print(f"Existe: {LOGS_BASE_PATH.exists()}")
-        if LOGS_BASE_PATH.exists():
-            files = list(LOGS_BASE_PATH.glob("*.csv"))
-            print(f"Archivos CSV: {len(files)}")
-            for f in files[:10]:
-                print(f"  - {f.name}")
+        for monitor in monitors:
+            if monitor.name:
+                print(f"[{monitor.name}]")
+            print(f"Ruta de logs: {monitor.base_path}")
+            print(f"Existe: {monitor.base_path.exists()}")
+            if monitor.base_path.exists():
+                files = list(monitor.base_path.glob("*.csv"))
+                print(f"Archivos CSV: {len(files)}")
+                for f in files[:10]:
+                    print(f"  - {f.name}")
         return
     
-    monitor = LogMonitor()
-    monitor.run()
+    watch = "--watch" in sys.argv
+    if len(monitors) > 1 or monitors[0].name:
+        run_all(monitors, watch)
+    else:
+        monitors[0].run(watch)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,250 @@
+"""
+anomalias.py (Produccion V2)
+----------------------------
+Detección de degradación en streaming para LogMonitorPV2, con memoria constante por worker.
+
+- Latencia distribute -> worker: sketch de cuantiles con buckets logarítmicos (tipo DDSketch,
+  error relativo acotado) con decaimiento exponencial como línea base, más una ventana fija
+  con las últimas N latencias. Se alerta cuando la fracción de la ventana por encima del p90
+  de la base es significativamente mayor que el 10% esperado (test binomial, z-score) y
+  además la mediana reciente supera el p75 de la base (desplazamiento, no picos aislados).
+- Tasa de error: EWMA corta y larga del indicador de error. La larga es la tasa base; la
+  significancia se evalúa con un test binomial de los errores en los últimos ERROR_WINDOW
+  resultados frente a esa tasa base (con exceso mínimo absoluto MIN_ERROR_EXCESS).
+
+Las bases se alimentan con los valores que salen de la ventana reciente, de modo que un
+cambio no contamina su propia referencia hasta haber salido de la ventana.
+
+Cada alerta tiene enfriamiento y se rearma cuando la métrica vuelve a la normalidad.
+"""
+
+from __future__ import annotations
+
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional
+
+# Parámetros por defecto
+SKETCH_RELATIVE_ACCURACY = 0.02     # 2% de error relativo en cuantiles
+SKETCH_MAX_BINS = 512               # Tope de buckets (se colapsan los más bajos)
+BASELINE_HALF_LIFE = 500            # Observaciones para que un dato pese la mitad en la base
+RECENT_WINDOW = 50                  # Latencias recientes comparadas contra la base
+MIN_BASELINE_SAMPLES = 300          # No alertar hasta tener base suficiente
+Z_THRESHOLD = 4.0                   # Umbral de significancia (se evalúa en cada evento)
+REARM_Z = 1.0                       # Por debajo de este z se rearma la alerta
+ERROR_ALPHA_SHORT = 0.1             # EWMA corta (~20 eventos)
+ERROR_ALPHA_LONG = 0.005            # EWMA larga (~400 eventos)
+ERROR_WINDOW = 100                  # Resultados recientes para el test de tasa de error
+ERROR_RATE_FLOOR = 0.02             # Tasa mínima supuesta para la varianza (evita z infinito)
+MIN_ERROR_EXCESS = 0.05             # Exceso absoluto mínimo sobre la base para alertar
+MIN_ERROR_EVENTS = 200              # Eventos mínimos antes de evaluar tasa de error
+ALERT_COOLDOWN_SECONDS = 1800       # Como mucho una alerta de cada tipo por worker cada 30 min
+MAX_INFLIGHT = 10000                # Distribuciones pendientes de emparejar (memoria acotada)
+
+
+class QuantileSketch:
+    """
+    Sketch de cuantiles con buckets logarítmicos: el bucket i cubre (gamma^(i-1), gamma^i].
+    Memoria O(max_bins). Admite decaimiento exponencial en O(1) por observación escalando
+    el peso de los datos nuevos en lugar de multiplicar todos los buckets.
+    """
+
+    def __init__(self, relative_accuracy: float = SKETCH_RELATIVE_ACCURACY,
+                 max_bins: int = SKETCH_MAX_BINS, half_life: Optional[float] = None):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.max_bins = max_bins
+        self.bins: Dict[int, float] = {}
+        self.zero_count = 0.0
+        self.samples = 0
+        self._weight = 1.0
+        self._growth = 2 ** (1.0 / half_life) if half_life else 1.0
+
+    def add(self, value: float) -> None:
+        self.samples += 1
+        w = self._weight
+        if value <= 0:
+            self.zero_count += w
+        else:
+            idx = int(math.ceil(math.log(value) / self._log_gamma))
+            self.bins[idx] = self.bins.get(idx, 0.0) + w
+            if len(self.bins) > self.max_bins:
+                self._collapse()
+        if self._growth != 1.0:
+            self._weight *= self._growth
+            if self._weight > 1e12:
+                self._rescale()
+
+    def _collapse(self) -> None:
+        keys = sorted(self.bins)
+        lowest, nxt = keys[0], keys[1]
+        self.bins[nxt] += self.bins.pop(lowest)
+
+    def _rescale(self) -> None:
+        factor = 1.0 / self._weight
+        self.bins = {k: v * factor for k, v in self.bins.items() if v * factor > 1e-12}
+        self.zero_count *= factor
+        self._weight = 1.0
+
+    def total(self) -> float:
+        return self.zero_count + sum(self.bins.values())
+
+    def quantile(self, q: float) -> Optional[float]:
+        total = self.total()
+        if total <= 0:
+            return None
+        rank = q * total
+        acc = self.zero_count
+        if acc >= rank and self.zero_count > 0:
+            return 0.0
+        for idx in sorted(self.bins):
+            acc += self.bins[idx]
+            if acc >= rank:
+                # Punto medio (en escala relativa) del bucket
+                return 2 * self.gamma ** idx / (1 + self.gamma)
+        return 2 * self.gamma ** max(self.bins) / (1 + self.gamma)
+
+
+class WorkerStats:
+    """Estadísticas en streaming de un worker"""
+
+    def __init__(self):
+        self.baseline = QuantileSketch(half_life=BASELINE_HALF_LIFE)
+        self.recent = deque(maxlen=RECENT_WINDOW)
+        self.recent_errors = deque(maxlen=ERROR_WINDOW)
+        self.err_short = 0.0
+        self.err_long = 0.0
+        self.events = 0
+        self.armed = {"latency": True, "errors": True}
+        self.last_alert = {"latency": 0.0, "errors": 0.0}
+
+    def latency_z(self) -> Optional[tuple]:
+        """(z, p90_base_ms, p50_reciente_ms, p75_base_ms) o None si no hay datos suficientes"""
+        if self.baseline.samples < MIN_BASELINE_SAMPLES or len(self.recent) < RECENT_WINDOW:
+            return None
+        p90 = self.baseline.quantile(0.9)
+        if p90 is None:
+            return None
+        n = len(self.recent)
+        above = sum(1 for v in self.recent if v > p90)
+        z = (above - 0.1 * n) / math.sqrt(n * 0.1 * 0.9)
+        p50_recent = sorted(self.recent)[n // 2]
+        return z, p90, p50_recent, self.baseline.quantile(0.75)
+
+    def error_z(self) -> Optional[float]:
+        """z del número de errores recientes frente a la tasa base (EWMA larga)"""
+        if self.events < MIN_ERROR_EVENTS:
+            return None
+        n = len(self.recent_errors)
+        k = sum(self.recent_errors)
+        if k / n - self.err_long < MIN_ERROR_EXCESS:
+            return 0.0
+        p = max(self.err_long, ERROR_RATE_FLOOR)
+        return (k - n * p) / math.sqrt(n * p * (1 - p))
+
+
+class AnomalyDetector:
+    """
+    Empareja distribuciones (Historico_Master) con completados (estados_WORKER) y
+    mantiene estadísticas por worker. record_* devuelven alertas en el formato del monitor.
+    """
+
+    def __init__(self):
+        self.workers: Dict[str, WorkerStats] = {}
+        self.inflight: "OrderedDict[str, int]" = OrderedDict()  # ticket_EVENT -> distribute_ms
+
+    def _stats(self, worker_id: str) -> WorkerStats:
+        stats = self.workers.get(worker_id)
+        if stats is None:
+            stats = WorkerStats()
+            self.workers[worker_id] = stats
+        return stats
+
+    def record_distribution(self, key: str, distribute_ms: int) -> None:
+        """Registra el distribute_time (ms epoch) de un ticket_EVENT"""
+        self.inflight[key] = distribute_ms
+        self.inflight.move_to_end(key)
+        while len(self.inflight) > MAX_INFLIGHT:
+            self.inflight.popitem(last=False)
+
+    def record_result(self, worker_id: str, key: str, ok: bool, worker_ms: Optional[int],
+                      now: Optional[float] = None) -> List[dict]:
+        """Registra un resultado final de un worker y retorna alertas nuevas"""
+        stats = self._stats(worker_id)
+        now = now if now is not None else time.time()
+        alerts: List[dict] = []
+
+        x = 0.0 if ok else 1.0
+        stats.events += 1
+        if stats.events == 1:
+            stats.err_short = x
+        else:
+            stats.err_short += ERROR_ALPHA_SHORT * (x - stats.err_short)
+        if len(stats.recent_errors) == ERROR_WINDOW:
+            stats.err_long += ERROR_ALPHA_LONG * (stats.recent_errors[0] - stats.err_long)
+        stats.recent_errors.append(x)
+        if stats.events == ERROR_WINDOW:
+            # Base inicial = tasa de la primera ventana completa: arrancar con el primer resultado
+            # (1.0 si era un error) taparía ERROR_RATE_HIGH durante cientos de eventos
+            stats.err_long = sum(stats.recent_errors) / ERROR_WINDOW
+
+        # get(), no pop(): la misma distribución la completan todos los workers; la entrada sale
+        # por el límite MAX_INFLIGHT del OrderedDict
+        distribute_ms = self.inflight.get(key)
+        if ok and worker_ms is not None and distribute_ms is not None:
+            latency = worker_ms - distribute_ms
+            if latency >= 0:
+                if len(stats.recent) == RECENT_WINDOW:
+                    stats.baseline.add(stats.recent[0])
+                stats.recent.append(latency)
+
+        lat = stats.latency_z()
+        if lat is not None:
+            z, p90, p50_recent, p75 = lat
+            if p50_recent <= p75:
+                z = min(z, Z_THRESHOLD - 0.01)  # Sin desplazamiento de la mediana no se alerta
+            if self._should_fire(stats, "latency", z, now):
+                alerts.append({
+                    'severity': '🟠',
+                    'type': 'LATENCY_DEGRADED',
+                    'worker': worker_id,
+                    'message': (f"Latencia distribute→worker degradada (z={z:.1f})\n"
+                                f"p50 reciente={p50_recent:.0f}ms vs p90 base={p90:.0f}ms"),
+                })
+
+        z_err = stats.error_z()
+        if z_err is not None and self._should_fire(stats, "errors", z_err, now):
+            alerts.append({
+                'severity': '🟠',
+                'type': 'ERROR_RATE_HIGH',
+                'worker': worker_id,
+                'message': (f"Tasa de error en aumento (z={z_err:.1f})\n"
+                            f"Reciente={stats.err_short:.1%} vs base={stats.err_long:.1%}"),
+            })
+        return alerts
+
+    def _should_fire(self, stats: WorkerStats, kind: str, z: float, now: float) -> bool:
+        if z < REARM_Z:
+            stats.armed[kind] = True
+            return False
+        if z < Z_THRESHOLD or not stats.armed[kind]:
+            return False
+        if now - stats.last_alert[kind] < ALERT_COOLDOWN_SECONDS:
+            return False
+        stats.armed[kind] = False
+        stats.last_alert[kind] = now
+        return True
+
+    def summary(self, worker_id: str) -> Optional[dict]:
+        """p50/p90/p99 de la base y tasas de error de un worker (para reportes)"""
+        stats = self.workers.get(worker_id)
+        if stats is None:
+            return None
+        return {
+            'p50_ms': stats.baseline.quantile(0.5),
+            'p90_ms': stats.baseline.quantile(0.9),
+            'p99_ms': stats.baseline.quantile(0.99),
+            'err_short': stats.err_short,
+            'err_long': stats.err_long,
+        }
@@ -0,0 +1,80 @@
+"""
+bench_trazabilidad.py (Produccion V2)
+-------------------------------------
+Benchmark de trazabilidad: ruta por fila (build_traceability_row) vs ruta columnar NumPy
+(build_traceability_rows_columnar) sobre eventos sintéticos en memoria.
+
+Uso:
+    python bench_trazabilidad.py              # 1.000.000 eventos
+    python bench_trazabilidad.py 200000       # N eventos
+
+Los eventos imitan Historico_Master.csv + estados_WORKER: event_time en hora servidor (+3h),
+export/read/distribute en ms epoch, y worker_timestamp en ms epoch (80%), fecha MT4 (15%)
+o ausente (5%). Se mide la ruta que ejecuta generate_traceability: con ClockOffsetEstimator
+(mediana móvil de desfases, relojes.py), un estimador nuevo por ruta. Verifica que ambas rutas
+producen exactamente el mismo texto.
+"""
+
+import random
+import sys
+import time
+from datetime import datetime
+
+from relojes import ClockOffsetEstimator
+from trazabilidad import build_traceability_row, build_traceability_rows_columnar
+
+
+def synthetic_events(n: int, seed: int = 42):
+    """Genera n eventos (keys, master_infos, worker_timestamps)."""
+    rnd = random.Random(seed)
+    base = 1767600000000
+    keys, infos, workers = [], [], []
+    for i in range(n):
+        t = base + i * 250
+        event = t + 3 * 3_600_000 + rnd.randint(-900, 0)
+        read = t + rnd.randint(0, 400)
+        distribute = read + rnd.randint(0, 60)
+        keys.append(f"{100000 + i}_{'OPEN' if i % 2 == 0 else 'CLOSE'}")
+        infos.append({
+            "event_time": str(event),
+            "export_time": str(t),
+            "read_time": str(read),
+            "distribute_time": str(distribute),
+        })
+        r = rnd.random()
+        worker_ms = distribute + rnd.randint(50, 4000)
+        if r < 0.80:
+            workers.append(str(worker_ms))
+        elif r < 0.95:
+            workers.append(datetime.fromtimestamp((worker_ms + 3 * 3_600_000) / 1000).strftime("%Y.%m.%d %H:%M:%S.%f")[:-3])
+        else:
+            workers.append("")
+    return keys, infos, workers
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    print(f"[BENCH] Generando {n:,} eventos sintéticos...")
+    keys, infos, workers = synthetic_events(n)
+
+    start = time.perf_counter()
+    clocks = ClockOffsetEstimator()
+    rows_scalar = "".join(build_traceability_row(k, m, w, clocks) for k, m, w in zip(keys, infos, workers))
+    t_scalar = time.perf_counter() - start
+    print(f"[BENCH] Por fila:   {t_scalar:8.2f}s  ({n / t_scalar:,.0f} eventos/s)")
+
+    start = time.perf_counter()
+    rows_columnar = build_traceability_rows_columnar(keys, infos, workers, ClockOffsetEstimator())
+    t_columnar = time.perf_counter() - start
+    print(f"[BENCH] Columnar:   {t_columnar:8.2f}s  ({n / t_columnar:,.0f} eventos/s)")
+
+    print(f"[BENCH] Speedup:    {t_scalar / t_columnar:8.1f}x")
+    if rows_scalar == rows_columnar:
+        print("[BENCH] Resultado idéntico en ambas rutas")
+    else:
+        print("[BENCH][ERROR] Las rutas producen resultados distintos")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
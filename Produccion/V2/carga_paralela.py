@@ -0,0 +1,65 @@
+"""
+carga_paralela.py (Produccion V2)
+---------------------------------
+Carga de varios archivos de log en paralelo con un pool de procesos (un archivo por tarea).
+
+Uso:
+    from carga_paralela import load_files
+    resultados = load_files(leer_archivo, rutas)   # misma longitud y orden que rutas
+
+- leer_archivo debe ser una función de nivel de módulo (se envía por pickle a los procesos)
+  y conviene que devuelva estructuras compactas (dict de str, no objetos grandes).
+- Con pocos archivos o pocos datos se lee en el proceso actual: arrancar procesos en Windows
+  cuesta más que leer un par de archivos pequeños.
+- Si el pool no se puede usar (entorno sin multiprocessing, error en un proceso hijo) se avisa
+  y se cae a lectura secuencial.
+"""
+
+from __future__ import annotations
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, List, Optional, Sequence, TypeVar
+
+T = TypeVar("T")
+
+PARALLEL_MIN_FILES = 2                 # Menos archivos: lectura secuencial
+PARALLEL_MIN_BYTES = 4 * 1024 * 1024   # Menos datos en total: lectura secuencial
+MAX_PROCESSES_ENV = "LOG_LOADER_PROCESSES"  # Tope de procesos (1 = desactivar)
+
+
+def _total_size(paths: Sequence[Path]) -> int:
+    total = 0
+    for p in paths:
+        try:
+            total += os.path.getsize(p)
+        except OSError:
+            pass
+    return total
+
+
+def load_files(loader: Callable[[Path], T], paths: Sequence[Path], max_processes: Optional[int] = None) -> List[T]:
+    """Aplica loader a cada ruta, en paralelo si compensa. Retorna los resultados en el orden de paths."""
+    paths = list(paths)
+    if max_processes is None:
+        env = os.environ.get(MAX_PROCESSES_ENV, "").strip()
+        max_processes = int(env) if env.isdigit() else (os.cpu_count() or 1)
+    processes = min(max_processes, len(paths))
+
+    if processes < 2 or len(paths) < PARALLEL_MIN_FILES or _total_size(paths) < PARALLEL_MIN_BYTES:
+        return [loader(p) for p in paths]
+
+    try:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            # Los más grandes primero para repartir mejor la carga; se reordena al final
+            order = sorted(range(len(paths)), key=lambda i: -_total_size([paths[i]]))
+            results = list(pool.map(loader, [paths[i] for i in order]))
+    except Exception as exc:
+        print(f"[WARN] Carga en paralelo no disponible ({exc}); leyendo secuencialmente")
+        return [loader(p) for p in paths]
+
+    out: List[T] = [None] * len(paths)  # type: ignore[list-item]
+    for i, result in zip(order, results):
+        out[i] = result
+    return out
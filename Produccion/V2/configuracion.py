@@ -0,0 +1,83 @@
+"""
+configuracion.py (Produccion V2)
+--------------------------------
+Lectura de distribuidor_config.txt, compartida por DistribuidorPV2, LogMonitorPV2 y el
+reconciliador. Sin efectos al importar (no registra métricas ni arranca nada), para que los
+procesos que solo leen la configuración no arrastren el módulo del Distribuidor.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import List
+
+CONFIG_FILENAME = "distribuidor_config.txt"
+
+
+def load_file_config(cfg_path: Path) -> dict:
+    """
+    Lee un fichero plano key=value (una clave por línea).
+    Formato esperado:
+      common_files_dir=C:\\Users\\...\\Common\\Files
+      spool_folder=PROD\\Phoenix\\V2\\Spool
+      worker_ids=01,02,03
+      worker_id=71617942|xaudusd-std=XAUUSD|eurusd-std=EURUSD
+      poll_seconds=1.0
+      metrics_port=9108
+    Líneas vacías o que empiezan por # se ignoran.
+    """
+    cfg: dict = {}
+    workers: List[str] = []
+    symbol_mappings: dict[str, dict[str, str]] = {}
+    if not cfg_path.exists():
+        cfg["worker_ids_list"] = workers
+        cfg["symbol_mappings"] = symbol_mappings
+        return cfg
+    try:
+        for raw in cfg_path.read_text(encoding="utf-8").splitlines():
+            line = raw.strip()
+            if not line or line.startswith("#"):
+                continue
+            if "=" not in line:
+                continue
+            key, value = line.split("=", 1)
+            key = key.strip()
+            value = value.strip()
+            if not key:
+                continue
+            if key == "worker_id":
+                # Formato: worker_id=<id>|<symbol_origen>=<symbol_destino>|...
+                if "|" in value:
+                    parts = value.split("|", 1)
+                    worker_id = parts[0].strip()
+                    workers.append(worker_id)
+                    
+                    if len(parts) > 1 and parts[1].strip():
+                        mappings_str = parts[1].strip()
+                        worker_mappings: dict[str, str] = {}
+                        for mapping_pair in mappings_str.split("|"):
+                            mapping_pair = mapping_pair.strip()
+                            if "=" in mapping_pair:
+                                symbol_orig, symbol_dest = mapping_pair.split("=", 1)
+                                symbol_orig = symbol_orig.strip().upper()
+                                symbol_dest = symbol_dest.strip().upper()
+                                if symbol_orig and symbol_dest:
+                                    worker_mappings[symbol_orig] = symbol_dest
+                        if worker_mappings:
+                            symbol_mappings[worker_id] = worker_mappings
+                else:
+                    workers.append(value)
+            else:
+                cfg[key] = value
+    except Exception as exc:
+        print(f"[WARN] No se pudo leer {cfg_path}: {exc}")
+    cfg["worker_ids_list"] = workers
+    cfg["symbol_mappings"] = symbol_mappings
+    
+    # Debug: mostrar qué se encontró
+    if workers:
+        print(f"[DEBUG] load_file_config: Encontrados {len(workers)} workers: {workers}")
+    else:
+        print(f"[DEBUG] load_file_config: No se encontraron workers en config")
+    
+    return cfg
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+lectura_incremental.py (Produccion V2)
+--------------------------------------
+Lectura incremental de los CSV append-only de Phoenix (Historico_Master, historico_clonacion,
+cola/estados/errores de cada worker). Usado por LogMonitorPV2 y reconciliador.
+"""
+
+import os
+from pathlib import Path
+
+
+class TailReader:
+    """
+    Lee solo las líneas nuevas de un CSV append-only (separador ';').
+    Guarda offset y fragmento de línea incompleta. Si el archivo se trunca o se
+    reemplaza (purga nocturna), vuelve a leer desde el principio.
+    
+    En Windows el handle se cierra tras cada lectura: un handle abierto impediría
+    que la purga del distribuidor renombre cola/estados a .lck.
+    """
+    
+    def __init__(self, path: Path, keep_open: bool = os.name != "nt"):
+        self.path = path
+        self.keep_open = keep_open
+        self.offset = 0
+        self.mtime = 0.0
+        self.was_reset = False
+        self._ino = None
+        self._partial = b""
+        self._fh = None
+    
+    def close(self):
+        if self._fh is not None:
+            try:
+                self._fh.close()
+            except Exception:
+                pass
+            self._fh = None
+    
+    def reset(self):
+        self.close()
+        self.offset = 0
+        self._ino = None
+        self._partial = b""
+        self.was_reset = True
+    
+    def seek_to_end(self) -> None:
+        """Salta al final actual del archivo (solo se leerán líneas escritas a partir de ahora)"""
+        self.reset()
+        self.was_reset = False
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return
+        self.offset = st.st_size
+        self.mtime = st.st_mtime
+        self._ino = st.st_ino
+    
+    def read_rows(self) -> list:
+        """Retorna las filas completas añadidas desde la última llamada"""
+        self.was_reset = False
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            if self.offset:
+                self.reset()
+            return []
+        
+        self.mtime = st.st_mtime
+        if st.st_size < self.offset or (self._ino is not None and st.st_ino and st.st_ino != self._ino):
+            self.reset()
+        self._ino = st.st_ino
+        if st.st_size == self.offset:
+            return []
+        
+        try:
+            if self._fh is None:
+                self._fh = open(self.path, 'rb')
+            self._fh.seek(self.offset)
+            data = self._fh.read(st.st_size - self.offset)
+        except Exception as e:
+            print(f"[ERROR] Leyendo {self.path}: {e}")
+            self.close()
+            return []
+        finally:
+            if not self.keep_open:
+                self.close()
+        
+        if self.offset == 0 and data.startswith(b"\xef\xbb\xbf"):
+            data = data[3:]
+            self.offset = 3
+        self.offset += len(data)
+        
+        data = self._partial + data
+        lines = data.split(b"\n")
+        self._partial = lines.pop()
+        
+        rows = []
+        for raw in lines:
+            line = raw.decode('utf-8', errors='replace').rstrip('\r')
+            if line.strip():
+                rows.append(line.split(';'))
+        return rows
@@ -0,0 +1,266 @@
+"""
+metricas.py (Produccion V2)
+---------------------------
+Métricas en memoria con endpoint HTTP opcional en formato de exposición de texto
+(compatible con Prometheus) para DistribuidorPV2 y LogMonitorPV2.
+
+Uso:
+    from metricas import REGISTRY, start_metrics_server
+    eventos = REGISTRY.counter("phoenix_eventos_total", "Eventos procesados", ["event_type"])
+    eventos.inc(event_type="OPEN")
+    start_metrics_server(9108)   # GET http://host:9108/metrics
+
+Solo usa la librería estándar. Si no se arranca el servidor, las métricas siguen
+acumulándose en memoria sin coste de red.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Buckets por defecto (segundos): de 1 ms a 30 s
+DEFAULT_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape_label(v)}"' for n, v in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{_escape_label(extra[1])}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames: Optional[List[str]] = None):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = list(labelnames or [])
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: etiquetas esperadas {self.labelnames}, recibidas {sorted(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            lines.extend(self._samples())
+        return "\n".join(lines) + "\n"
+
+
+class Counter(_Metric):
+    """Contador monótono."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Optional[List[str]] = None):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(val)}"
+            for key, val in sorted(self._values.items())
+        ]
+
+
+class Gauge(_Metric):
+    """Valor instantáneo que puede subir o bajar."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames: Optional[List[str]] = None):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def remove(self, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values.pop(key, None)
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(val)}"
+            for key, val in sorted(self._values.items())
+        ]
+
+
+class Histogram(_Metric):
+    """Histograma acumulativo con buckets fijos (memoria constante por serie)."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Optional[List[str]] = None,
+                 buckets: Tuple[float, ...] = DEFAULT_LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [counts por bucket..., suma, total]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = [0.0] * (len(self.buckets) + 2)
+                self._series[key] = series
+            for i, upper in enumerate(self.buckets):
+                if value <= upper:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def _samples(self) -> List[str]:
+        out: List[str] = []
+        for key, series in sorted(self._series.items()):
+            cumulative = 0.0
+            for i, upper in enumerate(self.buckets):
+                cumulative += series[i]
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(upper)))
+                out.append(f"{self.name}_bucket{labels} {_format_value(cumulative)}")
+            labels = _format_labels(self.labelnames, key, ("le", "+Inf"))
+            out.append(f"{self.name}_bucket{labels} {_format_value(series[-1])}")
+            base = _format_labels(self.labelnames, key)
+            out.append(f"{self.name}_sum{base} {_format_value(series[-2])}")
+            out.append(f"{self.name}_count{base} {_format_value(series[-1])}")
+        return out
+
+
+class RateWindow:
+    """
+    Tasa de eventos por segundo en una ventana deslizante (por defecto 60 s).
+    Guarda un contador por segundo, así que la memoria es fija.
+    """
+
+    def __init__(self, window_seconds: int = 60):
+        self.window_seconds = window_seconds
+        self._buckets: deque = deque()  # (segundo, cuenta)
+        self._lock = threading.Lock()
+
+    def add(self, count: int = 1, now: Optional[float] = None) -> None:
+        sec = int(now if now is not None else time.time())
+        with self._lock:
+            if self._buckets and self._buckets[-1][0] == sec:
+                self._buckets[-1][1] += count
+            else:
+                self._buckets.append([sec, count])
+            self._trim(sec)
+
+    def rate(self, now: Optional[float] = None) -> float:
+        sec = int(now if now is not None else time.time())
+        with self._lock:
+            self._trim(sec)
+            total = sum(c for _, c in self._buckets)
+        return total / float(self.window_seconds)
+
+    def _trim(self, sec: int) -> None:
+        limit = sec - self.window_seconds
+        while self._buckets and self._buckets[0][0] <= limit:
+            self._buckets.popleft()
+
+
+class MetricsRegistry:
+    """Registro de métricas del proceso. Reutiliza la métrica si ya existe con el mismo nombre."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, help_text: str, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = cls(name, help_text, labelnames, **kwargs)
+                self._metrics[name] = metric
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Métrica {name} ya registrada como {metric.kind}")
+            return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Optional[List[str]] = None) -> Counter:
+        return self._get_or_create(Counter, name, help_text, labelnames)
+
+    def gauge(self, name: str, help_text: str, labelnames: Optional[List[str]] = None) -> Gauge:
+        return self._get_or_create(Gauge, name, help_text, labelnames)
+
+    def histogram(self, name: str, help_text: str, labelnames: Optional[List[str]] = None,
+                  buckets: Tuple[float, ...] = DEFAULT_LATENCY_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help_text, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "".join(m.render() for m in metrics)
+
+
+REGISTRY = MetricsRegistry()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry: MetricsRegistry = REGISTRY
+
+    def do_GET(self):  # noqa: N802 (nombre impuesto por BaseHTTPRequestHandler)
+        if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # noqa: A002
+        # Silenciar el log por petición (el scrape es cada pocos segundos)
+        pass
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0", registry: MetricsRegistry = REGISTRY) -> Optional[ThreadingHTTPServer]:
+    """
+    Arranca el endpoint /metrics en un hilo daemon.
+    Retorna el servidor o None si el puerto es 0 o no se pudo abrir.
+    """
+    if not port:
+        return None
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+    try:
+        server = ThreadingHTTPServer((host, int(port)), handler)
+    except OSError as exc:
+        print(f"[WARN] No se pudo abrir endpoint de métricas en {host}:{port}: {exc}")
+        return None
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="metricas-http", daemon=True)
+    thread.start()
+    print(f"[INIT] Métricas disponibles en http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+"""
+reconciliador.py (Produccion V2)
+--------------------------------
+Reconciliación continua entre eventos distribuidos y ejecutados por los workers.
+
+Versión en tiempo real de verificar_correlacion_historicos.py: en lugar de releer todos
+los históricos, sigue por el final (lectura incremental):
+- Historico_Master.csv: event_type y distribute_time de cada evento distribuido
+- historico_clonacion.csv: a qué workers se distribuyó cada ticket (ticket;worker;resultado;ts)
+- estados_WORKER_XXX.csv: estado de cada comando en el worker (estado 2 = terminado)
+
+Mantiene en memoria solo las tripletas (ticket, evento, worker) pendientes, con caducidad,
+así que la memoria es proporcional a los eventos en vuelo y no al tamaño del histórico.
+historico_WORKER_XXX.csv no se sigue: la purga solo mueve ahí líneas que ya pasaron por estados.
+
+Cada N segundos escribe reconciliacion.txt (resumen por worker + pendientes más antiguos).
+
+Uso:
+    python reconciliador.py [--base RUTA_LOGS] [--config distribuidor_config.txt]
+                            [--intervalo 30] [--expira-horas 24] [--desde-inicio]
+
+Arranca al final de los archivos: solo reconcilia eventos distribuidos desde el arranque
+(--desde-inicio relee también lo que aún no se ha purgado).
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import time
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Deque, Dict, List, Optional, Tuple
+
+from configuracion import CONFIG_FILENAME, load_file_config
+from lectura_incremental import TailReader
+from tiempos import TimestampColumn
+
+# Configuración por defecto
+LOGS_BASE_PATH = Path(os.environ.get('APPDATA', '')) / "MetaQuotes" / "Terminal" / "Common" / "Files" / "PROD" / "Phoenix" / "V2"
+CONFIG_PATH = Path(__file__).parent / CONFIG_FILENAME
+RECONCILIATION_FILE = "reconciliacion.txt"
+POLL_SECONDS = 1.0              # Lectura de archivos nuevos
+REPORT_SECONDS = 30             # Escritura de reconciliacion.txt
+EXPIRY_HOURS = 24               # Pendientes más antiguos se dan por perdidos
+STALE_SECONDS = 60              # Pendientes más antiguos se listan en el informe
+EARLY_TTL_SECONDS = 300         # Estados terminados antes de ver su distribución (carrera de escritura)
+MAX_LISTED = 200                # Pendientes listados en el informe
+MAX_EXPIRED_LISTED = 50         # Últimos expirados listados en el informe
+
+Triple = Tuple[str, str, str]  # (ticket, evento, worker)
+
+
+def event_base(event_type: str) -> str:
+    """MODIFY_0.00_4640.00 -> MODIFY (mismo criterio que LogMonitorPV2)"""
+    return event_type.strip().upper().split("_")[0]
+
+
+class WorkerCounters:
+    """Contadores acumulados de un worker desde el arranque"""
+
+    def __init__(self):
+        self.distribuidos = 0
+        self.completados = 0
+        self.errores = 0
+        self.expirados = 0
+        self.no_ok = 0
+
+
+class Reconciliador:
+    """
+    Empareja distribuciones con estados terminados.
+    - pending: tripleta -> [distribute_ms, veces, último estado] (MODIFY puede repetirse)
+    - attribution: ticket -> eventos del Master aún por asignar a las líneas de clonación
+    - early: tripletas terminadas antes de leer su distribución (el Distribuidor escribe las
+      colas antes que los históricos)
+    """
+
+    def __init__(self, base_path: Path, config_path: Path = CONFIG_PATH,
+                 expiry_hours: float = EXPIRY_HOURS, from_start: bool = False):
+        self.base_path = Path(base_path)
+        self.config_path = Path(config_path)
+        self.expiry_ms = int(expiry_hours * 3600 * 1000)
+        self.from_start = from_start
+        self.master_tail = self._tail(self.base_path / "Historico_Master.csv")
+        self.clonacion_tail = self._tail(self.base_path / "historico_clonacion.csv")
+        self.estados_tails: Dict[str, TailReader] = {}
+        self.pending: Dict[Triple, list] = {}
+        self.attribution: Dict[str, Deque[list]] = {}   # ticket -> deque([evento, distribute_ms, workers asignados, ms lectura])
+        self.early: Dict[Triple, list] = {}              # tripleta -> [veces, ms lectura]
+        self.counters: Dict[str, WorkerCounters] = {}
+        self.expired: Deque[tuple] = deque(maxlen=MAX_EXPIRED_LISTED)
+        self.ts_distribute = TimestampColumn()
+        self.started_ms = int(time.time() * 1000)
+        for worker_id in load_file_config(self.config_path).get("worker_ids_list", []):
+            self._estados_tail(worker_id)
+
+    def _tail(self, path: Path) -> TailReader:
+        reader = TailReader(path)
+        if not self.from_start:
+            reader.seek_to_end()
+        return reader
+
+    def _estados_tail(self, worker_id: str) -> TailReader:
+        reader = self.estados_tails.get(worker_id)
+        if reader is None:
+            reader = self._tail(self.base_path / f"estados_WORKER_{worker_id}.csv")
+            self.estados_tails[worker_id] = reader
+            self.counters.setdefault(worker_id, WorkerCounters())
+        return reader
+
+    # ------------------------------------------------------------------
+    # Lectura
+    # ------------------------------------------------------------------
+
+    def poll(self, now_ms: Optional[int] = None) -> None:
+        """Lee lo nuevo de Master, clonación y estados (en ese orden) y caduca pendientes"""
+        now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+
+        for row in self.master_tail.read_rows():
+            if len(row) < 2 or "INVALIDATE" in row[0].upper():
+                continue  # Invalidados por la regla de 30 s: no se distribuyen
+            ticket = row[1].strip()
+            distribute_ms = self.ts_distribute(row[-1]) if len(row) >= 11 else None
+            self.attribution.setdefault(ticket, deque()).append(
+                [event_base(row[0]), distribute_ms or now_ms, set(), now_ms]
+            )
+
+        for row in self.clonacion_tail.read_rows():
+            if len(row) < 3:
+                continue
+            self._on_distribution(row[0].strip(), row[1].strip(), row[2].strip().upper(), now_ms)
+
+        for worker_id, reader in list(self.estados_tails.items()):
+            for row in reader.read_rows():
+                if len(row) < 3 or row[2].strip() == "" or not row[0].strip():
+                    continue
+                self._on_estado(worker_id, row, now_ms)
+
+        self._expire(now_ms)
+
+    def _on_distribution(self, ticket: str, worker_id: str, resultado: str, now_ms: int) -> None:
+        self._estados_tail(worker_id)
+        counters = self.counters[worker_id]
+        queue = self.attribution.get(ticket)
+        entry = next((e for e in queue if worker_id not in e[2]), None) if queue else None
+        if entry is None:
+            return  # Sin línea de Master (p.ej. escrita antes de arrancar)
+        entry[2].add(worker_id)
+        if resultado != "OK":
+            counters.no_ok += 1
+            return
+
+        counters.distribuidos += 1
+        triple = (ticket, entry[0], worker_id)
+        early = self.early.get(triple)
+        if early is not None:
+            # El worker ya lo terminó antes de que leyéramos la distribución
+            early[0] -= 1
+            if early[0] <= 0:
+                del self.early[triple]
+            counters.completados += 1
+            return
+        item = self.pending.get(triple)
+        if item is None:
+            self.pending[triple] = [entry[1], 1, ""]
+        else:
+            item[1] += 1
+
+    def _on_estado(self, worker_id: str, row: List[str], now_ms: int) -> None:
+        triple = (row[0].strip(), event_base(row[1]), worker_id)
+        estado = row[2].strip()
+        item = self.pending.get(triple)
+        if estado != "2":
+            if item is not None:
+                item[2] = estado
+            return
+
+        counters = self.counters[worker_id]
+        resultado = row[4].strip() if len(row) > 4 else ""
+        if resultado.startswith("ERR"):
+            counters.errores += 1
+        if item is None:
+            early = self.early.setdefault(triple, [0, now_ms])
+            early[0] += 1
+            early[1] = now_ms
+            return
+        counters.completados += 1
+        item[1] -= 1
+        if item[1] <= 0:
+            del self.pending[triple]
+
+    def _expire(self, now_ms: int) -> None:
+        for triple, item in list(self.pending.items()):
+            if now_ms - item[0] > self.expiry_ms:
+                del self.pending[triple]
+                self.counters[triple[2]].expirados += item[1]
+                self.expired.append((triple, item[0], item[2]))
+
+        early_limit = now_ms - EARLY_TTL_SECONDS * 1000
+        for triple in [t for t, e in self.early.items() if e[1] < early_limit]:
+            del self.early[triple]
+
+        # Atribución: se descarta cuando todos los workers conocidos recibieron el evento
+        # o cuando ya no llegarán más líneas de clonación para él
+        known = set(self.estados_tails)
+        for ticket in list(self.attribution):
+            queue = self.attribution[ticket]
+            while queue and (queue[0][2] >= known or now_ms - queue[0][3] > EARLY_TTL_SECONDS * 1000):
+                queue.popleft()
+            if not queue:
+                del self.attribution[ticket]
+
+    # ------------------------------------------------------------------
+    # Informe
+    # ------------------------------------------------------------------
+
+    def report_lines(self, now_ms: Optional[int] = None) -> List[str]:
+        now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+        per_worker: Dict[str, List[int]] = {w: [0, 0, 0] for w in self.counters}  # pendientes, atrasados, más antiguo (ms)
+        for (_, _, worker_id), item in self.pending.items():
+            stats = per_worker.setdefault(worker_id, [0, 0, 0])
+            age = now_ms - item[0]
+            stats[0] += item[1]
+            if age > STALE_SECONDS * 1000:
+                stats[1] += item[1]
+            stats[2] = max(stats[2], age)
+
+        total_pending = sum(s[0] for s in per_worker.values())
+        fecha = datetime.fromtimestamp(now_ms / 1000).strftime("%Y.%m.%d %H:%M:%S")
+        desde = datetime.fromtimestamp(self.started_ms / 1000).strftime("%Y.%m.%d %H:%M:%S")
+        lines = [
+            f"# reconciliacion {fecha} (desde {desde}) | pendientes={total_pending} "
+            f"en_atribucion={sum(len(q) for q in self.attribution.values())} terminados_sin_distribucion={len(self.early)}\n",
+            "worker|distribuidos|completados|errores|pendientes|atrasados|mas_antiguo_s|expirados|no_ok\n",
+        ]
+        for worker_id in sorted(per_worker):
+            c = self.counters.get(worker_id) or WorkerCounters()
+            pend, stale, oldest = per_worker[worker_id]
+            lines.append(f"{worker_id}|{c.distribuidos}|{c.completados}|{c.errores}|{pend}|{stale}|"
+                         f"{oldest // 1000}|{c.expirados}|{c.no_ok}\n")
+
+        stale_items = sorted(
+            ((item[0], triple, item) for triple, item in self.pending.items() if now_ms - item[0] > STALE_SECONDS * 1000),
+            key=lambda x: x[0],
+        )
+        lines.append(f"\n# pendientes > {STALE_SECONDS}s (más antiguos primero, máx {MAX_LISTED})\n")
+        lines.append("ticket_event|worker|estado|veces|edad_s\n")
+        for first_ms, (ticket, event, worker_id), item in stale_items[:MAX_LISTED]:
+            lines.append(f"{ticket}_{event}|{worker_id}|{item[2] or '-'}|{item[1]}|{(now_ms - first_ms) // 1000}\n")
+
+        if self.expired:
+            lines.append(f"\n# últimos expirados (> {self.expiry_ms // 3_600_000}h sin estado terminado)\n")
+            lines.append("ticket_event|worker|ultimo_estado|distribuido\n")
+            for (ticket, event, worker_id), first_ms, estado in self.expired:
+                distribuido = datetime.fromtimestamp(first_ms / 1000).strftime("%Y.%m.%d %H:%M:%S")
+                lines.append(f"{ticket}_{event}|{worker_id}|{estado or '-'}|{distribuido}\n")
+        return lines
+
+    def write_report(self, output_path: Optional[Path] = None) -> Path:
+        """Escribe el informe de forma atómica (tmp + replace) para no dejar lecturas a medias"""
+        output_path = output_path or self.base_path / RECONCILIATION_FILE
+        tmp_path = output_path.with_name(output_path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.writelines(self.report_lines())
+        os.replace(tmp_path, output_path)
+        return output_path
+
+    def run(self, report_seconds: float = REPORT_SECONDS) -> None:
+        print(f"[INIT] Reconciliador sobre {self.base_path}")
+        print(f"[INIT] Workers: {', '.join(sorted(self.estados_tails)) or '(se detectan por historico_clonacion)'}")
+        print(f"[INIT] Informe cada {report_seconds:.0f}s en {self.base_path / RECONCILIATION_FILE}")
+        next_report = time.time() + report_seconds
+        while True:
+            try:
+                self.poll()
+                if time.time() >= next_report:
+                    self.write_report()
+                    next_report = time.time() + report_seconds
+                    print(f"[INFO] Pendientes: {sum(i[1] for i in self.pending.values())} | "
+                          f"expirados: {sum(c.expirados for c in self.counters.values())}")
+            except Exception as e:
+                print(f"[ERROR] Ciclo de reconciliación: {e}")
+            time.sleep(POLL_SECONDS)
+
+
+def _arg_value(name: str, default: Optional[str] = None) -> Optional[str]:
+    if name in sys.argv:
+        idx = sys.argv.index(name)
+        if idx + 1 < len(sys.argv):
+            return sys.argv[idx + 1]
+    return default
+
+
+def main():
+    base_path = Path(_arg_value("--base") or LOGS_BASE_PATH)
+    config_path = Path(_arg_value("--config") or CONFIG_PATH)
+    try:
+        interval = float(_arg_value("--intervalo", str(REPORT_SECONDS)))
+        expiry_hours = float(_arg_value("--expira-horas", str(EXPIRY_HOURS)))
+    except ValueError:
+        print("[ERROR] --intervalo y --expira-horas deben ser numéricos")
+        return 1
+    if not base_path.exists():
+        print(f"[ERROR] No existe la carpeta de logs: {base_path}")
+        return 1
+    try:
+        Reconciliador(base_path, config_path, expiry_hours, from_start="--desde-inicio" in sys.argv).run(interval)
+    except KeyboardInterrupt:
+        print("\n[INFO] Reconciliador detenido")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+"""
+relojes.py (Produccion V2)
+--------------------------
+Estimación de desfases de reloj entre las fuentes de timestamps de Phoenix.
+
+Fuentes (cada una se compara con el timestamp siguiente del flujo, de otro reloj):
+- servidor:   EVENT_TIME (hora servidor MT4)           -> EXPORT_TIME (UTC del PC del Extractor)
+- extractor:  EXPORT_TIME / OPEN_TIME_UTC_MS (PC MT4)   -> read_time (PC del Distribuidor)
+- worker:     distribute_time (PC del Distribuidor)     -> timestamp de estados_WORKER (PC/servidor del worker)
+
+Para cada fuente se observa el "lag" = timestamp posterior - timestamp anterior, que es
+latencia real + desfase de reloj. Con un solo sentido no se pueden separar ambos, así que
+la corrección solo elimina lo que no puede ser latencia:
+- Horas enteras (zona horaria del servidor, horario de verano): si la mediana móvil de los lags
+  (o el lag de la fila) está a menos de 2 min de un múltiplo de 1 h. No en las fuentes de
+  EPOCH_SOURCES: ahí los dos timestamps son ms epoch UTC, una hora no puede ser zona horaria y
+  una mediana de ~1 h solo significa que los eventos llevan 1 h de cola.
+- Desfase residual: solo si la mediana móvil del lag (sin las horas) es negativa más allá de
+  la tolerancia, es decir, el reloj posterior va por detrás (un lag negativo es imposible).
+  Un reloj que va por delante no se corrige: no se distingue de latencia real.
+
+correction_ms(fuente, lag) devuelve los ms a sumar al lag observado (equivale a desplazar el
+timestamp posterior). Se usa igual en la regla de 30 s del Distribuidor y en trazabilidad.
+"""
+
+from __future__ import annotations
+
+import bisect
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from tiempos import nearest_hour_offset_ms
+
+CLOCK_WINDOW = 501              # Lags recientes por fuente (mediana móvil)
+CLOCK_MIN_SAMPLES = 20          # Muestras mínimas antes de fiarse de la mediana
+CLOCK_TOLERANCE_MS = 2000       # Residual negativo menor que esto se considera ruido
+CLOCK_MAX_SKEW_MS = 10 * 60_000  # Residuales mayores no se corrigen (dato sospechoso, no reloj)
+EPOCH_SOURCES = frozenset({"extractor"})  # Ambos timestamps en ms epoch UTC: sin corrección de horas
+
+
+class RollingMedian:
+    """Mediana de las últimas N observaciones (lista ordenada + ventana FIFO)."""
+
+    def __init__(self, window: int = CLOCK_WINDOW):
+        self.window = window
+        self._fifo: Deque[int] = deque()
+        self._sorted: List[int] = []
+
+    def add(self, value: int) -> None:
+        self._fifo.append(value)
+        bisect.insort(self._sorted, value)
+        if len(self._fifo) > self.window:
+            old = self._fifo.popleft()
+            del self._sorted[bisect.bisect_left(self._sorted, old)]
+
+    def __len__(self) -> int:
+        return len(self._fifo)
+
+    def median(self) -> Optional[int]:
+        n = len(self._sorted)
+        if n == 0:
+            return None
+        return self._sorted[n // 2]
+
+    def values(self) -> List[int]:
+        return list(self._fifo)
+
+
+class ClockOffsetEstimator:
+    """Mediana móvil de lags por fuente y corrección de reloj derivada de ella."""
+
+    def __init__(self, window: int = CLOCK_WINDOW, min_samples: int = CLOCK_MIN_SAMPLES,
+                 tolerance_ms: int = CLOCK_TOLERANCE_MS, max_skew_ms: int = CLOCK_MAX_SKEW_MS,
+                 epoch_sources: frozenset = EPOCH_SOURCES):
+        self.window = window
+        self.min_samples = min_samples
+        self.tolerance_ms = tolerance_ms
+        self.max_skew_ms = max_skew_ms
+        self.epoch_sources = epoch_sources
+        self.sources: Dict[str, RollingMedian] = {}
+
+    def observe(self, source: str, lag_ms: Optional[int]) -> None:
+        """Registra un lag (timestamp posterior - anterior, ms) de la fuente. None se ignora."""
+        if lag_ms is None:
+            return
+        median = self.sources.get(source)
+        if median is None:
+            median = RollingMedian(self.window)
+            self.sources[source] = median
+        median.add(lag_ms)
+
+    def median_lag_ms(self, source: str) -> Optional[int]:
+        median = self.sources.get(source)
+        if median is None or len(median) < self.min_samples:
+            return None
+        return median.median()
+
+    def _hours_and_skew(self, source: str) -> Tuple[int, int]:
+        median = self.median_lag_ms(source)
+        if median is None:
+            return 0, 0
+        # Horas solo si la mediana cae cerca de una hora exacta: una mediana de 40 min es
+        # latencia (cola atascada), no zona horaria. Entre relojes epoch UTC nunca son horas
+        hours = 0 if source in self.epoch_sources else nearest_hour_offset_ms(median) or 0
+        residual = median - hours
+        skew = residual if -self.max_skew_ms <= residual < -self.tolerance_ms else 0
+        return hours, skew
+
+    def offset_ms(self, source: str) -> int:
+        """Desfase estimado (horas + residual) que se resta a los lags de la fuente."""
+        hours, skew = self._hours_and_skew(source)
+        return hours + skew
+
+    def correction_ms(self, source: str, lag_ms: Optional[int] = None) -> int:
+        """
+        ms a sumar al lag observado de la fuente. Con lag_ms, la parte de horas se toma de la
+        propia fila si está cerca de una hora exacta (reacciona al cambio de horario al momento).
+        En las fuentes de EPOCH_SOURCES solo se corrige el residual negativo acotado.
+        """
+        hours, skew = self._hours_and_skew(source)
+        if lag_ms is not None and source not in self.epoch_sources:
+            row_hours = nearest_hour_offset_ms(lag_ms)
+            if row_hours is not None:
+                hours = row_hours
+        return -(hours + skew)
+
+    def update(self, source: str, lag_ms: Optional[int]) -> int:
+        """observe() + correction_ms() de la misma fila (modo streaming). 0 si lag_ms es None."""
+        if lag_ms is None:
+            return 0
+        self.observe(source, lag_ms)
+        return self.correction_ms(source, lag_ms)
+
+    def window_state(self) -> Dict[str, List[int]]:
+        """Lags de la ventana de cada fuente, en orden de llegada (serializable a JSON)."""
+        return {source: m.values() for source, m in self.sources.items()}
+
+    def restore(self, state: Dict[str, List[int]]) -> None:
+        """Recarga ventanas guardadas con window_state() (p.ej. de un checkpoint) observándolas en orden."""
+        for source, lags in state.items():
+            for lag in lags[-self.window:]:
+                self.observe(source, int(lag))
+
+    def describe(self) -> Dict[str, dict]:
+        """Resumen por fuente (para logs)."""
+        return {
+            source: {"muestras": len(m), "mediana_lag_ms": m.median(), "desfase_ms": self.offset_ms(source)}
+            for source, m in self.sources.items()
+        }
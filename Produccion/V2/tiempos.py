@@ -0,0 +1,169 @@
+"""
+tiempos.py (Produccion V2)
+--------------------------
+Decodificación rápida de timestamps de los logs de Phoenix, compartida por trazabilidad y
+LogMonitorPV2. Los scripts de V2/ y V3/ la importan desde aquí (sys.path), sin copias.
+
+Formatos admitidos (los mismos que timestamp_to_ms() de trazabilidad):
+- Epoch en milisegundos ("1767640249433"); valores < 1e9 se interpretan como segundos
+- Fecha MT4 "YYYY.MM.DD HH:MM:SS[.mmm]" en hora local del PC (igual que datetime.timestamp())
+
+Rendimiento:
+- La fecha MT4 se parsea por posiciones fijas (sin strptime); el epoch del inicio de cada hora
+  local se cachea por día, así que el coste por valor es aritmética entera.
+- El camino habitual no lanza excepciones; solo los valores fuera de formato caen al parser lento.
+- TimestampColumn detecta el formato con el primer valor de una columna y lo reutiliza.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+HOUR_MS = 3_600_000
+_MAX_DAY_CACHE = 4096  # Días distintos cacheados (~11 años de logs)
+
+_day_cache: Dict[str, Optional[Tuple[int, ...]]] = {}
+
+
+def _hour_bases_ms(day: str) -> Optional[Tuple[int, ...]]:
+    """Epoch (ms) del inicio de cada hora local del día 'YYYY.MM.DD' (None si la fecha no es válida)."""
+    bases = _day_cache.get(day, ())
+    if bases != ():
+        return bases
+    try:
+        y, m, d = int(day[0:4]), int(day[5:7]), int(day[8:10])
+        bases = tuple(int(datetime(y, m, d, h).timestamp()) * 1000 for h in range(24))
+    except ValueError:
+        bases = None
+    if len(_day_cache) >= _MAX_DAY_CACHE:
+        _day_cache.clear()
+    _day_cache[day] = bases
+    return bases
+
+
+def _is_mt4_layout(s: str) -> bool:
+    return (
+        len(s) >= 19 and s[4] == "." and s[7] == "." and s[10] == " " and s[13] == ":" and s[16] == ":"
+        and (len(s) == 19 or (s[19] == "." and 20 < len(s) <= 26 and s[20:].isdigit()))
+        and s[0:4].isdigit() and s[5:7].isdigit() and s[8:10].isdigit()
+        and s[11:13].isdigit() and s[14:16].isdigit() and s[17:19].isdigit()
+    )
+
+
+def parse_mt4(s: str) -> Optional[int]:
+    """'YYYY.MM.DD HH:MM:SS[.mmm]' (hora local) -> ms epoch. None si no cumple el formato fijo."""
+    if not _is_mt4_layout(s):
+        return None
+    hour, minute, second = int(s[11:13]), int(s[14:16]), int(s[17:19])
+    if hour > 23 or minute > 59 or second > 59:
+        return None
+    bases = _hour_bases_ms(s[0:10])
+    if bases is None:
+        return None
+    # Fracción con 1..6 dígitos, igual que %f (microsegundos truncados a ms)
+    frac_ms = int(s[20:].ljust(6, "0")) // 1000 if len(s) > 19 else 0
+    return bases[hour] + (minute * 60 + second) * 1000 + frac_ms
+
+
+def parse_epoch(s: str) -> Optional[int]:
+    """Entero en ms (o segundos si < 1e9) -> ms epoch. None si no son solo dígitos."""
+    if not (s.isdigit() and s.isascii()):
+        return None
+    ms = int(s)
+    return ms * 1000 if ms < 1_000_000_000 else ms
+
+
+def _parse_slow(s: str) -> Optional[int]:
+    """Formatos poco habituales: decimales, signo, exponentes o fechas sin ceros a la izquierda."""
+    try:
+        ms = int(float(s))
+        return ms * 1000 if ms < 1_000_000_000 else ms
+    except ValueError:
+        pass
+    for fmt in ("%Y.%m.%d %H:%M:%S.%f", "%Y.%m.%d %H:%M:%S"):
+        try:
+            dt = datetime.strptime(s, fmt)
+        except ValueError:
+            continue
+        return int(datetime(dt.year, dt.month, dt.day, dt.hour).timestamp()) * 1000 \
+            + (dt.minute * 60 + dt.second) * 1000 + dt.microsecond // 1000
+    return None
+
+
+def timestamp_to_ms(value: str) -> Optional[int]:
+    """
+    Convierte un timestamp (epoch ms/s o fecha MT4) a ms epoch. None si está vacío o no es válido.
+    Sin detección por columna: usar TimestampColumn cuando se convierten muchos valores del mismo campo.
+    """
+    if not value:
+        return None
+    s = value.strip()
+    if not s:
+        return None
+    if s.isdigit() and s.isascii():
+        ms = int(s)
+        return ms * 1000 if ms < 1_000_000_000 else ms
+    ms = parse_mt4(s)
+    if ms is not None:
+        return ms
+    return _parse_slow(s)
+
+
+class TimestampColumn:
+    """
+    Conversor para una columna de un archivo: detecta el formato con el primer valor no vacío
+    y lo aplica al resto. Si un valor no encaja, se convierte con timestamp_to_ms() y se
+    vuelve a detectar con el siguiente.
+    """
+
+    def __init__(self):
+        self._parser: Optional[Callable[[str], Optional[int]]] = None
+
+    def __call__(self, value: str) -> Optional[int]:
+        if not value:
+            return None
+        parser = self._parser
+        if parser is not None:
+            ms = parser(value)
+            if ms is not None:
+                return ms
+        s = value.strip()
+        if not s:
+            return None
+        if s.isdigit() and s.isascii():
+            self._parser = parse_epoch
+        elif _is_mt4_layout(s):
+            self._parser = parse_mt4
+        else:
+            self._parser = None
+        return timestamp_to_ms(s)
+
+    def convert(self, values: Iterable[str]) -> List[Optional[int]]:
+        return [self(v) for v in values]
+
+
+def parse_mt4_date(value: str) -> Optional[Tuple[int, int, int]]:
+    """'YYYY.MM.DD[ ...]' -> (año, mes, día) sin strptime. None si no cumple el formato."""
+    s = value.strip()
+    if len(s) < 10 or s[4] != "." or s[7] != "." or not (s[0:4].isdigit() and s[5:7].isdigit() and s[8:10].isdigit()):
+        return None
+    if len(s) > 10 and s[10] != " ":
+        return None
+    return int(s[0:4]), int(s[5:7]), int(s[8:10])
+
+
+def nearest_hour_offset_ms(delta_ms: int, max_jitter_ms: int = 120_000) -> Optional[int]:
+    """
+    Si delta_ms está cerca de un múltiplo de 1 hora (3600s), devuelve ese offset en ms.
+    Sirve para corregir desfaces UTC vs hora servidor MT4 cuando se comparan timestamps de distintos sistemas.
+    """
+    if delta_ms == 0:
+        return 0
+    k = int(round(delta_ms / HOUR_MS))
+    if k == 0:
+        return 0
+    candidate = k * HOUR_MS
+    if abs(delta_ms - candidate) <= max_jitter_ms:
+        return candidate
+    return None
@@ -10,23 +10,55 @@ Lee:
 Genera:
 - trazabilidad.txt: ticket+evento | event_time | export_time | read_time | distribute_time | worker_timestamp | total_ms
 
+Modo incremental (python trazabilidad.py --incremental, pensado para ejecutarse cada minuto):
+- trazabilidad_checkpoint.json guarda offset por archivo y los ticket_event pendientes de worker
+- Cada ejecución lee solo las líneas nuevas y AÑADE a trazabilidad.txt las filas finalizadas
+
+Modo columnar (python trazabilidad.py --numpy): mismo resultado que el modo completo, pero
+conversión de timestamps, normalización horaria, diferencias y formato se hacen con arrays
+NumPy en bloque. Requiere numpy. Benchmark: bench_trazabilidad.py
+
+Modo resumen (python trazabilidad.py --resumen): latencias_resumen.txt con p50/p90/p99/max por
+etapa (export, read, distribute, worker, total), global y por worker, tipo de evento (OPEN/CLOSE)
+y hora del día. Los percentiles usan sketches de cuantiles (anomalias.QuantileSketch), de tamaño
+acotado por serie. La memoria del modo NO es constante: crece con el histórico por el índice del
+master para el join (una entrada por evento) y los eventos ya vistos de cada worker.
+
+Modo por worker (python trazabilidad.py --por-worker): trazabilidad_workers.txt con la latencia
+export -> worker de CADA cuenta (no solo la primera), la dispersión entre cuentas (max - min) y
+la cuenta más lenta (straggler) de cada evento. Usa una matriz ticket x worker int64. Requiere numpy.
+
 NOTA: En PROD V2 el Worker usa estados_WORKER_XXX.csv en lugar de historico_WORKER_XXX.csv.
       El formato de estados es: ticketMaster;eventType;estado;timestamp;resultado;extra
       Solo tenemos UN timestamp por evento (no worker_read_time y worker_exec_time separados).
 """
 
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 import csv
+import json
 import os
+import sys
+import time
 from datetime import datetime
 import math
 
+from anomalias import QuantileSketch
+from carga_paralela import load_files
+from relojes import ClockOffsetEstimator
+from tiempos import TimestampColumn, nearest_hour_offset_ms as _nearest_hour_offset_ms, timestamp_to_ms
+
 # Configuración por defecto - PRODUCCION V2
 DEFAULT_COMMON_FILES_DIR = Path.home() / "AppData" / "Roaming" / "MetaQuotes" / "Terminal" / "Common" / "Files"
 PROD_PHOENIX_DIR = Path("PROD") / "Phoenix" / "V2"  # Cambiado de V3/Phoenix
 HIST_MASTER_FILE = "Historico_Master.csv"
 TRACEABILITY_FILE = "trazabilidad.txt"
+SUMMARY_FILE = "latencias_resumen.txt"
+PER_WORKER_FILE = "trazabilidad_workers.txt"
+CHECKPOINT_FILE = "trazabilidad_checkpoint.json"
+CHECKPOINT_HEAD_BYTES = 64  # Inicio de cada archivo guardado en el checkpoint (detecta si se recreó)
+# Eventos sin ejecución de ningún worker tras este tiempo se escriben con worker N/A
+PENDING_MAX_AGE_HOURS = 24
 
 
 def get_common_files_dir() -> Path:
@@ -169,6 +201,23 @@ def read_master_hist(hist_path: Path) -> Dict[str, Dict[str, str]]:
     return master_data
 
 
+def _open_text_auto(p: Path):
+    """
+    Algunos archivos pueden estar en UTF-16 (BOM 0xFF 0xFE / 0xFE 0xFF).
+    Detectar BOM en binario y abrir con la codificación correcta.
+    """
+    try:
+        with open(p, "rb") as bf:
+            head = bf.read(4)
+        if head.startswith(b"\xff\xfe") or head.startswith(b"\xfe\xff"):
+            return open(p, "r", encoding="utf-16")
+        # utf-8-sig cubre BOM UTF-8 si existiera
+        return open(p, "r", encoding="utf-8-sig")
+    except Exception:
+        # fallback ultra-permisivo
+        return open(p, "r", encoding="latin-1", errors="replace")
+
+
 def read_worker_estados(estados_path: Path) -> Dict[str, Dict[str, str]]:
     """
     Lee archivo estados_WORKER_XXX.csv (PROD V2) y retorna diccionario.
@@ -179,22 +228,6 @@ def read_worker_estados(estados_path: Path) -> Dict[str, Dict[str, str]]:
     if not estados_path.exists():
         return worker_data
     
-    def _open_text_auto(p: Path):
-        """
-        Algunos archivos pueden estar en UTF-16 (BOM 0xFF 0xFE / 0xFE 0xFF).
-        Detectar BOM en binario y abrir con la codificación correcta.
-        """
-        try:
-            with open(p, "rb") as bf:
-                head = bf.read(4)
-            if head.startswith(b"\xff\xfe") or head.startswith(b"\xfe\xff"):
-                return open(p, "r", encoding="utf-16")
-            # utf-8-sig cubre BOM UTF-8 si existiera
-            return open(p, "r", encoding="utf-8-sig")
-        except Exception:
-            # fallback ultra-permisivo
-            return open(p, "r", encoding="latin-1", errors="replace")
-
     try:
         with _open_text_auto(estados_path) as f:
             for line_num, line in enumerate(f, 1):
@@ -218,27 +251,19 @@ def read_worker_estados(estados_path: Path) -> Dict[str, Dict[str, str]]:
     return worker_data
 
 
-def _nearest_hour_offset_ms(delta_ms: int, max_jitter_ms: int = 120_000) -> Optional[int]:
+def load_worker_timestamps(estados_path: Path) -> Dict[str, str]:
     """
-    Si delta_ms está cerca de un múltiplo de 1 hora (3600s), devuelve ese offset en ms.
-    Sirve para corregir desfaces UTC vs hora servidor MT4 cuando se comparan timestamps de distintos sistemas.
+    Versión compacta de read_worker_estados: { "ticket_event": worker_timestamp }.
+    Es la que se usa en la carga en paralelo (menos datos que serializar entre procesos).
     """
-    hour_ms = 3_600_000
-    if delta_ms == 0:
-        return 0
-    k = int(round(delta_ms / hour_ms))
-    if k == 0:
-        return 0
-    candidate = k * hour_ms
-    if abs(delta_ms - candidate) <= max_jitter_ms:
-        return candidate
-    return None
+    return {key: info["worker_timestamp"] for key, info in read_worker_estados(estados_path).items()}
 
 
 def aggregate_worker_data(all_worker_data: List[Dict[str, Dict[str, str]]]) -> Dict[str, Dict[str, str]]:
     """
     Agrega datos de múltiples workers.
     Para cada ticket+evento, toma los valores del primer worker que tenga datos.
+    Sirve igual para diccionarios compactos (load_worker_timestamps).
     """
     aggregated = {}
     
@@ -250,42 +275,6 @@ def aggregate_worker_data(all_worker_data: List[Dict[str, Dict[str, str]]]) -> D
     return aggregated
 
 
-def timestamp_to_ms(timestamp_str: str) -> Optional[int]:
-    """
-    Convierte timestamp a milisegundos.
-    Acepta formato: milisegundos (string numérico) o fecha (YYYY.MM.DD HH:MM:SS.mmm)
-    """
-    if not timestamp_str or timestamp_str.strip() == "":
-        return None
-    
-    timestamp_str = timestamp_str.strip()
-    
-    # Si es numérico, asumir que ya está en milisegundos
-    try:
-        ms = int(float(timestamp_str))
-        # Si el número es muy pequeño (< 1000000000), asumir que está en segundos
-        if ms < 1000000000:
-            ms = ms * 1000
-        return ms
-    except ValueError:
-        pass
-    
-    # Intentar parsear como fecha: YYYY.MM.DD HH:MM:SS.mmm
-    try:
-        # Formato: 2026.01.05 20:04:09.433
-        dt = datetime.strptime(timestamp_str, "%Y.%m.%d %H:%M:%S.%f")
-        return int(dt.timestamp() * 1000)
-    except ValueError:
-        try:
-            # Formato sin milisegundos: 2026.01.05 20:04:09
-            dt = datetime.strptime(timestamp_str, "%Y.%m.%d %H:%M:%S")
-            return int(dt.timestamp() * 1000)
-        except ValueError:
-            pass
-    
-    return None
-
-
 def calculate_diff_ms(event_time_ms: Optional[int], timestamp_str: str) -> Optional[int]:
     """
     Calcula la diferencia en milisegundos entre event_time y otro timestamp.
@@ -323,17 +312,491 @@ def filter_today_events(master_data: Dict[str, Dict[str, str]]) -> Dict[str, Dic
     return filtered
 
 
-def generate_traceability(common_dir: Path, output_path: Path, filter_today: bool = False):
-    """Genera archivo de trazabilidad."""
-    prod_phoenix = common_dir / PROD_PHOENIX_DIR
-    hist_master_path = prod_phoenix / HIST_MASTER_FILE
+TRACEABILITY_HEADER = "ticket_event|event_time|export_time|read_time|distribute_time|worker_timestamp|diff_export_ms|diff_read_ms|diff_distribute_ms|diff_worker_ms|total_ms\n"
+
+
+def clamp_negative(val: Optional[int]) -> Optional[int]:
+    """
+    Corregir valores negativos pequeños (desfase de reloj entre sistemas).
+    Valores entre -1000ms y 0ms se consideran ~0ms (ejecución casi instantánea).
+    Valores muy negativos indican error de zona horaria no corregido y se dejan tal cual.
+    """
+    if val is not None and val < 0:
+        if val > -1000:  # Pequeño desfase de reloj
+            return 0
+    return val
+
+
+def format_diff(diff: Optional[int]) -> str:
+    """Formatea una diferencia en ms: 'N/A', '850ms', '2s' o '2.35s'."""
+    if diff is None:
+        return "N/A"
+    if abs(diff) < 1000:
+        return f"{diff}ms"
+    else:
+        seconds = diff / 1000.0
+        if seconds == int(seconds):
+            return f"{int(seconds)}s"
+        else:
+            return f"{seconds:.2f}s"
+
+
+STAGES = ("export", "read", "distribute", "worker", "total")
+
+# Un conversor por campo: el formato se detecta una vez por columna, no por valor
+_TS_COLUMNS = {name: TimestampColumn() for name in ("event_time", "export_time", "read_time", "distribute_time", "worker_timestamp")}
+
+
+def _clock_correction(clocks: Optional[ClockOffsetEstimator], source: str, lag_ms: int) -> int:
+    """ms a sumar al lag de la fuente. Sin estimador: solo el múltiplo de 1 hora de la propia fila."""
+    if clocks is None:
+        return -(_nearest_hour_offset_ms(lag_ms) or 0)
+    return clocks.update(source, lag_ms)
+
+
+def compute_stage_diffs(master_info: Dict[str, str], worker_timestamp: str,
+                        clocks: Optional[ClockOffsetEstimator] = None) -> Dict[str, Optional[int]]:
+    """
+    Calcula las diferencias por etapa (ms, ya normalizadas y con clamp_negative) de un evento.
+    Claves: export, read, distribute, worker, total (None si no se puede calcular).
+    clocks: estimador de desfases (relojes.py) alimentado con los eventos en orden; sin él solo
+    se corrigen las horas exactas de cada fila.
+    """
+    event_time = master_info.get("event_time", "")
+    export_time = master_info.get("export_time", "")
+    read_time = master_info.get("read_time", "")
+    distribute_time = master_info.get("distribute_time", "")
+    
+    # Convertir todos los timestamps a milisegundos
+    event_time_ms = _TS_COLUMNS["event_time"](event_time)
+    export_time_ms = _TS_COLUMNS["export_time"](export_time)
+    read_time_ms = _TS_COLUMNS["read_time"](read_time)
+    distribute_time_ms = _TS_COLUMNS["distribute_time"](distribute_time)
+    worker_timestamp_ms = _TS_COLUMNS["worker_timestamp"](worker_timestamp)
+
+    # NORMALIZACIÓN DE RELOJES (ver relojes.py):
+    # - event_time viene del servidor MT4 (puede ser UTC+2 o UTC+3)
+    # - export viene del PC de MT4; read/distribute del PC del distribuidor
+    # - worker_timestamp: 
+    #   * Formato antiguo: fecha/hora del servidor MT4 (necesita normalización)
+    #   * Formato nuevo: milisegundos epoch UTC (no necesita normalización)
+    #
+    # Estrategia: usar export_time como referencia (T=0) ya que es el primer
+    # timestamp controlado por nuestro sistema (momento en que Extractor exporta).
+    
+    # Normalizar event_time si hay desfase horario con export_time
+    if event_time_ms is not None and export_time_ms is not None:
+        event_time_ms -= _clock_correction(clocks, "servidor", export_time_ms - event_time_ms)
+
+    # PC del distribuidor vs PC de MT4: solo el desfase de la mediana móvil (igual que la regla
+    # de 30s del Distribuidor); un read - export de 1h en una fila es un evento atascado, no reloj
+    extractor_ms = 0
+    if clocks is not None:
+        if read_time_ms is not None and export_time_ms is not None:
+            clocks.observe("extractor", read_time_ms - export_time_ms)
+        extractor_ms = clocks.correction_ms("extractor")
+
+    if extractor_ms:
+        read_time_ms = None if read_time_ms is None else read_time_ms + extractor_ms
+        distribute_time_ms = None if distribute_time_ms is None else distribute_time_ms + extractor_ms
+
+    # Normalizar worker_timestamp SOLO si hay desfase horario significativo
+    # (timestamps en ms epoch UTC no deberían tener desfase de horas). Se compara con distribute ya
+    # corregido: el reloj del worker puede coincidir con el del distribuidor o con el de MT4
+    if worker_timestamp_ms is not None and distribute_time_ms is not None:
+        worker_timestamp_ms += _clock_correction(clocks, "worker", worker_timestamp_ms - distribute_time_ms)
+    
+    # Calcular diferencias INCREMENTALES (cada paso respecto al anterior)
+    # Flujo: event → export → read → distribute → worker
+    diff_export_ms = None
+    diff_read_ms = None  
+    diff_distribute_ms = None
+    diff_worker_ms = None
     
-    # El config suele vivir en el repo (Produccion/V2/distribuidor_config.txt)
+    if export_time_ms is not None:
+        # diff_export = export - event (tiempo desde evento hasta exportación)
+        if event_time_ms is not None:
+            diff_export_ms = export_time_ms - event_time_ms
+        else:
+            diff_export_ms = 0  # Si no hay event_time, export es T=0
+        
+        # diff_read = read - export (tiempo de lectura del spool)
+        if read_time_ms is not None:
+            diff_read_ms = read_time_ms - export_time_ms
+        
+        # diff_distribute = distribute - export (tiempo hasta distribución)
+        if distribute_time_ms is not None:
+            diff_distribute_ms = distribute_time_ms - export_time_ms
+        
+        # diff_worker = worker - export (tiempo hasta ejecución en worker)
+        if worker_timestamp_ms is not None:
+            diff_worker_ms = worker_timestamp_ms - export_time_ms
+    
+    # total_ms = tiempo end-to-end desde export hasta worker
+    total_ms = diff_worker_ms if diff_worker_ms is not None else diff_distribute_ms
+    
+    diff_export_ms = clamp_negative(diff_export_ms)
+    diff_read_ms = clamp_negative(diff_read_ms)
+    diff_distribute_ms = clamp_negative(diff_distribute_ms)
+    diff_worker_ms = clamp_negative(diff_worker_ms)
+    total_ms = clamp_negative(total_ms)
+    
+    return {
+        "export": diff_export_ms,
+        "read": diff_read_ms,
+        "distribute": diff_distribute_ms,
+        "worker": diff_worker_ms,
+        "total": total_ms,
+    }
+
+
+def build_traceability_row(key: str, master_info: Dict[str, str], worker_timestamp: str,
+                           clocks: Optional[ClockOffsetEstimator] = None) -> str:
+    """Construye una línea de trazabilidad.txt para un ticket_event."""
+    event_time = master_info.get("event_time", "")
+    export_time = master_info.get("export_time", "")
+    read_time = master_info.get("read_time", "")
+    distribute_time = master_info.get("distribute_time", "")
+    d = compute_stage_diffs(master_info, worker_timestamp, clocks)
+    return f"{key}|{event_time}|{export_time}|{read_time}|{distribute_time}|{worker_timestamp}|{format_diff(d['export'])}|{format_diff(d['read'])}|{format_diff(d['distribute'])}|{format_diff(d['worker'])}|{format_diff(d['total'])}\n"
+
+
+# ============================================================================
+# RUTA COLUMNAR (NumPy)
+# ============================================================================
+
+NA_MS = -(2 ** 63)  # Centinela int64 para timestamp ausente/inválido
+
+
+def _import_numpy():
+    try:
+        import numpy as np
+    except ImportError as e:
+        raise RuntimeError("Falta dependencia: pip install numpy") from e
+    return np
+
+
+def timestamps_to_ms_array(values: List[str]):
+    """
+    Equivalente vectorizado de timestamp_to_ms() para una columna completa.
+    Retorna array int64 con NA_MS donde el valor no es convertible.
+    - Numérico: ms (o segundos si < 1e9, igual que timestamp_to_ms)
+    - YYYY.MM.DD HH:MM:SS[.mmm]: hora local del PC (igual que datetime.timestamp())
+    """
+    np = _import_numpy()
+    # Caso habitual: columna entera de ms epoch -> una sola pasada en C
+    try:
+        ms = np.fromiter(map(int, values), dtype=np.int64, count=len(values))
+        return np.where(ms < 1_000_000_000, ms * 1000, ms)
+    except ValueError:
+        pass
+
+    arr = np.char.strip(np.asarray(values, dtype=str))
+    out = np.full(arr.shape, NA_MS, dtype=np.int64)
+    if arr.size == 0:
+        return out
+
+    # Numéricos: dígitos con como mucho un punto decimal
+    numeric = (arr != "") & np.char.isdigit(np.char.replace(arr, ".", "", count=1))
+    if numeric.any():
+        ms = arr[numeric].astype(np.float64).astype(np.int64)
+        out[numeric] = np.where(ms < 1_000_000_000, ms * 1000, ms)
+
+    # Fechas MT4: 'YYYY.MM.DD HH:MM:SS[.mmm]' -> ISO -> datetime64 (se interpreta como hora local)
+    dated = (arr != "") & ~numeric & (np.char.str_len(arr) >= 19)
+    if dated.any():
+        sub = arr[dated]
+        iso = np.char.add(np.char.add(np.char.replace(sub.astype("U10"), ".", "-"), "T"), np.char.partition(sub, " ")[:, 2])
+        try:
+            naive_ms = iso.astype("datetime64[ms]").astype(np.int64)
+            ok = np.ones(naive_ms.shape, dtype=bool)
+        except ValueError:
+            # Algún valor no cumple el formato: convertir este subconjunto valor a valor
+            conv = [timestamp_to_ms(v) for v in sub.tolist()]
+            ok = np.array([c is not None for c in conv], dtype=bool)
+            out_sub = np.full(sub.shape, NA_MS, dtype=np.int64)
+            out_sub[ok] = [c for c in conv if c is not None]
+            out[dated] = out_sub
+        else:
+            # Offset local por hora distinta (pocas): naive -> epoch con mktime, como datetime.timestamp()
+            hours = naive_ms // 3_600_000
+            uniq, inv = np.unique(hours, return_inverse=True)
+            offsets = np.array(
+                [int(time.mktime(time.gmtime(int(h) * 3600)[:8] + (-1,))) * 1000 - int(h) * 3_600_000 for h in uniq],
+                dtype=np.int64,
+            )
+            out[dated] = naive_ms + offsets[inv.reshape(-1)]
+    return out
+
+
+def _nearest_hour_offset_ms_array(delta_ms, valid, max_jitter_ms: int = 120_000):
+    """Versión vectorizada de _nearest_hour_offset_ms: offset a restar (0 si no aplica)."""
+    np = _import_numpy()
+    hour_ms = 3_600_000
+    k = np.rint(np.where(valid, delta_ms, 0) / hour_ms).astype(np.int64)
+    candidate = k * hour_ms
+    apply = valid & (k != 0) & (np.abs(np.where(valid, delta_ms, 0) - candidate) <= max_jitter_ms)
+    return np.where(apply, candidate, 0)
+
+
+_MEDIAN_CHUNK = 2048  # Ventanas por bloque en _rolling_median_array (~8 MB con ventana 501)
+
+
+def _rolling_median_array(clocks: ClockOffsetEstimator, source: str, lags, zones=()):
+    """
+    Mediana móvil tras cada lag de `lags` (como observe() + median_lag_ms() en bucle): NA_MS
+    mientras no hay min_samples. Deja el estimador con la ventana final.
+
+    zones: intervalos (lo, hi, rep), hi None = sin límite. Si la mediana de una ventana cae en
+    uno se devuelve rep sin ordenar nada: basta contar con sumas acumuladas cuántos lags de la
+    ventana quedan por debajo de cada límite. Solo las demás ventanas se resuelven con
+    np.partition sobre sliding_window_view, por bloques.
+    """
+    np = _import_numpy()
+    window = clocks.window
+    prev = clocks.sources[source].values() if source in clocks.sources else []
+    n_prev = len(prev)
+    full = np.concatenate([np.array(prev, dtype=np.int64), lags])
+    pos = np.arange(n_prev, len(full))       # Posición de cada lag nuevo en full
+    size = np.minimum(pos + 1, window)       # Muestras en la ventana tras observarlo
+    half = size // 2
+    out = np.full(len(lags), NA_MS, dtype=np.int64)
+    pending = size >= clocks.min_samples
+
+    def below(limit):
+        acc = np.concatenate([[0], np.cumsum(full < limit)])
+        return acc[pos + 1] - acc[np.maximum(pos + 1 - window, 0)]
+
+    for lo, hi, rep in zones:
+        # mediana = ordenados[half]: >= lo si como mucho half lags < lo; <= hi si más de half <= hi
+        inside = pending & (below(lo) <= half)
+        if hi is not None:
+            inside &= below(hi + 1) > half
+        out[inside] = rep
+        pending &= ~inside
+
+    idx = np.flatnonzero(pending)
+    for i in idx[pos[idx] < window - 1].tolist():  # Ventana aún incompleta: pocas, una a una
+        s = n_prev + i + 1
+        out[i] = np.partition(full[:s], s // 2)[s // 2]
+    idx = idx[pos[idx] >= window - 1]
+    if len(idx):
+        windows = np.lib.stride_tricks.sliding_window_view(full, window)
+        for a in range(0, len(idx), _MEDIAN_CHUNK):
+            chunk = idx[a:a + _MEDIAN_CHUNK]
+            out[chunk] = np.partition(windows[pos[chunk] - window + 1], window // 2, axis=1)[:, window // 2]
+    for lag in lags[-window:].tolist():
+        clocks.observe(source, lag)
+    return out
+
+
+def _clock_correction_array(lag_ms, valid, clocks: ClockOffsetEstimator, source: str, per_row: bool = True):
+    """
+    Versión por columna de _clock_correction (per_row=True) o de observe() + correction_ms() sin
+    la fila (per_row=False, se rellenan también las filas sin lag). La mediana móvil se calcula
+    una vez por lag válido (_rolling_median_array) y se reparte a las filas por su posición en la
+    secuencia de lags: mismo resultado que recorrer las filas en orden.
+    """
+    np = _import_numpy()
+    hour_ms, jitter_ms, tol_ms = 3_600_000, 120_000, clocks.tolerance_ms
+    before = clocks.correction_ms(source)
+    lags = lag_ms[valid]
+    k = np.rint(lags / hour_ms).astype(np.int64)
+    # Zonas donde la corrección no depende del valor exacto de la mediana (residual sin skew):
+    # [-tol, media hora) -> 0 y, fuera de EPOCH_SOURCES, [kH - tol, kH + jitter] -> kH
+    if source in clocks.epoch_sources:
+        zones = [(-tol_ms, None, 0)]
+    else:
+        zones = [(-tol_ms, hour_ms // 2 - 1, 0)]
+        zones += [(h * hour_ms - tol_ms, h * hour_ms + jitter_ms, h * hour_ms) for h in np.unique(k).tolist() if h != 0]
+    median = _rolling_median_array(clocks, source, lags, zones)
+    has = median != NA_MS
+    if source in clocks.epoch_sources:
+        hours = np.zeros(len(lags), dtype=np.int64)
+    else:
+        hours = _nearest_hour_offset_ms_array(median, has)
+    residual = median - hours
+    skew = np.where(has & (residual >= -clocks.max_skew_ms) & (residual < -tol_ms), residual, 0)
+    if not per_row:
+        seen = np.cumsum(valid)
+        if not len(lags):
+            return np.full(len(lag_ms), before, dtype=np.int64)
+        return np.where(seen > 0, -(hours + skew)[np.maximum(seen - 1, 0)], before)
+    if source not in clocks.epoch_sources:
+        # Horas de la propia fila si está cerca de una hora exacta (a menos de media hora: 0)
+        row_hours = k * hour_ms
+        hours = np.where((k == 0) | (np.abs(lags - row_hours) <= jitter_ms), row_hours, hours)
+    out = np.zeros(len(lag_ms), dtype=np.int64)
+    out[valid] = -(hours + skew)
+    return out
+
+
+_MS_LABELS = None  # Tabla 'Nms' para -999..999 (se construye al primer uso)
+
+
+def format_diff_array(diff, valid):
+    """
+    Versión vectorizada de format_diff: lista de strings ('N/A', 'Nms', 'Ns', 'N.NNs').
+    La clasificación y la aritmética van en arrays; cada categoría se formatea en bloque.
+    """
+    global _MS_LABELS
+    np = _import_numpy()
+    if _MS_LABELS is None:
+        _MS_LABELS = np.array([f"{v}ms" for v in range(-999, 1000)], dtype=object)
+    out = np.full(diff.shape, "N/A", dtype=object)
+    small = valid & (np.abs(diff) < 1000)
+    whole = valid & ~small & (diff % 1000 == 0)
+    frac = valid & ~small & ~whole
+    if small.any():
+        out[small] = _MS_LABELS[diff[small] + 999]
+    if whole.any():
+        out[whole] = [f"{v}s" for v in (diff[whole] // 1000).tolist()]
+    if frac.any():
+        out[frac] = [f"{v:.2f}s" for v in (diff[frac] / 1000.0).tolist()]
+    return out.tolist()
+
+
+def build_traceability_rows_columnar(keys: List[str], master_infos: List[Dict[str, str]], worker_timestamps: List[str],
+                                     clocks: Optional[ClockOffsetEstimator] = None) -> str:
+    """
+    Igual que build_traceability_row() aplicado a todas las filas, pero en bloque.
+    Retorna el texto de todas las filas (sin header), en el orden recibido.
+    """
+    np = _import_numpy()
+    n = len(keys)
+    if n == 0:
+        return ""
+
+    cols = {name: [m.get(name, "") for m in master_infos] for name in ("event_time", "export_time", "read_time", "distribute_time")}
+    event = timestamps_to_ms_array(cols["event_time"])
+    export = timestamps_to_ms_array(cols["export_time"])
+    read = timestamps_to_ms_array(cols["read_time"])
+    distribute = timestamps_to_ms_array(cols["distribute_time"])
+    worker = timestamps_to_ms_array(worker_timestamps)
+
+    has_event, has_export, has_read = event != NA_MS, export != NA_MS, read != NA_MS
+    has_distribute, has_worker = distribute != NA_MS, worker != NA_MS
+
+    # Normalización de relojes (ver compute_stage_diffs)
+    both = has_event & has_export
+    if clocks is None:
+        event = event - _nearest_hour_offset_ms_array(event - np.where(both, export, 0), both)
+    else:
+        event = event - _clock_correction_array(export - event, both, clocks, "servidor")
+        extractor = _clock_correction_array(read - export, has_read & has_export, clocks, "extractor", per_row=False)
+    both = has_worker & has_distribute
+    if clocks is None:
+        worker = worker - _nearest_hour_offset_ms_array(worker - np.where(both, distribute, 0), both)
+    else:
+        read, distribute = read + extractor, distribute + extractor
+        worker = worker + _clock_correction_array(worker - distribute, both, clocks, "worker")
+
+    # Diferencias respecto a export_time (solo si hay export_time)
+    diff_export = np.where(has_event, export - event, 0)
+    v_export = has_export
+    diff_read, v_read = read - export, has_export & has_read
+    diff_distribute, v_distribute = distribute - export, has_export & has_distribute
+    diff_worker, v_worker = worker - export, has_export & has_worker
+    total = np.where(v_worker, diff_worker, diff_distribute)
+    v_total = v_worker | v_distribute
+
+    def clamp(diff):
+        return np.where((diff < 0) & (diff > -1000), 0, diff)
+
+    columns = [
+        keys,
+        cols["event_time"],
+        cols["export_time"],
+        cols["read_time"],
+        cols["distribute_time"],
+        worker_timestamps,
+        format_diff_array(clamp(diff_export), v_export),
+        format_diff_array(clamp(diff_read), v_read),
+        format_diff_array(clamp(diff_distribute), v_distribute),
+        format_diff_array(clamp(diff_worker), v_worker),
+        format_diff_array(clamp(total), v_total),
+    ]
+    return "\n".join(map("|".join, zip(*columns))) + "\n"
+
+
+def build_worker_latency_matrix(master_infos: List[Dict[str, str]], worker_columns: List[List[str]],
+                                clocks: Optional[ClockOffsetEstimator] = None):
+    """
+    Matriz ticket x worker (int64, NA_MS si el worker no ejecutó) con la latencia export -> worker
+    de cada cuenta, normalizada y con clamp igual que diff_worker_ms en build_traceability_row con
+    la columna de ese worker. worker_columns: una lista de worker_timestamp (str) por worker,
+    alineada con master_infos.
+    clocks: estimador del master (se alimenta aquí la fuente extractor, como compute_stage_diffs);
+    la fuente worker usa un estimador propio por worker. Sin clocks solo se corrigen las horas
+    exactas de cada fila.
+    """
+    np = _import_numpy()
+    n, w = len(master_infos), len(worker_columns)
+    matrix = np.full((n, w), NA_MS, dtype=np.int64)
+    if n == 0 or w == 0:
+        return matrix
+
+    export = timestamps_to_ms_array([m.get("export_time", "") for m in master_infos])
+    distribute = timestamps_to_ms_array([m.get("distribute_time", "") for m in master_infos])
+    has_export, has_distribute = export != NA_MS, distribute != NA_MS
+    if clocks is not None:
+        read = timestamps_to_ms_array([m.get("read_time", "") for m in master_infos])
+        extractor = _clock_correction_array(read - export, (read != NA_MS) & has_export, clocks, "extractor", per_row=False)
+        distribute = np.where(has_distribute, distribute + extractor, NA_MS)
+
+    for j, column in enumerate(worker_columns):
+        worker = timestamps_to_ms_array(column)
+        has_worker = worker != NA_MS
+        both = has_worker & has_distribute
+        if clocks is None:
+            worker = worker - _nearest_hour_offset_ms_array(worker - np.where(both, distribute, 0), both)
+        else:
+            worker = worker + _clock_correction_array(worker - distribute, both, ClockOffsetEstimator(), "worker")
+        lat = worker - export
+        lat = np.where((lat < 0) & (lat > -1000), 0, lat)
+        matrix[:, j] = np.where(has_worker & has_export, lat, NA_MS)
+    return matrix
+
+
+def worker_spread(matrix):
+    """
+    Por fila: (workers con dato, dispersión max - min, índice del worker más lento).
+    Dispersión e índice valen NA_MS / -1 si hay menos de 2 workers con dato.
+    """
+    np = _import_numpy()
+    valid = matrix != NA_MS
+    done = valid.sum(axis=1)
+    hi = np.where(valid, matrix, np.iinfo(np.int64).min)
+    lo = np.where(valid, matrix, np.iinfo(np.int64).max)
+    multi = done >= 2
+    spread = np.where(multi, hi.max(axis=1, initial=np.iinfo(np.int64).min) - lo.min(axis=1, initial=np.iinfo(np.int64).max), NA_MS)
+    straggler = np.where(multi, hi.argmax(axis=1) if matrix.shape[1] else 0, -1)
+    return done, spread, straggler
+
+
+def _find_config_path(common_dir: Path) -> Path:
+    """El config suele vivir en el repo (Produccion/V2/distribuidor_config.txt)."""
     config_candidates = [
         common_dir / "PROD" / "Phoenix" / "V2" / "distribuidor_config.txt",
         Path(__file__).resolve().parent / "distribuidor_config.txt",
     ]
-    config_path = next((p for p in config_candidates if p.exists()), config_candidates[-1])
+    return next((p for p in config_candidates if p.exists()), config_candidates[-1])
+
+
+def _print_clock_offsets(clocks: ClockOffsetEstimator) -> None:
+    """Muestra los desfases de reloj aplicados (solo las fuentes con corrección distinta de 0)."""
+    for source, info in clocks.describe().items():
+        if info["desfase_ms"]:
+            print(f"[INFO] Reloj {source}: desfase {info['desfase_ms']:+d} ms "
+                  f"(mediana lag {info['mediana_lag_ms']} ms, {info['muestras']} muestras)")
+
+
+def generate_traceability(common_dir: Path, output_path: Path, filter_today: bool = False, columnar: bool = False):
+    """Genera archivo de trazabilidad (columnar=True usa la ruta NumPy, mismo resultado)."""
+    prod_phoenix = common_dir / PROD_PHOENIX_DIR
+    hist_master_path = prod_phoenix / HIST_MASTER_FILE
+    
+    config_path = _find_config_path(common_dir)
     
     print(f"[INFO] Leyendo {hist_master_path}")
     master_data = read_master_hist(hist_master_path)
@@ -351,15 +814,15 @@ def generate_traceability(common_dir: Path, output_path: Path, filter_today: boo
         worker_ids = []
     
     # Leer estados de workers (PROD V2 usa estados_WORKER_XXX.csv en lugar de historico_WORKER)
+    # Un archivo por proceso cuando hay varios workers con histórico grande
     all_worker_data = []
-    for worker_id in worker_ids:
-        worker_estados_path = prod_phoenix / f"estados_WORKER_{worker_id}.csv"
-        worker_data = read_worker_estados(worker_estados_path)
+    loaded = load_files(load_worker_timestamps, [prod_phoenix / f"estados_WORKER_{w}.csv" for w in worker_ids])
+    for worker_id, worker_data in zip(worker_ids, loaded):
         if worker_data:
             print(f"[INFO] Worker {worker_id}: {len(worker_data)} eventos completados")
             all_worker_data.append(worker_data)
     
-    # Agregar datos de workers
+    # Agregar datos de workers (ticket_event -> worker_timestamp)
     aggregated_worker_data = aggregate_worker_data(all_worker_data)
     print(f"[INFO] Total eventos agregados de workers: {len(aggregated_worker_data)}")
     
@@ -368,118 +831,377 @@ def generate_traceability(common_dir: Path, output_path: Path, filter_today: boo
     
     with open(output_path, "w", encoding="utf-8") as f:
         # Header adaptado para PROD V2 (solo un timestamp del worker)
-        f.write("ticket_event|event_time|export_time|read_time|distribute_time|worker_timestamp|diff_export_ms|diff_read_ms|diff_distribute_ms|diff_worker_ms|total_ms\n")
+        f.write(TRACEABILITY_HEADER)
         
-        # Escribir todos los eventos del master
-        for key, master_info in sorted(master_data.items()):
-            worker_info = aggregated_worker_data.get(key, {})
-            
-            event_time = master_info.get("event_time", "")
-            export_time = master_info.get("export_time", "")
-            read_time = master_info.get("read_time", "")
-            distribute_time = master_info.get("distribute_time", "")
-            worker_timestamp = worker_info.get("worker_timestamp", "")
-            
-            # Convertir todos los timestamps a milisegundos
-            event_time_ms = timestamp_to_ms(event_time)
-            export_time_ms = timestamp_to_ms(export_time)
-            read_time_ms = timestamp_to_ms(read_time)
-            distribute_time_ms = timestamp_to_ms(distribute_time)
-            worker_timestamp_ms = timestamp_to_ms(worker_timestamp)
-
-            # NORMALIZACIÓN DE ZONAS HORARIAS:
-            # - event_time viene del servidor MT4 (puede ser UTC+2 o UTC+3)
-            # - export/read/distribute vienen de Python/Extractor (hora local del PC)
-            # - worker_timestamp: 
-            #   * Formato antiguo: fecha/hora del servidor MT4 (necesita normalización)
-            #   * Formato nuevo: milisegundos epoch UTC (no necesita normalización)
-            #
-            # Estrategia: usar export_time como referencia (T=0) ya que es el primer
-            # timestamp controlado por nuestro sistema (momento en que Extractor exporta).
-            
-            # Normalizar event_time si hay desfase horario con export_time
-            if event_time_ms is not None and export_time_ms is not None:
-                event_delta = event_time_ms - export_time_ms
-                hour_off = _nearest_hour_offset_ms(event_delta)
-                if hour_off is not None and hour_off != 0:
-                    event_time_ms = event_time_ms - hour_off  # Corregir a zona export_time
-            
-            # Normalizar worker_timestamp SOLO si hay desfase horario significativo
-            # (timestamps en ms epoch UTC no deberían tener desfase de horas)
-            if worker_timestamp_ms is not None and distribute_time_ms is not None:
-                worker_delta = worker_timestamp_ms - distribute_time_ms
-                # Solo normalizar si el desfase es cercano a múltiplos de 1 hora
-                # (indica formato antiguo fecha/hora vs nuevo formato ms epoch)
-                hour_off = _nearest_hour_offset_ms(worker_delta)
-                if hour_off is not None and hour_off != 0:
-                    worker_timestamp_ms = worker_timestamp_ms - hour_off
-            
-            # BASE: usar export_time como T=0 (momento de exportación del evento)
-            base_time_ms = export_time_ms
-            
-            # Calcular diferencias INCREMENTALES (cada paso respecto al anterior)
-            # Flujo: event → export → read → distribute → worker
-            diff_export_ms = None
-            diff_read_ms = None  
-            diff_distribute_ms = None
-            diff_worker_ms = None
-            
-            if export_time_ms is not None:
-                # diff_export = export - event (tiempo desde evento hasta exportación)
-                if event_time_ms is not None:
-                    diff_export_ms = export_time_ms - event_time_ms
-                else:
-                    diff_export_ms = 0  # Si no hay event_time, export es T=0
-                
-                # diff_read = read - export (tiempo de lectura del spool)
-                if read_time_ms is not None:
-                    diff_read_ms = read_time_ms - export_time_ms
-                
-                # diff_distribute = distribute - export (tiempo hasta distribución)
-                if distribute_time_ms is not None:
-                    diff_distribute_ms = distribute_time_ms - export_time_ms
-                
-                # diff_worker = worker - export (tiempo hasta ejecución en worker)
-                if worker_timestamp_ms is not None:
-                    diff_worker_ms = worker_timestamp_ms - export_time_ms
-            
-            # total_ms = tiempo end-to-end desde export hasta worker
-            total_ms = diff_worker_ms if diff_worker_ms is not None else diff_distribute_ms
-            
-            # Corregir valores negativos pequeños (desfase de reloj entre sistemas)
-            # Valores entre -1000ms y 0ms se consideran ~0ms (ejecución casi instantánea)
-            def clamp_negative(val):
-                if val is not None and val < 0:
-                    if val > -1000:  # Pequeño desfase de reloj
-                        return 0
-                    # Valores muy negativos indican error de zona horaria no corregido
-                return val
-            
-            diff_export_ms = clamp_negative(diff_export_ms)
-            diff_read_ms = clamp_negative(diff_read_ms)
-            diff_distribute_ms = clamp_negative(diff_distribute_ms)
-            diff_worker_ms = clamp_negative(diff_worker_ms)
-            total_ms = clamp_negative(total_ms)
-            
-            # Formatear diferencias
-            def format_diff(diff):
-                if diff is None:
-                    return "N/A"
-                if abs(diff) < 1000:
-                    return f"{diff}ms"
-                else:
-                    seconds = diff / 1000.0
-                    if seconds == int(seconds):
-                        return f"{int(seconds)}s"
-                    else:
-                        return f"{seconds:.2f}s"
-            
-            f.write(f"{key}|{event_time}|{export_time}|{read_time}|{distribute_time}|{worker_timestamp}|{format_diff(diff_export_ms)}|{format_diff(diff_read_ms)}|{format_diff(diff_distribute_ms)}|{format_diff(diff_worker_ms)}|{format_diff(total_ms)}\n")
+        # Escribir todos los eventos del master (el estimador de relojes aprende en el mismo orden)
+        clocks = ClockOffsetEstimator()
+        if columnar:
+            keys = sorted(master_data)
+            f.write(build_traceability_rows_columnar(
+                keys,
+                [master_data[k] for k in keys],
+                [aggregated_worker_data.get(k, "") for k in keys],
+                clocks,
+            ))
+        else:
+            for key, master_info in sorted(master_data.items()):
+                f.write(build_traceability_row(key, master_info, aggregated_worker_data.get(key, ""), clocks))
+        _print_clock_offsets(clocks)
     
     print(f"[OK] Trazabilidad generada: {output_path}")
     print(f"[INFO] Total eventos procesados: {len(master_data)}")
 
 
+def generate_traceability_per_worker(common_dir: Path, output_path: Path, filter_today: bool = False):
+    """
+    Genera trazabilidad_workers.txt: una columna de latencia por worker, workers con ejecución,
+    dispersión entre cuentas y straggler. Imprime un resumen por worker.
+    """
+    np = _import_numpy()
+    prod_phoenix = common_dir / PROD_PHOENIX_DIR
+    master_data = read_master_hist(prod_phoenix / HIST_MASTER_FILE)
+    if filter_today:
+        master_data = filter_today_events(master_data)
+    print(f"[INFO] Eventos en Master: {len(master_data)}")
+
+    worker_ids = get_worker_ids_from_config(_find_config_path(common_dir))
+    keys = sorted(master_data)
+    master_infos = [master_data[k] for k in keys]
+    loaded = load_files(load_worker_timestamps, [prod_phoenix / f"estados_WORKER_{w}.csv" for w in worker_ids])
+    worker_columns = [[worker_data.get(k, "") for k in keys] for worker_data in loaded]
+
+    clocks = ClockOffsetEstimator()
+    matrix = build_worker_latency_matrix(master_infos, worker_columns, clocks)
+    _print_clock_offsets(clocks)
+    done, spread, straggler = worker_spread(matrix)
+    valid = matrix != NA_MS
+
+    ids = np.array(worker_ids + ["-"], dtype=object)
+    columns = [keys, [m.get("export_time", "") for m in master_infos]]
+    columns += [format_diff_array(matrix[:, j], valid[:, j]) for j in range(len(worker_ids))]
+    columns += [
+        [f"{d}/{len(worker_ids)}" for d in done.tolist()],
+        format_diff_array(spread, spread != NA_MS),
+        ids[straggler].tolist(),
+    ]
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        header = ["ticket_event", "export_time"] + [f"worker_{w}_ms" for w in worker_ids] + ["workers", "spread_ms", "straggler"]
+        f.write("|".join(header) + "\n")
+        if keys:
+            f.write("\n".join(map("|".join, zip(*columns))) + "\n")
+
+    # Resumen por worker: ejecuciones, latencias y veces que fue el más lento
+    for j, worker_id in enumerate(worker_ids):
+        lat = matrix[valid[:, j], j]
+        if lat.size == 0:
+            print(f"[INFO] Worker {worker_id}: sin ejecuciones")
+            continue
+        p50, p90 = np.percentile(lat, [50, 90]).round().astype(np.int64).tolist()
+        print(f"[INFO] Worker {worker_id}: {lat.size} ejecuciones | p50={format_diff(p50)} "
+              f"p90={format_diff(p90)} max={format_diff(int(lat.max()))} | straggler en {int((straggler == j).sum())} eventos")
+    multi = spread != NA_MS
+    if multi.any():
+        print(f"[INFO] Dispersión entre cuentas: p50={format_diff(int(np.median(spread[multi])))} "
+              f"max={format_diff(int(spread[multi].max()))} ({int(multi.sum())} eventos con 2+ workers)")
+    print(f"[OK] Trazabilidad por worker generada: {output_path}")
+    return matrix
+
+
+# ============================================================================
+# MODO INCREMENTAL
+# ============================================================================
+
+def read_new_lines(path: Path, offset: int, ident: Optional[list] = None) -> Tuple[List[str], int, list]:
+    """
+    Lee las líneas completas añadidas a `path` desde `offset` (bytes).
+    ident: [inode, primeros bytes en hex] devuelto por la lectura anterior. Si el archivo es más
+    pequeño que el offset o se ha reemplazado (otro inode o distinto inicio: purga nocturna
+    seguida de escrituras nuevas), empieza desde 0, igual que TailReader.
+    Soporta UTF-8 (con o sin BOM) y UTF-16 con BOM, igual que _open_text_auto.
+    Retorna (lineas, nuevo_offset, ident). La línea final incompleta se deja para la próxima vez.
+    """
+    if not path.exists():
+        return [], 0, []
+    
+    with open(path, "rb") as bf:
+        first = bf.read(CHECKPOINT_HEAD_BYTES)
+        head = first[:4]
+        size = bf.seek(0, os.SEEK_END)
+        ino = os.fstat(bf.fileno()).st_ino
+        if size < offset or (ident and ((ident[0] and ino and ident[0] != ino) or not first.hex().startswith(ident[1]))):
+            offset = 0
+        ident = [ino, first.hex()]
+        if head.startswith(b"\xff\xfe"):
+            encoding, newline, bom = "utf-16-le", b"\n\x00", 2
+        elif head.startswith(b"\xfe\xff"):
+            encoding, newline, bom = "utf-16-be", b"\x00\n", 2
+        else:
+            encoding, newline, bom = "utf-8", b"\n", 3 if head.startswith(b"\xef\xbb\xbf") else 0
+        if offset < bom:
+            offset = bom
+        bf.seek(offset)
+        data = bf.read(size - offset)
+    
+    end = data.rfind(newline)
+    # En UTF-16 el salto de línea debe caer en una posición par del archivo
+    while end >= 0 and len(newline) == 2 and (offset + end) % 2:
+        end = data.rfind(newline, 0, end)
+    if end < 0:
+        return [], offset, ident
+    
+    complete = data[:end + len(newline)]
+    lines = complete.decode(encoding, errors="replace").splitlines()
+    return lines, offset + len(complete), ident
+
+
+def load_checkpoint(checkpoint_path: Path) -> dict:
+    """Carga el checkpoint incremental (offsets e identidad por archivo, eventos pendientes y ventanas de relojes)."""
+    if checkpoint_path.exists():
+        try:
+            data = json.loads(checkpoint_path.read_text(encoding="utf-8"))
+            data.setdefault("offsets", {})
+            data.setdefault("files", {})
+            data.setdefault("pending", {})
+            data.setdefault("early", {})
+            data.setdefault("done", {})
+            data.setdefault("clocks", {})
+            return data
+        except Exception as exc:
+            print(f"[WARN] Checkpoint ilegible ({exc}), se reconstruye desde cero")
+    return {"offsets": {}, "files": {}, "pending": {}, "early": {}, "done": {}, "clocks": {}}
+
+
+def save_checkpoint(checkpoint_path: Path, checkpoint: dict) -> None:
+    """Guarda el checkpoint de forma atómica (tmp + replace)."""
+    tmp_path = checkpoint_path.with_suffix(checkpoint_path.suffix + ".tmp")
+    tmp_path.write_text(json.dumps(checkpoint, separators=(",", ":")), encoding="utf-8")
+    os.replace(tmp_path, checkpoint_path)
+
+
+def _pending_age_ref_ms(master_info: Dict[str, str]) -> Optional[int]:
+    """Timestamp de referencia para expirar un pendiente (distribute, export o cuándo se leyó)."""
+    return (timestamp_to_ms(master_info.get("distribute_time", ""))
+            or timestamp_to_ms(master_info.get("export_time", ""))
+            or timestamp_to_ms(master_info.get("_seen_ms", "")))
+
+
+def generate_traceability_incremental(common_dir: Path, output_path: Path, checkpoint_path: Optional[Path] = None) -> int:
+    """
+    Procesa solo las filas nuevas de Historico_Master.csv y de los estados_WORKER_XXX.csv
+    desde el último checkpoint y AÑADE a output_path las filas finalizadas:
+    - un ticket_event se finaliza con el primer worker que lo completa (igual que aggregate_worker_data)
+    - si ningún worker lo completa en PENDING_MAX_AGE_HOURS se escribe con worker N/A
+    - un completado leído antes que su fila del master (se escriben en ficheros distintos) se
+      guarda en "early" y se empareja cuando llega la fila; "done" recuerda los ya escritos para
+      ignorar los completados de los demás workers. Ambos caducan a las PENDING_MAX_AGE_HOURS.
+    - las ventanas del ClockOffsetEstimator se guardan en el checkpoint ("clocks"), así la mediana
+      móvil continúa entre ejecuciones en lugar de empezar sin corrección cada vez
+    Retorna el número de filas añadidas.
+    """
+    prod_phoenix = common_dir / PROD_PHOENIX_DIR
+    hist_master_path = prod_phoenix / HIST_MASTER_FILE
+    checkpoint_path = checkpoint_path or prod_phoenix / CHECKPOINT_FILE
+    config_path = _find_config_path(common_dir)
+    
+    checkpoint = load_checkpoint(checkpoint_path)
+    offsets: Dict[str, int] = checkpoint["offsets"]
+    files: Dict[str, list] = checkpoint["files"]   # archivo -> [inode, inicio en hex] (detecta reemplazo)
+    # Sin checkpoint se relee todo desde 0: el output (p.ej. de un modo completo anterior) se
+    # reescribe en lugar de añadir filas que ya tiene
+    fresh = not offsets
+    pending: Dict[str, Dict[str, str]] = checkpoint["pending"]
+    early: Dict[str, list] = checkpoint["early"]   # ticket_event -> [worker_timestamp, ms en que se leyó]
+    done: Dict[str, int] = checkpoint["done"]      # ticket_event ya escrito -> ms en que se escribió
+    now_ms = int(time.time() * 1000)
+    finalized: List[str] = []
+    clocks = ClockOffsetEstimator()
+    clocks.restore(checkpoint["clocks"])
+
+    def finalize(key: str, master_info: Dict[str, str], worker_timestamp: str) -> None:
+        master_info.pop("_seen_ms", None)
+        finalized.append(build_traceability_row(key, master_info, worker_timestamp, clocks))
+        done[key] = now_ms
+    
+    # 1. Nuevas filas del master -> pendientes de worker (o finalizadas si el worker llegó antes)
+    lines, offsets[HIST_MASTER_FILE], files[HIST_MASTER_FILE] = read_new_lines(
+        hist_master_path, offsets.get(HIST_MASTER_FILE, 0), files.get(HIST_MASTER_FILE))
+    new_master = 0
+    for line in lines:
+        if "event_type" in line.lower():
+            continue
+        parsed = parse_hist_master_line(line)
+        if not parsed or not parsed.get("ticket") or not parsed.get("event_type"):
+            continue
+        key = f"{parsed['ticket']}_{parsed['event_type']}"
+        new_master += 1
+        if key in done:
+            continue  # Fila repetida de un evento ya escrito
+        if key in early:
+            finalize(key, parsed, early.pop(key)[0])
+        else:
+            parsed["_seen_ms"] = str(now_ms)  # Referencia de caducidad si no trae timestamps
+            pending[key] = parsed
+    
+    # 2. Nuevas ejecuciones de workers -> finalizar pendientes
+    for worker_id in get_worker_ids_from_config(config_path):
+        name = f"estados_WORKER_{worker_id}.csv"
+        lines, offsets[name], files[name] = read_new_lines(prod_phoenix / name, offsets.get(name, 0), files.get(name))
+        for line in lines:
+            parsed = parse_worker_estados_line(line)
+            if not parsed or not parsed.get("ticket") or not parsed.get("event_type"):
+                continue
+            key = f"{parsed['ticket']}_{parsed['event_type']}"
+            worker_timestamp = parsed.get("worker_timestamp", "")
+            master_info = pending.pop(key, None)
+            if master_info is not None:
+                finalize(key, master_info, worker_timestamp)
+            elif key not in done and key not in early:
+                early[key] = [worker_timestamp, now_ms]
+    
+    # 3. Expirar pendientes demasiado antiguos (y los completados sin master / ya escritos)
+    limit_ms = now_ms - PENDING_MAX_AGE_HOURS * 3_600_000
+    for key in [k for k, info in pending.items() if (_pending_age_ref_ms(info) or now_ms) < limit_ms]:
+        finalize(key, pending.pop(key), "")
+    for key in [k for k, e in early.items() if e[1] < limit_ms]:
+        del early[key]
+    for key in [k for k, ref in done.items() if ref < limit_ms]:
+        del done[key]
+    
+    # 4. Append de filas finalizadas (header solo si el archivo es nuevo o se reescribe)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    if fresh and output_path.exists() and output_path.stat().st_size:
+        print(f"[INFO] Sin checkpoint: se reescribe {output_path}")
+    write_header = fresh or not output_path.exists() or output_path.stat().st_size == 0
+    with open(output_path, "w" if fresh else "a", encoding="utf-8") as f:
+        if write_header:
+            f.write(TRACEABILITY_HEADER)
+        f.writelines(finalized)
+    
+    checkpoint["clocks"] = clocks.window_state()
+    save_checkpoint(checkpoint_path, checkpoint)
+    print(f"[OK] Incremental: {new_master} eventos nuevos en Master, {len(finalized)} filas añadidas, "
+          f"{len(pending)} pendientes, {len(early)} completados sin fila de master")
+    return len(finalized)
+
+
+# ============================================================================
+# RESUMEN DE PERCENTILES
+# ============================================================================
+
+class LatencySummary:
+    """
+    Percentiles por (dimensión, grupo, etapa) con QuantileSketch (error relativo ~2%, tamaño
+    acotado por serie aunque crezca el número de valores) + conteo y máximo exactos. Los
+    negativos (desfase horario no corregido) no entran en los percentiles: se cuentan aparte.
+    """
+
+    def __init__(self):
+        self.series: Dict[Tuple[str, str, str], list] = {}  # -> [sketch, n, max, negativos]
+
+    def add(self, dims: List[Tuple[str, str]], stage: str, value: Optional[int]) -> None:
+        if value is None:
+            return
+        for dimension, group in dims:
+            key = (dimension, group, stage)
+            entry = self.series.get(key)
+            if entry is None:
+                entry = [QuantileSketch(), 0, None, 0]
+                self.series[key] = entry
+            if value < 0:
+                entry[3] += 1
+                continue
+            entry[0].add(value)
+            entry[1] += 1
+            entry[2] = value if entry[2] is None else max(entry[2], value)
+
+    def rows(self) -> List[str]:
+        def order(key):
+            dimension, group, stage = key
+            dim_rank = ("global", "worker", "event_type", "hora").index(dimension)
+            group_key = int(group) if dimension == "hora" else group
+            return (dim_rank, group_key, STAGES.index(stage))
+
+        out = []
+        for key in sorted(self.series, key=order):
+            sketch, n, max_v, negatives = self.series[key]
+            # El sketch devuelve el punto medio del bucket: se acota al máximo exacto
+            quantiles = [min(sketch.quantile(q), max_v) if n else None for q in (0.5, 0.9, 0.99)]
+            cells = [format_diff(int(round(v))) if v is not None else "N/A" for v in quantiles]
+            out.append("|".join([*key, str(n), *cells, format_diff(max_v), str(negatives)]) + "\n")
+        return out
+
+
+def _event_hour(master_info: Dict[str, str]) -> Optional[str]:
+    export_ms = timestamp_to_ms(master_info.get("export_time", ""))
+    if export_ms is None:
+        return None
+    return f"{datetime.fromtimestamp(export_ms / 1000).hour:02d}"
+
+
+def generate_latency_summary(common_dir: Path, output_path: Path, filter_today: bool = False) -> LatencySummary:
+    """
+    Genera latencias_resumen.txt. Las etapas export/read/distribute salen del master (una vez
+    por evento); worker/total salen de cada ejecución de cada worker. Los estados se recorren
+    línea a línea, un worker cada vez; lo que crece con el histórico es el índice del master
+    para el join (una entrada por evento) y el conjunto de eventos ya vistos de cada worker.
+    """
+    prod_phoenix = common_dir / PROD_PHOENIX_DIR
+    master_data = read_master_hist(prod_phoenix / HIST_MASTER_FILE)
+    if filter_today:
+        master_data = filter_today_events(master_data)
+    print(f"[INFO] Eventos en Master: {len(master_data)}")
+
+    summary = LatencySummary()
+    hours: Dict[str, Optional[str]] = {}
+    clocks = ClockOffsetEstimator()
+    for key, master_info in master_data.items():
+        diffs = compute_stage_diffs(master_info, "", clocks)
+        hour = hours[key] = _event_hour(master_info)
+        dims = [("global", "*"), ("event_type", master_info["event_type"])]
+        if hour is not None:
+            dims.append(("hora", hour))
+        for stage in ("export", "read", "distribute"):
+            summary.add(dims, stage, diffs[stage])
+
+    for worker_id in get_worker_ids_from_config(_find_config_path(common_dir)):
+        estados_path = prod_phoenix / f"estados_WORKER_{worker_id}.csv"
+        if not estados_path.exists():
+            continue
+        seen = set()  # Primer estado completado por ticket_event (igual que read_worker_estados)
+        executions = 0
+        worker_clocks = ClockOffsetEstimator()  # Cada worker tiene su propio reloj
+        try:
+            with _open_text_auto(estados_path) as f:
+                for line in f:
+                    parsed = parse_worker_estados_line(line)
+                    if not parsed:
+                        continue
+                    key = f"{parsed['ticket']}_{parsed['event_type']}"
+                    master_info = master_data.get(key)
+                    if master_info is None or key in seen:
+                        continue
+                    seen.add(key)
+                    executions += 1
+                    diffs = compute_stage_diffs(master_info, parsed.get("worker_timestamp", ""), worker_clocks)
+                    dims = [("global", "*"), ("worker", worker_id), ("event_type", master_info["event_type"])]
+                    if hours.get(key) is not None:
+                        dims.append(("hora", hours[key]))
+                    for stage in ("worker", "total"):
+                        summary.add(dims, stage, diffs[stage])
+        except Exception as exc:
+            print(f"[ERROR] Error leyendo {estados_path}: {exc}")
+        print(f"[INFO] Worker {worker_id}: {executions} ejecuciones")
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write("dimension|grupo|etapa|n|p50|p90|p99|max|negativos\n")
+        f.writelines(summary.rows())
+    print(f"[OK] Resumen de latencias generado: {output_path}")
+    return summary
+
+
 def main():
     """Función principal."""
     common_dir = get_common_files_dir()
@@ -490,13 +1212,29 @@ def main():
     print(f"[INIT] Common dir: {common_dir}")
     print(f"[INIT] Phoenix dir: {prod_phoenix}")
     print(f"[INIT] Output: {output_path}")
+    
+    if "--incremental" in sys.argv:
+        generate_traceability_incremental(common_dir, output_path)
+        return
+    
+    if "--por-worker" in sys.argv:
+        generate_traceability_per_worker(common_dir, prod_phoenix / PER_WORKER_FILE, filter_today="--hoy" in sys.argv)
+        return
+    
+    if "--resumen" in sys.argv:
+        generate_latency_summary(common_dir, prod_phoenix / SUMMARY_FILE, filter_today="--hoy" in sys.argv)
+        return
+    
     print("\nOpciones:")
     print("1. Calcular diferencia hoy (solo operaciones de hoy)")
     print("2. Calcular diferencias histórico (todas las operaciones)")
+    print("3. Incremental (solo eventos nuevos desde la última ejecución)")
+    print("4. Resumen de percentiles por etapa/worker/evento/hora")
+    print("5. Por worker (latencia de cada cuenta, dispersión y straggler)")
     
     while True:
         try:
-            opcion = input("\nSeleccione opción (1 o 2): ").strip()
+            opcion = input("\nSeleccione opción (1-5): ").strip()
             if opcion == "1":
                 filter_today = True
                 print("[INFO] Modo: Solo eventos de hoy")
@@ -505,14 +1243,26 @@ def main():
                 filter_today = False
                 print("[INFO] Modo: Histórico completo")
                 break
+            elif opcion == "3":
+                print("[INFO] Modo: Incremental")
+                generate_traceability_incremental(common_dir, output_path)
+                return
+            elif opcion == "4":
+                print("[INFO] Modo: Resumen de percentiles")
+                generate_latency_summary(common_dir, prod_phoenix / SUMMARY_FILE)
+                return
+            elif opcion == "5":
+                print("[INFO] Modo: Por worker")
+                generate_traceability_per_worker(common_dir, prod_phoenix / PER_WORKER_FILE)
+                return
             else:
-                print("[ERROR] Por favor seleccione 1 o 2")
+                print("[ERROR] Por favor seleccione una opción entre 1 y 5")
         except (EOFError, KeyboardInterrupt):
             print("\n[INFO] Usando opción por defecto: Histórico completo")
             filter_today = False
             break
     
-    generate_traceability(common_dir, output_path, filter_today)
+    generate_traceability(common_dir, output_path, filter_today, columnar="--numpy" in sys.argv)
 
 
 if __name__ == "__main__":
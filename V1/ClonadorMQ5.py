@@ -6,20 +6,37 @@ Lee TradeEvents.txt desde Common\\Files y clona operaciones OPEN/CLOSE/MODIFY
 Equivalente funcional a ClonadorOrdenes.mq5 pero ejecutándose como script Python
 """
 
+import atexit
 import os
+import re
 import time
 import csv
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from typing import Optional
 from io import StringIO
 from datetime import datetime, timedelta
 
-import MetaTrader5 as mt5
+try:
+    import MetaTrader5 as mt5
+except ImportError:  # Sin terminal (Linux, benchmarks): set_backend() con broker_sim.SimBroker
+    mt5 = None
 
 # ========= CONFIG (equivalentes a Inputs) =========
 CSV_NAME = "TradeEvents.txt"     # en Common\\Files
 CSV_HISTORICO = "TradeEvents_historico.txt"  # Archivo TXT histórico de ejecuciones exitosas
+HISTORY_HEADER = "timestamp_ejecucion;resultado;event_type;ticket;order_type;lots;symbol;open_price;open_time;sl;tp;close_price;close_time;profit"
+QUEUE_STATE_SUFFIX = "_estado.txt"  # TradeEvents.txt -> TradeEvents_estado.txt (offset y pendientes)
+QUEUE_HEAD_BYTES = 64             # Inicio del fichero guardado en el estado (detecta si se recreó)
+QUEUE_REPLAY_FROM_START = False   # Sin estado de cola: True relee TradeEvents.txt entero, False empieza al final
+QUEUE_LEGACY_MAX_BYTES = 65536    # Sin estado y fichero menor: cola del clonador anterior (solo pendientes), se lee entera
 NOTIFICATION_FILE = "NotificationQueue.txt"  # Archivo de cola para notificaciones push (leído por EnviarNotificacion.mq5)
+NOTIFY_INTERVAL_SECONDS = 1.0     # El notificador escribe como mucho una vez por intervalo
+NOTIFY_MAX_CHARS = 255            # Límite de SendNotification() (EnviarNotificacion envía el fichero entero)
+NOTIFY_MAX_QUEUE = 500            # Mensajes en memoria como máximo (se descartan los más antiguos)
+NOTIFY_PENDING_SUFFIX = "_pendientes.txt"  # NotificationQueue_pendientes.txt: cola no enviada al cerrar
 TIMER_SECONDS = 1
 SLIPPAGE_POINTS = 30
 
@@ -28,12 +45,29 @@ FIXED_LOTS = 0.10                 # lote fijo si NO es fondeo
 MAGIC = 0
 # Multiplicador de lotaje (se establece al inicio si CUENTA_FONDEO = True)
 LOT_MULTIPLIER = 1.0              # Por defecto 1x, se configura al inicio
+EXEC_WORKERS = 4                  # Tickets maestros distintos ejecutados a la vez (1 = secuencial)
 # ================================================
 
 # Sets para rastrear tickets ya notificados (evitar duplicados en reintentos)
 notified_close_tickets: set[str] = set()   # Tickets de CLOSE ya notificados
 notified_modify_tickets: set[str] = set()   # Tickets de MODIFY ya notificados
 
+# ========= CACHÉS (menos llamadas IPC a MT5 por ciclo) =========
+CONNECTION_CHECK_SECONDS = 1.0    # terminal_info() como mucho una vez por intervalo
+POSITIONS_MAX_AGE_SECONDS = 1.0   # Antes de dar una posición por inexistente, releer si la foto es más vieja
+HISTORY_DAYS = 90                 # Carga inicial del índice de historial
+HISTORY_SYNC_MARGIN = timedelta(days=1)  # Solape/margen de cada sync (hora servidor != hora local)
+HISTORY_MISS_SYNC_SECONDS = 5.0   # Una búsqueda sin resultado solo re-sincroniza si la última sync es más vieja
+
+_last_connection_ok = 0.0          # time.monotonic() del último terminal_info() correcto
+_selected_symbols: set[str] = set()  # Símbolos ya seleccionados en Market Watch
+_common_files_dir: Optional[str] = None  # <commondata_path>\\Files (no cambia con el terminal abierto)
+
+# ========= CONCURRENCIA (ver dispatch_events) =========
+_connection_lock = threading.Lock()  # Una sola verificación/reconexión a la vez
+_connection_lost = False             # Se perdió la conexión: invalidar la foto al soltar _connection_lock
+_executor: Optional[ThreadPoolExecutor] = None
+
 @dataclass
 class Ev:
     event_type: str
@@ -43,6 +77,7 @@ class Ev:
     symbol: str
     sl: float
     tp: float
+    replayed: bool = False  # Leído al releer TradeEvents.txt: puede estar ya ejecutado
 
 def upper(s: str) -> str:
     return (s or "").strip().upper()
@@ -78,10 +113,51 @@ def compute_slave_lots(symbol: str, master_lots: float) -> float:
     lot_digits = max(2, d)
     return round(lots, lot_digits)
 
-def ensure_mt5_connection():
-    """Verifica la conexión con MT5 y reconecta si es necesario"""
+def set_backend(backend):
+    """
+    Sustituye el módulo MetaTrader5 por otro backend con la misma API (broker_sim.BROKER_API),
+    p.ej. broker_sim.SimBroker, y vacía las cachés ligadas al terminal anterior.
+    """
+    global mt5, _last_connection_ok, _common_files_dir, history, history_log, notifier
+    import broker_sim
+    broker_sim.check_backend(backend)
+    history_log.close()
+    notifier.close()
+    mt5 = backend
+    _last_connection_ok = 0.0
+    _common_files_dir = None
+    _selected_symbols.clear()
+    positions.invalidate()
+    history = HistoryIndex()
+    history_log = HistoryWriter()
+    notifier = Notifier()
+
+def ensure_mt5_connection(force: bool = False):
+    """
+    Verifica la conexión con MT5 y reconecta si es necesario.
+    Sin force, si la última verificación correcta es de hace menos de CONNECTION_CHECK_SECONDS
+    no se llama a terminal_info() (se llama desde casi todas las funciones de cada evento).
+    Orden de locks: _connection_lock nunca se toma con el de PositionSnapshot/HistoryIndex
+    tomado (comprueban la conexión antes), ni al revés (la foto se invalida al soltarlo).
+    """
+    global _connection_lost
+    if not force and time.monotonic() - _last_connection_ok < CONNECTION_CHECK_SECONDS:
+        return True
+    try:
+        with _connection_lock:
+            return _check_mt5_connection()
+    finally:
+        if _connection_lost:
+            _connection_lost = False
+            positions.invalidate()
+
+def _check_mt5_connection():
+    global _last_connection_ok, _connection_lost
     ti = mt5.terminal_info()
     if ti is None:
+        _last_connection_ok = 0.0
+        _selected_symbols.clear()  # Tras reconectar hay que volver a seleccionar
+        _connection_lost = True
         # Intentar reconectar
         print("[RECONEXIÓN] Perdida conexión con MT5, intentando reconectar...")
         mt5.shutdown()
@@ -92,11 +168,20 @@ def ensure_mt5_connection():
             error_desc = init_error[1] if isinstance(init_error, tuple) and len(init_error) > 1 else str(init_error)
             raise RuntimeError(f"No se pudo reconectar con MT5: ({error_code}, '{error_desc}')")
         print("[RECONEXIÓN] Reconexión exitosa con MT5")
+        _last_connection_ok = time.monotonic()
         return True
+    _last_connection_ok = time.monotonic()
     return True
 
+def connection_suspect():
+    """Fuerza una verificación real en la próxima llamada (p.ej. order_send devolvió None)"""
+    global _last_connection_ok
+    _last_connection_ok = 0.0
+
 def ensure_symbol(symbol: str):
-    """Selecciona un símbolo en MT5, verificando conexión primero"""
+    """Selecciona un símbolo en MT5, verificando conexión primero (una vez por símbolo y conexión)"""
+    if symbol in _selected_symbols:
+        return
     ensure_mt5_connection()
     if not mt5.symbol_select(symbol, True):
         error_info = mt5.last_error()
@@ -105,7 +190,7 @@ def ensure_symbol(symbol: str):
         # Si es error de IPC, intentar reconectar
         if error_code == -10001:  # IPC send failed
             print(f"[RECONEXIÓN] Error IPC al seleccionar {symbol}, intentando reconectar...")
-            ensure_mt5_connection()
+            ensure_mt5_connection(force=True)
             # Reintentar después de reconectar
             if not mt5.symbol_select(symbol, True):
                 retry_error = mt5.last_error()
@@ -114,18 +199,142 @@ def ensure_symbol(symbol: str):
                 raise RuntimeError(f"No puedo seleccionar {symbol}: ({retry_code}, '{retry_desc}')")
         else:
             raise RuntimeError(f"No puedo seleccionar {symbol}: ({error_code}, '{error_desc}')")
+    _selected_symbols.add(symbol)
 
 def clone_comment(master_ticket: str) -> str:
     """Retorna solo el ticket maestro como comentario (evita truncamiento)"""
     return master_ticket
 
+class Notifier:
+    """
+    Cola de notificaciones push en memoria con un hilo en segundo plano que escribe en
+    NotificationQueue.txt (Common\\Files), para no hacer I/O de fichero justo después de
+    order_send.
+
+    EnviarNotificacion.mq5 lee el fichero entero, lo envía con UN SendNotification() y lo vacía.
+    Por eso el hilo, una vez por NOTIFY_INTERVAL_SECONDS, solo escribe si el fichero está vacío
+    (el EA ya consumió lo anterior; antes se sobrescribía y una ráfaga perdía mensajes) y agrupa
+    en una sola escritura todos los mensajes pendientes que quepan en NOTIFY_MAX_CHARS, uno por
+    línea. Al cerrar, lo que no se llegó a escribir se guarda en NotificationQueue_pendientes.txt
+    y se vuelve a encolar en el siguiente arranque.
+    """
+
+    def __init__(self, file_name: str = NOTIFICATION_FILE):
+        self.file_name = file_name
+        self._queue: deque = deque()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._path: Optional[str] = None
+
+    def start(self):
+        """Resuelve la ruta, recupera pendientes de la ejecución anterior y arranca el hilo."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._path = common_files_csv_path(self.file_name)
+            self._load_pending()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="notificador", daemon=True)
+            self._thread.start()
+
+    def send(self, message: str) -> bool:
+        """Encola el mensaje (no bloquea). True si se encoló."""
+        # Truncar mensaje si es muy largo (límite de MT5)
+        if len(message) > NOTIFY_MAX_CHARS:
+            message = message[:NOTIFY_MAX_CHARS - 3] + "..."
+        message = message.replace("\n", " ")
+        with self._lock:
+            self._queue.append(message)
+            if len(self._queue) > NOTIFY_MAX_QUEUE:
+                dropped = self._queue.popleft()
+                print(f"[WARN NOTIFICACION] Cola llena, se descarta: {dropped}")
+        if self._thread is None:
+            try:
+                self.start()
+            except Exception as e:
+                print(f"[ERROR NOTIFICACION] No se pudo arrancar el notificador: {e}")
+        return True
+
+    def _pending_path(self) -> str:
+        return os.path.splitext(self._path)[0] + NOTIFY_PENDING_SUFFIX
+
+    def _load_pending(self):
+        pending_path = self._pending_path()
+        if not os.path.exists(pending_path):
+            return
+        try:
+            with open(pending_path, "r", encoding="utf-8") as fh:
+                previous = [line.rstrip("\n") for line in fh if line.strip()]
+            os.remove(pending_path)
+        except Exception as e:
+            print(f"[ERROR NOTIFICACION] No se pudieron recuperar pendientes: {e}")
+            return
+        self._queue.extendleft(reversed(previous))  # Más antiguos primero
+        print(f"[NOTIFICACION] Recuperadas {len(previous)} notificaciones pendientes")
+
+    def _run(self):
+        while not self._stop.wait(NOTIFY_INTERVAL_SECONDS):
+            self._write_batch()
+
+    def _write_batch(self) -> bool:
+        with self._lock:
+            if not self._queue:
+                return True
+            batch = [self._queue[0]]
+            size = len(batch[0])
+            for message in list(self._queue)[1:]:
+                size += 1 + len(message)
+                if size > NOTIFY_MAX_CHARS:
+                    break
+                batch.append(message)
+        try:
+            if os.path.exists(self._path) and os.path.getsize(self._path) > 0:
+                return False  # EnviarNotificacion aún no ha enviado el anterior
+            with open(self._path, "wb") as fh:
+                fh.write("\n".join(batch).encode("utf-8"))
+        except Exception as e:
+            print(f"[ERROR NOTIFICACION] Excepción al escribir notificación en archivo: {e}")
+            return False
+        with self._lock:
+            for _ in batch:
+                self._queue.popleft()
+        print(f"[NOTIFICACION] {len(batch)} mensaje(s) escritos para envío: {' | '.join(batch)}")
+        return True
+
+    def close(self):
+        """Para el hilo, intenta una última escritura y guarda lo que quede para el próximo arranque."""
+        thread = self._thread
+        if thread is None:
+            return
+        self._stop.set()
+        thread.join(timeout=NOTIFY_INTERVAL_SECONDS * 5)
+        self._thread = None
+        self._write_batch()
+        with self._lock:
+            remaining = list(self._queue)
+            self._queue.clear()
+        if not remaining:
+            return
+        try:
+            with open(self._pending_path(), "a", encoding="utf-8", newline="") as fh:
+                for message in remaining:
+                    fh.write(message + "\n")
+            print(f"[NOTIFICACION] {len(remaining)} notificaciones pendientes guardadas para el próximo arranque")
+        except Exception as e:
+            print(f"[ERROR NOTIFICACION] No se pudieron guardar {len(remaining)} pendientes: {e}")
+
+
+notifier = Notifier()
+atexit.register(lambda: notifier.close())
+
 def send_push_notification(message: str) -> bool:
     """
     Envía una notificación push usando SendNotification() de MetaTrader mediante archivo intermedio.
     
     La API de Python de MetaTrader5 NO incluye send_notification(). La función SendNotification()
     solo existe en MQL5. Por lo tanto:
-    - Python escribe el mensaje en NotificationQueue.txt (Common\\Files)
+    - Python encola el mensaje y el hilo de Notifier lo escribe en NotificationQueue.txt (Common\\Files)
     - El script MQL5 EnviarNotificacion.mq5 debe estar ejecutándose para leer el archivo
     - El script MQL5 llama a SendNotification() y limpia el archivo
     
@@ -133,91 +342,172 @@ def send_push_notification(message: str) -> bool:
         message: Mensaje a enviar (máximo 255 caracteres)
     
     Retorno:
-        True si se escribió exitosamente en el archivo, False si falló
+        True si se encoló (la escritura al archivo es asíncrona)
     
     Nota: El script EnviarNotificacion.mq5 debe estar ejecutándose como EA o script en MT5
     para procesar las notificaciones.
     """
-    try:
-        # Truncar mensaje si es muy largo (límite de MT5)
-        if len(message) > 255:
-            message = message[:252] + "..."
-        
-        # Obtener ruta del archivo de notificaciones en Common\\Files
-        notification_path = common_files_csv_path(NOTIFICATION_FILE)
-        
-        # Escribir el mensaje en el archivo (el script MQL5 lo leerá y enviará)
-        # Usar modo binario y asegurar que el archivo se cierre correctamente
-        with open(notification_path, "wb") as f:
-            f.write(message.encode('utf-8'))
-        
-        # Forzar sincronización del sistema de archivos
-        if hasattr(os, 'sync'):
-            os.sync()
-        
-        print(f"[NOTIFICACION] Mensaje escrito en archivo para envío: {message}")
-        print(f"[NOTIFICACION] Ruta del archivo: {notification_path}")
+    return notifier.send(message)
+
+class PositionSnapshot:
+    """
+    Posiciones abiertas de la cuenta leídas con UN positions_get() e indexadas por
+    (símbolo, comentario = ticket maestro). Se marca como caducada al empezar cada ciclo y se
+    relee en la primera búsqueda. Los OPEN del propio ciclo no caducan toda la foto: solo una
+    búsqueda de ese mismo ticket maestro obliga a releer. Con un lock: la usan los hilos de
+    dispatch_events.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._index: Optional[dict] = None
+        self._opened: set = set()  # (símbolo, ticket maestro) abiertos después de la foto
+        self._read_at = 0.0
+        self.reads = 0
+
+    def invalidate(self):
+        with self._lock:
+            self._index = None
+
+    def note_open(self, symbol: str, master_ticket: str):
+        """Registra un OPEN enviado (correcto o con resultado desconocido) después de la foto."""
+        with self._lock:
+            self._opened.add((symbol, master_ticket.strip()))
+
+    def _refresh(self) -> bool:
+        # La conexión la comprueba find() antes de tomar el lock
+        poss = mt5.positions_get()
+        self.reads += 1
+        if poss is None:
+            self._index = None  # Error de MT5: no cachear, se reintenta en la próxima búsqueda
+            return False
+        index: dict = {}
+        for p in poss:
+            index.setdefault((p.symbol, (p.comment or "").strip()), p)  # Primera, como el recorrido lineal
+        self._index = index
+        self._opened.clear()
+        self._read_at = time.monotonic()
         return True
-    except Exception as e:
-        print(f"[ERROR NOTIFICACION] Excepción al escribir notificación en archivo: {e}")
-        return False
+
+    def find(self, symbol: str, master_ticket: str, confirm_missing: bool = True):
+        """
+        Posición del ticket maestro o None. confirm_missing: si no está y la foto tiene más de
+        POSITIONS_MAX_AGE_SECONDS, releer antes de darla por inexistente.
+        """
+        ensure_mt5_connection()
+        with self._lock:
+            if (self._index is None or (symbol, master_ticket) in self._opened) and not self._refresh():
+                return None
+            p = self._index.get((symbol, master_ticket))
+            if p is None and confirm_missing and time.monotonic() - self._read_at > POSITIONS_MAX_AGE_SECONDS:
+                # Un NO_EXISTE borra el evento del CSV: confirmar con una foto reciente
+                if self._refresh():
+                    p = self._index.get((symbol, master_ticket))
+            return p
+
+    def remove(self, position):
+        """Quita una posición ya cerrada (evita releer solo por un CLOSE)."""
+        with self._lock:
+            if self._index is not None:
+                self._index.pop((position.symbol, (position.comment or "").strip()), None)
+
+
+positions = PositionSnapshot()
 
 def find_open_clone(symbol: str, comment: str, master_ticket: str = None):
-    """Busca una posición abierta por símbolo y comentario (ticket maestro)"""
-    ensure_mt5_connection()
-    poss = mt5.positions_get(symbol=symbol)
-    if not poss:
-        return None
-    
+    """Busca una posición abierta por símbolo y comentario (ticket maestro) en la foto del ciclo"""
     # El comentario ahora es solo el ticket maestro
     search_ticket = (master_ticket or comment).strip()
-    
-    for p in poss:
-        pos_comment = (p.comment or "").strip()
-        
-        # Comparación exacta (el comentario es el ticket maestro)
-        if pos_comment == search_ticket:
-            return p
-    
-    return None
+    return positions.find(symbol, search_ticket)
+
+_COMMENT_TOKEN_RE = re.compile(r"[0-9A-Za-z_]+")
+
+class HistoryIndex:
+    """
+    Deals y órdenes del historial indexados por ticket maestro (cada palabra del comment).
+    La primera búsqueda carga HISTORY_DAYS días; después cada sync solo pide lo posterior al
+    sync anterior (menos HISTORY_SYNC_MARGIN, por la diferencia entre hora servidor y local).
+    Los duplicados del solape se descartan por ticket del deal/orden. Una búsqueda sin resultado
+    re-sincroniza como mucho cada HISTORY_MISS_SYNC_SECONDS (cada OPEN releído sin clon es un fallo), salvo
+    para los tickets que este proceso ha cerrado después de la última sync (note_closed).
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._by_ticket: dict[str, list] = {}  # ticket maestro -> deals/órdenes
+        self._seen: set = set()                # ("deal"|"order", ticket MT5) ya indexados
+        self._synced_to: Optional[datetime] = None  # Hora local de la última sync completa
+        self._synced_at = 0.0                       # time.monotonic() de la última sync completa
+        self._closed: set = set()                   # Tickets maestros cerrados después de la última sync
+        self.syncs = 0
+
+    def _add(self, kind: str, items):
+        for item in items:
+            key = (kind, item.ticket)
+            if key in self._seen:
+                continue
+            self._seen.add(key)
+            for token in set(_COMMENT_TOKEN_RE.findall(item.comment or "")):
+                self._by_ticket.setdefault(token, []).append(item)
+
+    def sync(self) -> bool:
+        """Trae deals y órdenes nuevos. False si MT5 falla (se reintenta en la próxima sync)."""
+        ensure_mt5_connection()
+        with self._lock:
+            return self._sync()
+
+    def _sync(self) -> bool:
+        # La conexión la comprueban sync()/contains() antes de tomar el lock
+        now = datetime.now()
+        if self._synced_to is None:
+            from_date = now - timedelta(days=HISTORY_DAYS)
+        else:
+            from_date = self._synced_to - HISTORY_SYNC_MARGIN
+        to_date = now + HISTORY_SYNC_MARGIN
+        deals = mt5.history_deals_get(from_date, to_date)
+        orders = mt5.history_orders_get(from_date, to_date)
+        self.syncs += 1
+        if deals is None or orders is None:
+            return False
+        self._add("deal", deals)
+        self._add("order", orders)
+        self._synced_to = now
+        self._synced_at = time.monotonic()
+        self._closed.clear()
+        return True
+
+    def note_closed(self, master_ticket: str):
+        """Registra un CLOSE propio: la próxima búsqueda de ese ticket sincroniza aunque sea pronto."""
+        with self._lock:
+            self._closed.add(master_ticket.strip())
+
+    def _lookup(self, symbol: str, master_ticket: str) -> bool:
+        return any((item.symbol or "") == symbol for item in self._by_ticket.get(master_ticket, ()))
+
+    def contains(self, symbol: str, master_ticket: str) -> bool:
+        """True si hay un deal u orden de symbol cuyo comment contiene el ticket maestro"""
+        master_ticket = master_ticket.strip()
+        ensure_mt5_connection()
+        with self._lock:
+            if self._lookup(symbol, master_ticket):
+                return True
+            # Fallo: puede ser un cierre/apertura posterior a la última sync
+            if (self._synced_to is not None and master_ticket not in self._closed
+                    and time.monotonic() - self._synced_at < HISTORY_MISS_SYNC_SECONDS):
+                return False
+            return self._sync() and self._lookup(symbol, master_ticket)
+
+
+history = HistoryIndex()
 
 def find_ticket_in_history(symbol: str, master_ticket: str):
     """Busca el ticket origen en el historial (deals y órdenes) por campo comment"""
-    master_ticket = master_ticket.strip()
-    
-    # Buscar en las últimas 90 días
-    from_date = datetime.now() - timedelta(days=90)
-    to_date = datetime.now()
-    
-    # Buscar en TODOS los deals del historial
-    deals = mt5.history_deals_get(from_date, to_date)
-    if deals:
-        for deal in deals:
-            deal_symbol = deal.symbol or ""
-            deal_comment = (deal.comment or "").strip()
-            
-            # Buscar el ticket maestro en el comentario
-            if deal_symbol == symbol and master_ticket in deal_comment:
-                return True
-    
-    # Buscar en TODAS las órdenes del historial
-    orders = mt5.history_orders_get(from_date, to_date)
-    if orders:
-        for order in orders:
-            order_symbol = order.symbol or ""
-            order_comment = (order.comment or "").strip()
-            
-            # Buscar el ticket maestro en el comentario
-            if order_symbol == symbol and master_ticket in order_comment:
-                return True
-    
-    return False
+    return history.contains(symbol, master_ticket)
 
 def ticket_exists_anywhere(symbol: str, master_ticket: str):
     """Verifica si el ticket origen existe en abiertas O en historial"""
-    # Buscar en posiciones abiertas
-    comment = master_ticket  # El comment es el ticket maestro
-    if find_open_clone(symbol, comment, master_ticket) is not None:
+    # Buscar en posiciones abiertas (la foto del ciclo basta: un clon reciente está en _opened)
+    if positions.find(symbol, master_ticket.strip(), confirm_missing=False) is not None:
         return True
     
     # Buscar en historial
@@ -230,18 +520,27 @@ def ticket_exists_anywhere(symbol: str, master_ticket: str):
 
 def open_clone(ev: Ev) -> tuple[bool, str]:
     """
-    Ejecuta OPEN (BUY/SELL) directamente sin verificaciones previas.
+    Ejecuta OPEN (BUY/SELL). Única verificación previa, solo si el evento se ha releído
+    (ev.replayed): que el ticket maestro no esté ya clonado.
     Retorna (True, "EXITOSO") si se ejecutó exitosamente
+    Retorna (False, "DUPLICADO: ...") si ya hay un clon abierto o en el historial
     Retorna (False, "ERROR: [mensaje]") si falla (con mensaje descriptivo del MT5)
-    En ambos casos se elimina del CSV y se escribe al histórico.
+    En todos los casos se elimina del CSV y se escribe al histórico.
     """
     comment = clone_comment(ev.master_ticket)
     
     ensure_mt5_connection()
     ensure_symbol(ev.symbol)
+    # Un OPEN ya ejecutado puede volver a leerse (TradeEvents.txt releído desde el principio o
+    # ciclo interrumpido): no abrir una segunda posición del mismo ticket maestro. Las líneas
+    # nuevas no se comprueban: costaría una sync del historial por cada OPEN en directo
+    if ev.replayed and ticket_exists_anywhere(ev.symbol, ev.master_ticket):
+        print(f"[OPEN DUPLICADO] {ev.symbol} (maestro: {ev.master_ticket}): ya clonado, no se abre otra posición")
+        return (False, "DUPLICADO: ya clonado (abierta o en historial)")
     lots = compute_slave_lots(ev.symbol, ev.master_lots)
     tick = mt5.symbol_info_tick(ev.symbol)
     if tick is None:
+        _selected_symbols.discard(ev.symbol)  # Puede haberse quitado de Market Watch: reseleccionar
         error_msg = f"No tick para {ev.symbol}"
         print(f"[ERROR OPEN] {ev.symbol} (maestro: {ev.master_ticket}): {error_msg}")
         return (False, f"ERROR: {error_msg}")
@@ -274,6 +573,8 @@ def open_clone(ev: Ev) -> tuple[bool, str]:
     ensure_mt5_connection()  # Verificar conexión antes de enviar orden
     res = mt5.order_send(req)
     if res is None:
+        connection_suspect()
+        positions.note_open(ev.symbol, ev.master_ticket)  # No sabemos si llegó a abrirse
         error_msg = "order_send retornó None"
         print(f"[ERROR OPEN] {ev.symbol} (maestro: {ev.master_ticket}): {error_msg}")
         
@@ -293,7 +594,9 @@ def open_clone(ev: Ev) -> tuple[bool, str]:
         
         return (False, f"ERROR: {error_msg}")
     
-    # OPEN exitoso - enviar notificación de éxito
+    # OPEN exitoso - la foto de posiciones no incluye esta posición
+    positions.note_open(ev.symbol, ev.master_ticket)
+    # Enviar notificación de éxito
     notification_msg = f"Ticket: {ev.master_ticket} - OPEN EXITOSO: {ev.symbol} {ev.order_type} {lots} lots"
     send_push_notification(notification_msg)
     
@@ -319,6 +622,7 @@ def close_clone(ev: Ev) -> tuple[bool, str]:
     ensure_symbol(ev.symbol)
     tick = mt5.symbol_info_tick(ev.symbol)
     if tick is None:
+        _selected_symbols.discard(ev.symbol)
         raise RuntimeError(f"No tick para {ev.symbol}")
 
     # Cerrar: operación contraria con position=ticket
@@ -345,6 +649,8 @@ def close_clone(ev: Ev) -> tuple[bool, str]:
     ensure_mt5_connection()  # Verificar conexión antes de enviar orden
     res = mt5.order_send(req)
     if res is None:
+        connection_suspect()
+        positions.invalidate()
         error_msg = "order_send retornó None"
         print(f"[ERROR CLOSE] {ev.symbol} (maestro: {ev.master_ticket}): {error_msg} - Manteniendo en CSV para reintento")
         
@@ -357,6 +663,8 @@ def close_clone(ev: Ev) -> tuple[bool, str]:
         return (False, "FALLO")  # Fallo, mantener en CSV para reintento
     
     if res.retcode == mt5.TRADE_RETCODE_DONE:
+        positions.remove(p)
+        history.note_closed(ev.master_ticket)
         # Enviar notificación push para CLOSE (éxito)
         notification_msg = f"Ticket: {ev.master_ticket} - CLOSE EXITOSO: {ev.symbol} {ev.order_type} {p.volume} lots"
         send_push_notification(notification_msg)
@@ -403,6 +711,8 @@ def modify_clone(ev: Ev) -> tuple[bool, str]:
     }
     ensure_mt5_connection()  # Verificar conexión antes de enviar orden
     res = mt5.order_send(req)
+    if res is None:
+        connection_suspect()
     
     # Verificar resultado
     if res is not None and res.retcode in (mt5.TRADE_RETCODE_DONE, mt5.TRADE_RETCODE_NO_CHANGES):
@@ -430,6 +740,30 @@ def modify_clone(ev: Ev) -> tuple[bool, str]:
         print(f"[ERROR MODIFY] {ev.symbol} (maestro: {ev.master_ticket}): {error_msg} - Manteniendo en CSV para reintento")
     return (False, "FALLO")  # fallo al modificar, mantener en CSV para reintento
 
+def parse_event_line(line: str) -> Optional[Ev]:
+    """Parsea una línea event_type;ticket;order_type;lots;symbol;sl;tp (None si no es válida)"""
+    if not line:
+        return None
+
+    # Parsear línea con delimiter ";"
+    row = line.split(";")
+    if len(row) < 5:
+        return None
+
+    # Nuevo formato simplificado: event_type;ticket;order_type;lots;symbol;sl;tp
+    # indices: 0=event_type, 1=ticket, 2=order_type, 3=lots, 4=symbol, 5=sl, 6=tp
+    et = upper(row[0])
+    master_ticket = (row[1] or "").strip()
+    ot = upper(row[2])
+    lots = f(row[3])
+    sym = upper(row[4])
+    sl = f(row[5]) if len(row) > 5 else 0.0
+    tp = f(row[6]) if len(row) > 6 else 0.0
+
+    if not sym or not master_ticket:
+        return None
+    return Ev(et, master_ticket, ot, lots, sym, sl, tp)
+
 def read_events_from_csv(path: str) -> tuple[list[Ev], list[str], str]:
     """
     Lee el CSV y retorna:
@@ -501,77 +835,407 @@ def read_events_from_csv(path: str) -> tuple[list[Ev], list[str], str]:
     # Parsear cada línea (empezando desde start_idx)
     for line in all_lines[start_idx:]:
         line = line.strip()
-        if not line:
-            continue
-        
-        # Parsear línea con delimiter ";"
-        row = line.split(";")
-        if len(row) < 5:
-            continue
-
-        # Nuevo formato simplificado: event_type;ticket;order_type;lots;symbol;sl;tp
-        # indices: 0=event_type, 1=ticket, 2=order_type, 3=lots, 4=symbol, 5=sl, 6=tp
-        et = upper(row[0])
-        master_ticket = (row[1] or "").strip()
-        ot = upper(row[2])
-        lots = f(row[3])
-        sym = upper(row[4])
-        sl = f(row[5]) if len(row) > 5 else 0.0
-        tp = f(row[6]) if len(row) > 6 else 0.0
-
-        if not sym or not master_ticket:
+        ev = parse_event_line(line)
+        if ev is None:
             continue
 
         # Guardar línea original y evento parseado
         lines.append(line)
-        events.append(Ev(et, master_ticket, ot, lots, sym, sl, tp))
+        events.append(ev)
     
     return events, lines, header_line
 
+def _is_header_line(line: str) -> bool:
+    """La cabecera contiene "event_type" o "ticket" (mismo criterio que read_events_from_csv)"""
+    return "event_type" in line.lower() or "ticket" in line.lower()
+
+class EventQueue:
+    """
+    Consumidor de TradeEvents.txt por offset: cada ciclo lee solo los bytes añadidos desde el
+    anterior (hasta el último salto de línea: una línea a medio escribir espera al siguiente
+    ciclo) y NUNCA reescribe el fichero del productor (LectorOrdenes solo añade al final).
+
+    Los eventos a reintentar (CLOSE/MODIFY fallidos) se quedan en memoria y se guardan, junto al
+    offset, en un fichero de estado (<nombre>_estado.txt, key=value) que se reescribe de forma
+    atómica al final de cada ciclo. Si el fichero encoge o cambia su inicio (borrado y
+    recreado), se vuelve a leer desde 0.
+
+    Sin estado válido (no existe o está ilegible) se empieza al FINAL del fichero, con aviso:
+    releerlo entero volvería a ejecutar todos los OPEN históricos. Para reprocesarlo poner
+    QUEUE_REPLAY_FROM_START = True. Excepción (migración): la versión anterior del clonador
+    reescribía TradeEvents.txt dejando solo la cabecera y los reintentos, así que al actualizar
+    no hay estado y el fichero contiene justo lo que falta por ejecutar. Si el fichero no pasa de
+    QUEUE_LEGACY_MAX_BYTES se trata como esa cola antigua y se lee desde el inicio.
+
+    Las líneas del primer poll tras arrancar (pueden venir de un ciclo interrumpido antes de
+    guardar el estado) y las de un fichero recreado se marcan como releídas (self.replayed):
+    solo en ellas open_clone comprueba que el ticket no esté ya clonado.
+
+    TradeEvents.txt crece sin límite: nadie lo compacta. Para vaciarlo, con LectorOrdenes y el
+    clonador parados, borrar TradeEvents.txt (el estado detecta el fichero nuevo) o ambos ficheros.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.state_path = os.path.splitext(path)[0] + QUEUE_STATE_SUFFIX
+        self.offset = 0
+        self.head = ""                   # Hex de los primeros bytes (detecta fichero recreado)
+        self.pending: list[str] = []     # Líneas pendientes de reintento, en orden
+        self.replaying = True            # El próximo poll puede releer líneas ya ejecutadas
+        self.replayed = False            # Las líneas del último poll se releyeron
+        if not self._load_state() and not QUEUE_REPLAY_FROM_START and not self._is_legacy_queue():
+            self._skip_to_end()
+
+    def _load_state(self) -> bool:
+        """Carga offset, head y pendientes. False si no hay estado válido."""
+        if not os.path.exists(self.state_path):
+            return False
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as fh:
+                for raw in fh:
+                    key, sep, value = raw.rstrip("\n").partition("=")
+                    if not sep:
+                        continue
+                    if key == "offset":
+                        self.offset = int(value)
+                    elif key == "head":
+                        self.head = value
+                    elif key == "pending":
+                        self.pending.append(value)
+            return True
+        except Exception as e:
+            print(f"[ERROR LECTURA] Estado de cola ilegible {self.state_path}: {e} (reintentos guardados perdidos)")
+            self.offset, self.head, self.pending = 0, "", []
+            return False
+
+    def _is_legacy_queue(self) -> bool:
+        """Sin estado: True si el fichero parece la cola del clonador anterior (pequeño, solo pendientes)."""
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return False
+        if size == 0 or size > QUEUE_LEGACY_MAX_BYTES:
+            return False
+        print(f"[INFO] Sin estado de cola ({self.state_path}) y {self.path} de {size} bytes: se trata como "
+              f"cola del clonador anterior y se lee desde el inicio (los OPEN ya clonados se descartan)")
+        return True
+
+    def _skip_to_end(self):
+        """Sin estado: situarse tras la última línea completa del fichero (si ya existe)."""
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return  # Aún no existe: todo lo que escriba el productor es nuevo
+        with open(self.path, "rb") as fh:
+            self.head = fh.read(QUEUE_HEAD_BYTES).hex()
+            tail_start = max(0, size - 65536)
+            fh.seek(tail_start)
+            end = fh.read(size - tail_start).rfind(b"\n")
+        self.offset = tail_start + end + 1 if end >= 0 else 0
+        if self.offset:
+            print(f"[WARN] Sin estado de cola ({self.state_path}): se IGNORAN los {self.offset} bytes ya "
+                  f"escritos en {self.path} y se procesan solo los eventos nuevos. "
+                  f"Para reprocesarlos: QUEUE_REPLAY_FROM_START = True")
+
+    def save_state(self):
+        tmp_path = self.state_path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8", newline="") as fh:
+                fh.write(f"offset={self.offset}\n")
+                fh.write(f"head={self.head}\n")
+                for line in self.pending:
+                    fh.write(f"pending={line}\n")
+            os.replace(tmp_path, self.state_path)
+        except Exception as e:
+            raise RuntimeError(f"Error al escribir estado de cola: {e}")
+
+    def _read_new_bytes(self) -> tuple[int, bytes]:
+        """(offset de inicio, bytes nuevos hasta el último salto de línea)"""
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return self.offset, b""  # Aún no existe: la crea el productor
+        if size == self.offset:
+            return self.offset, b""
+        with open(self.path, "rb") as fh:
+            head = fh.read(QUEUE_HEAD_BYTES).hex()
+            if size < self.offset or not head.startswith(self.head):
+                print(f"[CSV] {self.path} recreado o truncado: se lee desde el inicio")
+                self.offset = 0
+                self.replaying = True
+            self.head = head
+            fh.seek(self.offset)
+            data = fh.read(size - self.offset)
+        end = data.rfind(b"\n")
+        return self.offset, data[:end + 1]  # end = -1 -> b"" (línea a medio escribir)
+
+    def poll(self) -> list[str]:
+        """Líneas nuevas completas (sin cabecera, BOM ni vacías). Avanza el offset en memoria."""
+        start, data = self._read_new_bytes()
+        self.offset = start + len(data)
+        self.replayed, self.replaying = self.replaying, False
+        new_lines: list[str] = []
+        for raw in data.splitlines():
+            try:
+                line = raw.decode("utf-8")
+            except UnicodeDecodeError as e:
+                print(f"[ERROR LECTURA] Línea no UTF-8 descartada en {self.path}: {raw[:20].hex()} ({e})")
+                continue
+            if start == 0 and not new_lines:
+                # Primera línea del fichero: BOM y cabecera opcionales
+                line = line.lstrip("\ufeff")
+                if _is_header_line(line):
+                    continue
+            line = line.strip()
+            if line:
+                new_lines.append(line)
+        return new_lines
+
+
+_event_queues: dict[str, EventQueue] = {}
+
+def get_event_queue(path: str) -> EventQueue:
+    queue = _event_queues.get(path)
+    if queue is None:
+        queue = EventQueue(path)
+        _event_queues[path] = queue
+    return queue
+
 def common_files_csv_path(csv_name: str) -> str:
-    """Obtiene la ruta del archivo CSV en Common\\Files, verificando conexión primero"""
-    ensure_mt5_connection()
-    ti = mt5.terminal_info()
-    if ti is None:
-        raise RuntimeError("No hay terminal_info() (¿MT5 abierto?)")
-    # FILE_COMMON en MQL5 busca en: <commondata_path>\Files\ (no MQL5\Files)
-    # Python debe escribir en la misma ubicación
-    return os.path.join(ti.commondata_path, "Files", csv_name)
+    """Obtiene la ruta del archivo CSV en Common\\Files (terminal_info() solo la primera vez)"""
+    global _common_files_dir
+    if _common_files_dir is None:
+        ensure_mt5_connection()
+        ti = mt5.terminal_info()
+        if ti is None:
+            raise RuntimeError("No hay terminal_info() (¿MT5 abierto?)")
+        # FILE_COMMON en MQL5 busca en: <commondata_path>\Files\ (no MQL5\Files)
+        # Python debe escribir en la misma ubicación
+        _common_files_dir = os.path.join(ti.commondata_path, "Files")
+    return os.path.join(_common_files_dir, csv_name)
+
+class HistoryWriter:
+    """
+    Histórico de ejecuciones con buffer: append() solo encola la línea (con su timestamp) y
+    flush() la escribe al final de cada ciclo por un handle que se mantiene abierto (la ruta se
+    resuelve una vez). Rotación diaria: al escribir la primera línea de un día nuevo, el
+    fichero anterior se renombra a TradeEvents_historico_<AAAA-MM-DD>.txt y se empieza otro
+    con cabecera. Si la escritura falla (fichero bloqueado), las líneas se conservan para el
+    siguiente flush. close() se llama al salir (Ctrl+C incluido) para no perder el buffer.
+    """
+
+    def __init__(self, csv_name: str = CSV_HISTORICO):
+        self.csv_name = csv_name
+        self._lock = threading.Lock()
+        self._buffer: list[tuple[str, str]] = []  # (día AAAA-MM-DD, línea con \n)
+        self._path: Optional[str] = None
+        self._fh = None
+        self._day: Optional[str] = None  # Día de las líneas del fichero abierto
+
+    def append(self, csv_line: str, resultado: str = "EXITOSO"):
+        now = datetime.now()
+        # Crear línea histórica: timestamp_ejecucion;resultado;línea_original_completa
+        line = f"{now.strftime('%Y-%m-%d %H:%M:%S')};{resultado};{csv_line}\n"
+        with self._lock:
+            self._buffer.append((now.strftime("%Y-%m-%d"), line))
+
+    def _rotated_path(self, day: str) -> str:
+        base, ext = os.path.splitext(self._path)
+        candidate = f"{base}_{day}{ext}"
+        n = 2
+        while os.path.exists(candidate):
+            candidate = f"{base}_{day}_{n}{ext}"
+            n += 1
+        return candidate
+
+    def _open(self, day: str):
+        self._close_handle()
+        if self._path is None:
+            self._path = common_files_csv_path(self.csv_name)
+        if os.path.exists(self._path) and os.path.getsize(self._path) > 0:
+            file_day = datetime.fromtimestamp(os.path.getmtime(self._path)).strftime("%Y-%m-%d")
+            if file_day != day:
+                try:
+                    os.replace(self._path, self._rotated_path(file_day))
+                except OSError as e:
+                    print(f"[WARN] No se pudo rotar el histórico (se sigue en el mismo fichero): {e}")
+        is_new = not os.path.exists(self._path) or os.path.getsize(self._path) == 0
+        self._fh = open(self._path, "a", encoding="utf-8", newline="")
+        if is_new:
+            self._fh.write(HISTORY_HEADER + "\n")
+        self._day = day
+
+    def _close_handle(self):
+        if self._fh is not None:
+            try:
+                self._fh.close()
+            finally:
+                self._fh = None
+
+    def flush(self):
+        with self._lock:
+            if not self._buffer:
+                return
+            written = 0
+            try:
+                for day, line in self._buffer:
+                    if self._fh is None or day != self._day:
+                        self._open(day)
+                    self._fh.write(line)
+                    written += 1
+                self._fh.flush()
+                self._buffer.clear()
+            except Exception as e:
+                print(f"[ERROR] No se pudo escribir al histórico: {e} ({len(self._buffer) - written} líneas en espera)")
+                # Lo ya escrito al handle puede haberse perdido: se reintenta todo al reabrir
+                self._close_handle()
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._close_handle()
+
+
+history_log = HistoryWriter()
+atexit.register(lambda: history_log.close())  # Después de que terminen los hilos de dispatch_events
 
 def append_to_history_csv(csv_line: str, resultado: str = "EXITOSO"):
-    """Añade una línea al CSV histórico con timestamp y resultado"""
-    hist_path = common_files_csv_path(CSV_HISTORICO)
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    
-    # Crear línea histórica: timestamp_ejecucion;resultado;línea_original_completa
-    hist_line = f"{timestamp};{resultado};{csv_line}\n"
-    
+    """Añade una línea al histórico con timestamp y resultado (se escribe en el flush del ciclo)"""
+    history_log.append(csv_line, resultado)
+
+def execute_event(ev: Ev, original_line: str) -> bool:
+    """
+    Ejecuta un evento y escribe su resultado al histórico.
+    Retorna True si la línea debe quedarse en el CSV principal para reintento.
+    """
     try:
-        # Si el archivo no existe, crear con header
-        if not os.path.exists(hist_path):
-            with open(hist_path, "w", encoding="utf-8", newline="") as f:
-                # Header: timestamp_ejecucion;resultado;event_type;ticket;order_type;lots;symbol;open_price;open_time;sl;tp;close_price;close_time;profit
-                f.write("timestamp_ejecucion;resultado;event_type;ticket;order_type;lots;symbol;open_price;open_time;sl;tp;close_price;close_time;profit\n")
-        
-        # Añadir línea al histórico
-        with open(hist_path, "a", encoding="utf-8", newline="") as f:
-            f.write(hist_line)
+        # Procesar el evento (cada función verifica en MT5 antes de ejecutar)
+        if ev.event_type == "OPEN":
+            executed_successfully, resultado = open_clone(ev)
+            if executed_successfully:
+                print(f"[OPEN] {ev.symbol} {ev.order_type} {ev.master_lots} lots (maestro: {ev.master_ticket})")
+            # OPEN siempre elimina del CSV (éxito o fallo), pero escribe al histórico
+            append_to_history_csv(original_line, resultado)
+
+        elif ev.event_type == "CLOSE":
+            executed_successfully, motivo = close_clone(ev)
+            if executed_successfully:
+                print(f"[CLOSE] {ev.symbol} (maestro: {ev.master_ticket})")
+                append_to_history_csv(original_line, "CLOSE OK")
+                # Remover del set de notificaciones (procesado exitosamente)
+                notified_close_tickets.discard(ev.master_ticket)
+            elif motivo == "NO_EXISTE":
+                # No existe operación abierta, eliminar del CSV
+                append_to_history_csv(original_line, "No existe operacion abierta")
+                # Remover del set de notificaciones (eliminado del CSV)
+                notified_close_tickets.discard(ev.master_ticket)
+            elif motivo == "FALLO":
+                # Fallo al cerrar (cualquier error), mantener en CSV para reintento
+                append_to_history_csv(original_line, "ERROR: Fallo al cerrar (reintento)")
+                return True
+
+        elif ev.event_type == "MODIFY":
+            executed_successfully, motivo = modify_clone(ev)
+            if executed_successfully:
+                print(f"[MODIFY] {ev.symbol} SL={ev.sl} TP={ev.tp} (maestro: {ev.master_ticket})")
+                append_to_history_csv(original_line, "MODIFY OK")
+                # Remover del set de notificaciones (procesado exitosamente)
+                notified_modify_tickets.discard(ev.master_ticket)
+            elif motivo == "NO_EXISTE":
+                # No existe operación abierta, eliminar del CSV
+                append_to_history_csv(original_line, "No existe operacion abierta")
+                # Remover del set de notificaciones (eliminado del CSV)
+                notified_modify_tickets.discard(ev.master_ticket)
+            elif motivo == "FALLO":
+                # Fallo al modificar (cualquier error), mantener en CSV para reintento
+                append_to_history_csv(original_line, "ERROR: Fallo al modificar (reintento)")
+                return True
+        # otros event_type: ignorar
+
     except Exception as e:
-        print(f"[ERROR] No se pudo escribir al histórico: {e}")
+        # Error crítico al ejecutar, mantener en CSV principal para reintento
+        print(f"[ERROR] {ev.event_type} {ev.symbol} (maestro: {ev.master_ticket}): {e}")
+        append_to_history_csv(original_line, f"ERROR: {str(e)}")
+        return True
+    return False
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=EXEC_WORKERS, thread_name_prefix="clon")
+    return _executor
+
+def dispatch_events(events: list[Ev], lines: list[str]) -> list[bool]:
+    """
+    Ejecuta los eventos agrupados por ticket maestro: dentro de un ticket, en el orden del CSV
+    (OPEN -> MODIFY -> CLOSE); tickets distintos en paralelo en hasta EXEC_WORKERS hilos, para
+    que un order_send lento (recotización, error de red) no retrase los OPEN que vienen detrás.
+    Retorna, por evento y en el orden original, si su línea se mantiene en el CSV.
+    """
+    keep = [False] * len(events)
+    groups: dict[str, list[int]] = {}
+    for idx, ev in enumerate(events):
+        groups.setdefault(ev.master_ticket, []).append(idx)
+
+    if EXEC_WORKERS <= 1 or len(groups) <= 1:
+        for idx, ev in enumerate(events):
+            keep[idx] = execute_event(ev, lines[idx])
+        return keep
+
+    def run_group(indices: list[int]):
+        for idx in indices:
+            keep[idx] = execute_event(events[idx], lines[idx])
+
+    # Los grupos se encolan en el orden de su primer evento; esperar a todos antes de reescribir
+    futures = [_get_executor().submit(run_group, indices) for indices in groups.values()]
+    for fut in futures:
+        fut.result()
+    return keep
 
-def write_csv(path: str, header: str, lines: list[str]):
-    """Reescribe el CSV con header y líneas especificadas"""
+def process_cycle(path: str):
+    """
+    Un ciclo del clonador: toma los pendientes de reintento + las líneas nuevas de
+    TradeEvents.txt (EventQueue), ejecuta los eventos (dispatch_events) y guarda el estado de la
+    cola con los que hay que reintentar. La foto de posiciones se toma (como mucho) una vez por ciclo.
+    """
+    positions.invalidate()
+    queue = get_event_queue(path)
     try:
-        with open(path, "w", encoding="utf-8", newline="") as f:
-            f.write(header + "\n")
-            for line in lines:
-                f.write(line + "\n")
+        new_lines = queue.poll()
     except Exception as e:
-        raise RuntimeError(f"Error al escribir CSV: {e}")
+        print(f"[ERROR LECTURA] Error al leer archivo {path}: {e}")
+        return
+    if not new_lines and not queue.pending:
+        return
+
+    # Pendientes primero (son más antiguos que lo recién leído)
+    lines: list[str] = []
+    events: list[Ev] = []
+    for i, line in enumerate(queue.pending + new_lines):
+        ev = parse_event_line(line)
+        if ev is not None:
+            ev.replayed = queue.replayed and i >= len(queue.pending)
+            lines.append(line)
+            events.append(ev)
+
+    try:
+        keep = dispatch_events(events, lines)
+    finally:
+        history_log.flush()  # Antes de guardar el estado de la cola
+
+    # Líneas que se mantienen para reintento (no procesadas exitosamente)
+    remaining_lines = [line for line, k in zip(lines, keep) if k]
+    changed = bool(new_lines) or remaining_lines != queue.pending
+    queue.pending = remaining_lines
+    if changed:
+        queue.save_state()
+        print(f"[CSV] Procesadas {len(lines)} líneas: {len(remaining_lines)} pendientes de reintento")
 
 def main_loop():
     global LOT_MULTIPLIER
     
+    if mt5 is None:
+        raise SystemExit("Falta dependencia: pip install MetaTrader5")
     if not mt5.initialize():
         raise SystemExit(f"MT5 init failed: {mt5.last_error()}")
 
@@ -626,91 +1290,15 @@ def main_loop():
         print("-" * 60)
         
         # Enviar notificación push de inicio
+        notifier.start()
         send_push_notification("Activado ClonadorMQ5.py")
 
         while True:
             try:
                 # Verificar conexión antes de cada ciclo
-                ensure_mt5_connection()
+                ensure_mt5_connection(force=True)
                 
-                if os.path.exists(path) and os.path.getsize(path) > 0:
-                    # Leer eventos y líneas originales
-                    events: list[Ev] = []
-                    lines: list[str] = []
-                    header: str = "event_type;ticket;order_type;lots;symbol;sl;tp"
-                    
-                    try:
-                        events, lines, header = read_events_from_csv(path)
-                    except Exception as e:
-                        print(f"[ERROR LECTURA] Error al leer archivo {path}: {e}")
-                        time.sleep(TIMER_SECONDS)
-                        continue
-                    
-                    # Líneas que se mantendrán en el CSV principal (no procesadas exitosamente)
-                    remaining_lines: list[str] = []
-                    
-                    # Procesar cada evento
-                    for idx, ev in enumerate(events):
-                        if idx >= len(lines):
-                            continue  # Protección contra desincronización
-                        
-                        original_line = lines[idx]
-                        executed_successfully = False
-                        
-                        try:
-                            # Procesar el evento (cada función verifica en MT5 antes de ejecutar)
-                            if ev.event_type == "OPEN":
-                                executed_successfully, resultado = open_clone(ev)
-                                if executed_successfully:
-                                    print(f"[OPEN] {ev.symbol} {ev.order_type} {ev.master_lots} lots (maestro: {ev.master_ticket})")
-                                # OPEN siempre elimina del CSV (éxito o fallo), pero escribe al histórico
-                                append_to_history_csv(original_line, resultado)
-                                    
-                            elif ev.event_type == "CLOSE":
-                                executed_successfully, motivo = close_clone(ev)
-                                if executed_successfully:
-                                    print(f"[CLOSE] {ev.symbol} (maestro: {ev.master_ticket})")
-                                    append_to_history_csv(original_line, "CLOSE OK")
-                                    # Remover del set de notificaciones (procesado exitosamente)
-                                    notified_close_tickets.discard(ev.master_ticket)
-                                elif motivo == "NO_EXISTE":
-                                    # No existe operación abierta, eliminar del CSV
-                                    append_to_history_csv(original_line, "No existe operacion abierta")
-                                    # Remover del set de notificaciones (eliminado del CSV)
-                                    notified_close_tickets.discard(ev.master_ticket)
-                                elif motivo == "FALLO":
-                                    # Fallo al cerrar (cualquier error), mantener en CSV para reintento
-                                    remaining_lines.append(original_line)
-                                    append_to_history_csv(original_line, "ERROR: Fallo al cerrar (reintento)")
-                                    
-                            elif ev.event_type == "MODIFY":
-                                executed_successfully, motivo = modify_clone(ev)
-                                if executed_successfully:
-                                    print(f"[MODIFY] {ev.symbol} SL={ev.sl} TP={ev.tp} (maestro: {ev.master_ticket})")
-                                    append_to_history_csv(original_line, "MODIFY OK")
-                                    # Remover del set de notificaciones (procesado exitosamente)
-                                    notified_modify_tickets.discard(ev.master_ticket)
-                                elif motivo == "NO_EXISTE":
-                                    # No existe operación abierta, eliminar del CSV
-                                    append_to_history_csv(original_line, "No existe operacion abierta")
-                                    # Remover del set de notificaciones (eliminado del CSV)
-                                    notified_modify_tickets.discard(ev.master_ticket)
-                                elif motivo == "FALLO":
-                                    # Fallo al modificar (cualquier error), mantener en CSV para reintento
-                                    remaining_lines.append(original_line)
-                                    append_to_history_csv(original_line, "ERROR: Fallo al modificar (reintento)")
-                            # otros event_type: ignorar
-                                
-                        except Exception as e:
-                            # Error crítico al ejecutar, mantener en CSV principal para reintento
-                            print(f"[ERROR] {ev.event_type} {ev.symbol} (maestro: {ev.master_ticket}): {e}")
-                            remaining_lines.append(original_line)
-                            append_to_history_csv(original_line, f"ERROR: {str(e)}")
-                    
-                    # Reescribir CSV principal solo con líneas pendientes
-                    if len(remaining_lines) != len(lines):
-                        write_csv(path, header, remaining_lines)
-                        print(f"[CSV] Actualizado: {len(remaining_lines)} líneas pendientes (de {len(lines)} totales)")
+                process_cycle(path)
             except Exception as e:
                 print(f"ERROR: {e}")
 
@@ -718,6 +1306,12 @@ def main_loop():
     except KeyboardInterrupt:
         print("\nDeteniendo ClonadorOrdenes...")
     finally:
+        # Esperar a los order_send en curso antes de cerrar MT5; los grupos aún no empezados se
+        # cancelan (el estado de la cola no se guardó: se vuelven a leer al arrancar)
+        if _executor is not None:
+            _executor.shutdown(wait=True, cancel_futures=True)
+        history_log.close()
+        notifier.close()
         mt5.shutdown()
         print("MT5 desconectado")
 
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench_clonador.py (V1)
+----------------------
+Benchmark de un ciclo de ClonadorMQ5.py contra un módulo MetaTrader5 simulado (sin terminal).
+
+Uso:
+    python bench_clonador.py                      # 300 eventos, 500 posiciones abiertas, 0.3 ms por IPC
+    python bench_clonador.py 3000 2000 0.5        # eventos, posiciones, ms por llamada IPC
+    python bench_clonador.py 300 500 0.3 ruta/otro_ClonadorMQ5.py   # comparar con otra versión
+    python bench_clonador.py burst                # latencia de una ráfaga de OPEN, EXEC_WORKERS 1 vs 4
+    python bench_clonador.py burst 40 50 8        # OPENs, ms por order_send, EXEC_WORKERS
+
+El MetaTrader5 simulado es broker_sim.SimBroker (se inyecta en sys.modules para poder comparar
+también versiones antiguas del clonador): cuenta las llamadas a cada función de MT5 (cada una es
+un round-trip IPC con el terminal real) y simula su latencia con un sleep. Las notificaciones
+push se desactivan para medir solo MT5. Los eventos son 1/3 OPEN nuevos, 1/3 MODIFY y 1/3 CLOSE
+de posiciones abiertas.
+
+En modo burst todos los eventos son OPEN de tickets distintos; order_send tarda lo indicado y en
+XAUUSD (SLOW_SYMBOL) 10 veces más (recotización/reintento del servidor). Se mide, para cada OPEN,
+el tiempo desde el inicio del ciclo hasta que su open_clone() termina.
+"""
+
+import importlib.util
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from broker_sim import SimBroker
+
+SYMBOLS = ["XAUUSD", "EURUSD", "GBPUSD", "US30", "NAS100"]
+SLOW_SYMBOL = "XAUUSD"
+SLOW_FACTOR = 10
+
+
+def make_stub_mt5(common_dir: str, n_positions: int, latency_s: float, order_latency_s: float = 0.0) -> SimBroker:
+    """Broker simulado con n_positions posiciones abiertas (comentarios 900000, 900001, ...)."""
+    broker = SimBroker(common_dir, ipc_latency_ms=latency_s * 1000.0, order_latency_ms=order_latency_s * 1000.0,
+                       symbol_latency_factor={SLOW_SYMBOL: SLOW_FACTOR})
+    for i in range(n_positions):
+        broker.add_position(SYMBOLS[i % len(SYMBOLS)], str(900000 + i))
+    return broker
+
+
+def write_events(path: Path, n_events: int, n_positions: int):
+    lines = ["event_type;ticket;order_type;lots;symbol;sl;tp"]
+    for i in range(n_events):
+        kind = i % 3
+        if kind == 0:
+            lines.append(f"OPEN;{100000 + i};BUY;0.10;{SYMBOLS[i % len(SYMBOLS)]};0;0")
+        else:
+            j = (i * 7) % max(n_positions, 1)
+            event = "MODIFY" if kind == 1 else "CLOSE"
+            lines.append(f"{event};{900000 + j};BUY;0.10;{SYMBOLS[j % len(SYMBOLS)]};1.5;2.5")
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+def load_clonador(module_path: Path):
+    spec = importlib.util.spec_from_file_location("clonador_bench", module_path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    mod.QUEUE_REPLAY_FROM_START = True  # Los eventos se escriben antes del primer ciclo (sin estado de cola)
+    return mod
+
+
+def run_cycle(mod, path: str):
+    """process_cycle() si existe; si no (versiones antiguas), el mismo recorrido de main_loop()."""
+    mod.ensure_mt5_connection()
+    if hasattr(mod, "process_cycle"):
+        mod.process_cycle(path)
+        if hasattr(mod, "history_log"):
+            mod.history_log.close()  # Suelta el handle antes de borrar el directorio temporal
+        return
+    events, lines, _ = mod.read_events_from_csv(path)
+    handlers = {"OPEN": mod.open_clone, "CLOSE": mod.close_clone, "MODIFY": mod.modify_clone}
+    for ev, line in zip(events, lines):
+        _, resultado = handlers[ev.event_type](ev)
+        mod.append_to_history_csv(line, resultado)
+
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def run_burst(n_opens: int, order_ms: float, workers: int, module_path: Path) -> list:
+    """Un ciclo con n_opens OPEN; retorna la latencia (s) de cada uno desde el inicio del ciclo."""
+    with tempfile.TemporaryDirectory() as tmp:
+        files_dir = Path(tmp) / "Files"
+        files_dir.mkdir()
+        sys.modules["MetaTrader5"] = make_stub_mt5(tmp, 0, 0.0, order_ms / 1000.0)
+        mod = load_clonador(module_path)
+        mod.send_push_notification = lambda message: True
+        mod.EXEC_WORKERS = workers
+
+        events_path = files_dir / mod.CSV_NAME
+        lines = ["event_type;ticket;order_type;lots;symbol;sl;tp"]
+        lines += [f"OPEN;{100000 + i};BUY;0.10;{SYMBOLS[i % len(SYMBOLS)]};0;0" for i in range(n_opens)]
+        events_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+        latencies = []
+        open_clone = mod.open_clone
+
+        def timed_open(ev):
+            result = open_clone(ev)
+            latencies.append(time.perf_counter() - start)
+            return result
+
+        mod.open_clone = timed_open
+        stdout = sys.stdout
+        sys.stdout = open(os.devnull, "w")
+        try:
+            mod.ensure_mt5_connection()
+            start = time.perf_counter()
+            run_cycle(mod, str(events_path))
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+    return latencies
+
+
+def main_burst():
+    n_opens = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+    order_ms = float(sys.argv[3]) if len(sys.argv) > 3 else 50.0
+    workers = int(sys.argv[4]) if len(sys.argv) > 4 else 4
+    module_path = Path(sys.argv[5]) if len(sys.argv) > 5 else Path(__file__).resolve().parent / "ClonadorMQ5.py"
+
+    print(f"[BENCH] Ráfaga de {n_opens} OPEN, order_send {order_ms} ms ({SLOW_SYMBOL} x{SLOW_FACTOR})")
+    for w in sorted({1, workers}):
+        lat = [x * 1000 for x in run_burst(n_opens, order_ms, w, module_path)]
+        print(f"[BENCH] EXEC_WORKERS={w}: p50 {percentile(lat, 0.5):.0f} ms | p95 {percentile(lat, 0.95):.0f} ms"
+              f" | último {max(lat):.0f} ms")
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "burst":
+        main_burst()
+        return
+    n_events = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    n_positions = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    latency_ms = float(sys.argv[3]) if len(sys.argv) > 3 else 0.3
+    module_path = Path(sys.argv[4]) if len(sys.argv) > 4 else Path(__file__).resolve().parent / "ClonadorMQ5.py"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        files_dir = Path(tmp) / "Files"
+        files_dir.mkdir()
+        stub = make_stub_mt5(tmp, n_positions, latency_ms / 1000.0)
+        sys.modules["MetaTrader5"] = stub
+        mod = load_clonador(module_path)
+        mod.send_push_notification = lambda message: True
+
+        events_path = files_dir / mod.CSV_NAME
+        write_events(events_path, n_events, n_positions)
+
+        stdout = sys.stdout
+        sys.stdout = open(os.devnull, "w")
+        try:
+            start = time.perf_counter()
+            run_cycle(mod, str(events_path))
+            elapsed = time.perf_counter() - start
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+    total = sum(stub.calls.values())
+    print(f"[BENCH] {module_path.name}: {n_events} eventos, {n_positions} posiciones, {latency_ms} ms/IPC")
+    print(f"[BENCH] Tiempo de ciclo: {elapsed * 1000:.1f} ms ({elapsed * 1000 / max(n_events, 1):.2f} ms/evento)")
+    print(f"[BENCH] Llamadas IPC: {total} ({total / max(n_events, 1):.2f} por evento)")
+    for name, count in stub.calls.most_common():
+        print(f"[BENCH]   {name:<18} {count}")
+
+
+if __name__ == "__main__":
+    main()
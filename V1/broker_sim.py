@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+broker_sim.py (V1)
+------------------
+Backend de broker simulado en memoria con la misma API que el módulo MetaTrader5, para ejecutar
+ClonadorMQ5.py sin terminal (Linux, benchmarks, replays).
+
+Interfaz de backend (BROKER_API): las funciones y constantes de MetaTrader5 que usa el clonador.
+Cualquier objeto que las tenga sirve (el propio módulo MetaTrader5, SimBroker u otro):
+
+    import ClonadorMQ5, broker_sim
+    ClonadorMQ5.set_backend(broker_sim.SimBroker(order_latency_ms=20, requote_rate=0.05))
+
+SimBroker:
+- Posiciones, deals y órdenes en memoria; order_send ejecuta OPEN/CLOSE/SLTP al instante.
+- Latencia configurable: ipc_latency_ms en cada llamada, order_latency_ms (+ jitter_ms aleatorio)
+  en order_send, multiplicada por symbol_latency_factor[símbolo] si existe.
+- requote_rate: fracción de order_send que responde TRADE_RETCODE_REQUOTE (10004).
+- fail_rate: fracción que responde 10031 (sin conexión con el servidor de trading).
+- none_rate: fracción en la que order_send retorna None (fallo de IPC con el terminal).
+- Determinista: el resultado y la latencia de cada order_send salen de un RNG sembrado con
+  (seed, acción, símbolo, comentario, nº de intento), no del orden entre hilos.
+- calls (Counter) cuenta las llamadas por función; fills registra cada order_send con su resultado.
+"""
+
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Optional
+
+BROKER_API = (
+    # Funciones
+    "initialize", "shutdown", "last_error", "terminal_info",
+    "symbol_select", "symbol_info", "symbol_info_tick",
+    "positions_get", "order_send", "history_deals_get", "history_orders_get",
+    # Constantes
+    "ORDER_TYPE_BUY", "ORDER_TYPE_SELL", "POSITION_TYPE_BUY",
+    "TRADE_ACTION_DEAL", "TRADE_ACTION_SLTP", "ORDER_TIME_GTC", "ORDER_FILLING_FOK",
+    "TRADE_RETCODE_PLACED", "TRADE_RETCODE_DONE", "TRADE_RETCODE_NO_CHANGES",
+)
+
+RETCODE_REQUOTE = 10004
+RETCODE_NO_CONNECTION = 10031
+
+
+def check_backend(backend) -> None:
+    """Lanza RuntimeError si al backend le falta algo de BROKER_API."""
+    missing = [name for name in BROKER_API if not hasattr(backend, name)]
+    if missing:
+        raise RuntimeError(f"Backend de broker incompleto, falta: {', '.join(missing)}")
+
+
+class SimBroker:
+    """Broker en memoria con la API de MetaTrader5 (ver docstring del módulo)."""
+
+    ORDER_TYPE_BUY, ORDER_TYPE_SELL = 0, 1
+    POSITION_TYPE_BUY, POSITION_TYPE_SELL = 0, 1
+    TRADE_ACTION_DEAL, TRADE_ACTION_SLTP = 1, 6
+    ORDER_TIME_GTC, ORDER_FILLING_FOK = 0, 0
+    TRADE_RETCODE_PLACED, TRADE_RETCODE_DONE, TRADE_RETCODE_NO_CHANGES = 10008, 10009, 10025
+
+    def __init__(self, common_dir: str = ".", ipc_latency_ms: float = 0.0, order_latency_ms: float = 0.0,
+                 jitter_ms: float = 0.0, requote_rate: float = 0.0, fail_rate: float = 0.0,
+                 none_rate: float = 0.0, seed: int = 0, symbol_latency_factor: Optional[dict] = None):
+        self.common_dir = common_dir
+        self.ipc_latency_s = ipc_latency_ms / 1000.0
+        self.order_latency_s = order_latency_ms / 1000.0
+        self.jitter_s = jitter_ms / 1000.0
+        self.requote_rate = requote_rate
+        self.fail_rate = fail_rate
+        self.none_rate = none_rate
+        self.seed = seed
+        self.symbol_latency_factor = dict(symbol_latency_factor or {})
+
+        self.calls: Counter = Counter()
+        self.fills: list = []            # (acción, símbolo, comentario, retcode|None, latencia s)
+        self._lock = threading.Lock()
+        self._attempts: Counter = Counter()
+        self._positions: dict = {}
+        self._deals: list = []
+        self._orders: list = []
+        self._next_ticket = 1
+
+    # ========= Estado =========
+
+    def _ticket(self) -> int:
+        ticket = self._next_ticket
+        self._next_ticket += 1
+        return ticket
+
+    def add_position(self, symbol: str, comment: str, ptype: int = 0, volume: float = 0.1,
+                     sl: float = 0.0, tp: float = 0.0):
+        """Crea una posición abierta (p.ej. las que ya existían antes de una grabación)."""
+        with self._lock:
+            ticket = self._ticket()
+            self._positions[ticket] = SimpleNamespace(ticket=ticket, symbol=symbol, comment=comment, type=ptype,
+                                                      volume=volume, magic=0, sl=sl, tp=tp)
+            return self._positions[ticket]
+
+    def _record(self, symbol: str, comment: str, position_id: int):
+        now = int(time.time())
+        self._deals.append(SimpleNamespace(ticket=self._ticket(), symbol=symbol, comment=comment,
+                                           position_id=position_id, time=now))
+        self._orders.append(SimpleNamespace(ticket=self._ticket(), symbol=symbol, comment=comment,
+                                            position_id=position_id, time_setup=now))
+
+    def _ipc(self, name: str):
+        with self._lock:
+            self.calls[name] += 1
+        if self.ipc_latency_s:
+            time.sleep(self.ipc_latency_s)
+
+    # ========= API MetaTrader5 =========
+
+    def initialize(self, *args, **kwargs) -> bool:
+        self._ipc("initialize")
+        return True
+
+    def shutdown(self):
+        pass
+
+    def last_error(self):
+        return (1, "Success")
+
+    def terminal_info(self):
+        self._ipc("terminal_info")
+        return SimpleNamespace(commondata_path=self.common_dir)
+
+    def symbol_select(self, symbol: str, enable: bool = True) -> bool:
+        self._ipc("symbol_select")
+        return True
+
+    def symbol_info(self, symbol: str):
+        self._ipc("symbol_info")
+        return SimpleNamespace(volume_min=0.01, volume_max=100.0, volume_step=0.01)
+
+    def symbol_info_tick(self, symbol: str):
+        self._ipc("symbol_info_tick")
+        return SimpleNamespace(bid=1.0, ask=1.0002)
+
+    def positions_get(self, symbol: Optional[str] = None, **kwargs):
+        self._ipc("positions_get")
+        with self._lock:
+            return tuple(p for p in self._positions.values() if symbol is None or p.symbol == symbol)
+
+    def _between(self, items: list, attr: str, date_from, date_to) -> tuple:
+        lo = date_from.timestamp() if isinstance(date_from, datetime) else float(date_from)
+        hi = date_to.timestamp() if isinstance(date_to, datetime) else float(date_to)
+        with self._lock:
+            return tuple(x for x in items if lo <= getattr(x, attr) <= hi)
+
+    def history_deals_get(self, date_from, date_to, **kwargs):
+        self._ipc("history_deals_get")
+        return self._between(self._deals, "time", date_from, date_to)
+
+    def history_orders_get(self, date_from, date_to, **kwargs):
+        self._ipc("history_orders_get")
+        return self._between(self._orders, "time_setup", date_from, date_to)
+
+    def _outcome(self, req: dict) -> tuple[Optional[int], float]:
+        """(retcode o None, latencia s) del intento, deterministas por petición."""
+        # Por comentario (ticket maestro), no por ticket de posición: estos dependen del orden
+        # en que los hilos del clonador abren posiciones
+        target = req.get("comment", "")
+        if not target and "position" in req:
+            with self._lock:
+                p = self._positions.get(req["position"])
+            target = p.comment if p is not None else req["position"]
+        key = f"{req['action']}:{req['symbol']}:{'position' in req}:{target}"
+        with self._lock:
+            self._attempts[key] += 1
+            attempt = self._attempts[key]
+        rng = random.Random(f"{self.seed}:{key}:{attempt}")
+        latency = self.order_latency_s + rng.random() * self.jitter_s
+        latency *= self.symbol_latency_factor.get(req["symbol"], 1)
+        roll = rng.random()
+        if roll < self.none_rate:
+            return None, latency
+        roll -= self.none_rate
+        if roll < self.fail_rate:
+            return RETCODE_NO_CONNECTION, latency
+        roll -= self.fail_rate
+        if roll < self.requote_rate and req["action"] == self.TRADE_ACTION_DEAL:
+            return RETCODE_REQUOTE, latency
+        return self.TRADE_RETCODE_DONE, latency
+
+    def order_send(self, req: dict):
+        self._ipc("order_send")
+        retcode, latency = self._outcome(req)
+        if latency:
+            time.sleep(latency)
+        comment = req.get("comment", "")
+        if retcode == self.TRADE_RETCODE_DONE:
+            with self._lock:
+                if req["action"] == self.TRADE_ACTION_SLTP:
+                    p = self._positions.get(req["position"])
+                    if p is None:
+                        retcode = 10036  # TRADE_RETCODE_POSITION_CLOSED
+                    else:
+                        p.sl, p.tp = req["sl"], req["tp"]
+                elif "position" in req:
+                    p = self._positions.pop(req["position"], None)
+                    if p is None:
+                        retcode = 10036
+                    else:
+                        self._record(p.symbol, p.comment, p.ticket)
+                else:
+                    ticket = self._ticket()
+                    self._positions[ticket] = SimpleNamespace(
+                        ticket=ticket, symbol=req["symbol"], comment=comment, type=req["type"],
+                        volume=req["volume"], magic=req.get("magic", 0), sl=req.get("sl", 0.0), tp=req.get("tp", 0.0))
+                    self._record(req["symbol"], comment, ticket)
+        with self._lock:
+            self.fills.append((req["action"], req["symbol"], comment, retcode, latency))
+        if retcode is None:
+            return None
+        descriptions = {RETCODE_REQUOTE: "Requote", RETCODE_NO_CONNECTION: "No connection", 10036: "Position closed"}
+        return SimpleNamespace(retcode=retcode, comment=descriptions.get(retcode, "Request executed"))
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+replay_clonador.py (V1)
+-----------------------
+Reproduce un flujo de eventos grabado a través de ClonadorMQ5.py (process_cycle real) contra el
+broker simulado broker_sim.SimBroker, sin terminal MT5.
+
+Uso:
+    python replay_clonador.py TradeEvents_historico.txt
+    python replay_clonador.py grabacion.txt --lote 20 --latencia-ms 30 --requote 0.05 --fallo 0.01
+    python replay_clonador.py grabacion.txt --workers 1 --semilla 7      # comparar concurrencia
+
+Entrada (se detecta sola):
+- TradeEvents.txt: líneas event_type;ticket;order_type;lots;symbol;sl;tp (cabecera opcional).
+  Cada ciclo recibe --lote líneas.
+- TradeEvents_historico.txt: timestamp_ejecucion;resultado;<línea original>. Cada segundo
+  grabado es un ciclo; los reintentos grabados de una misma línea se descartan (el replay
+  genera los suyos).
+
+Cada ciclo añade su lote al TradeEvents.txt temporal y llama a process_cycle(); los ciclos se
+encadenan sin esperar TIMER_SECONDS, así que los tiempos medidos son los del clonador más la
+latencia simulada del broker. Al acabar la entrada se siguen haciendo ciclos hasta vaciar los
+reintentos (máximo --ciclos-extra). Los tickets cuyo primer evento no es OPEN se crean como
+posiciones abiertas al empezar (la grabación empezó con ellas abiertas), salvo --sin-precarga.
+Con la misma --semilla el resultado de cada order_send es el mismo en cada ejecución.
+
+Informe: throughput, latencia de open/close/modify_clone (p50/p95/p99/máx), latencia extremo
+a extremo (desde que la línea entra en el fichero hasta su resultado definitivo), resultados
+del histórico, retcodes de order_send y llamadas al broker.
+"""
+
+import argparse
+import io
+import sys
+import tempfile
+import time
+from collections import Counter
+from contextlib import redirect_stdout
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from bench_clonador import percentile  # noqa: E402
+from broker_sim import RETCODE_NO_CONNECTION, RETCODE_REQUOTE, SimBroker  # noqa: E402
+
+HISTORY_PREFIX = "timestamp_ejecucion"
+EVENT_HEADER = "event_type;ticket;order_type;lots;symbol;sl;tp"
+
+
+# ========= Entrada =========
+
+def _is_history_row(fields: list) -> bool:
+    stamp = fields[0]
+    return len(fields) >= 7 and len(stamp) == 19 and stamp[4] == "-" and stamp[13] == ":"
+
+
+def _keeps_for_retry(event_type: str, resultado: str) -> bool:
+    """Resultado grabado que dejó la línea en el CSV (habrá otra fila de la misma línea)."""
+    return resultado.endswith("(reintento)") or (resultado.startswith("ERROR:") and event_type != "OPEN")
+
+
+def load_batches(path: Path, batch_size: int) -> list:
+    """Lista de lotes (listas de líneas de evento) en el orden grabado."""
+    raw = path.read_bytes().decode("utf-8-sig", errors="replace").splitlines()
+    rows = [line.strip() for line in raw if line.strip()]
+    if rows and (rows[0].lower().startswith(HISTORY_PREFIX) or "event_type" in rows[0].lower()):
+        rows = rows[1:]
+    if not rows:
+        return []
+
+    if not _is_history_row(rows[0].split(";")):
+        return [rows[i:i + batch_size] for i in range(0, len(rows), batch_size)]
+
+    # Histórico: agrupar por segundo y quitar los reintentos grabados
+    batches: list = []
+    last_stamp = None
+    retrying: set = set()
+    for row in rows:
+        stamp, resultado, line = row.split(";", 2)
+        event_type = line.split(";", 1)[0].strip().upper()
+        if line in retrying:
+            if not _keeps_for_retry(event_type, resultado):
+                retrying.discard(line)
+            continue
+        if _keeps_for_retry(event_type, resultado):
+            retrying.add(line)
+        if stamp != last_stamp:
+            batches.append([])
+            last_stamp = stamp
+        batches[-1].append(line)
+    return batches
+
+
+def preload_positions(broker: SimBroker, clon, batches: list) -> int:
+    """Abre en el broker los tickets cuyo primer evento grabado no es OPEN."""
+    first: dict = {}
+    for batch in batches:
+        for line in batch:
+            ev = clon.parse_event_line(line)
+            if ev is not None and ev.master_ticket not in first:
+                first[ev.master_ticket] = ev
+    n = 0
+    for ev in first.values():
+        if ev.event_type != "OPEN":
+            ptype = broker.POSITION_TYPE_SELL if ev.order_type == "SELL" else broker.POSITION_TYPE_BUY
+            broker.add_position(ev.symbol, clon.clone_comment(ev.master_ticket), ptype, ev.master_lots or 0.01)
+            n += 1
+    return n
+
+
+# ========= Replay =========
+
+def replay(args) -> None:
+    batches = load_batches(Path(args.eventos), args.lote)
+    n_lines = sum(len(b) for b in batches)
+    if not n_lines:
+        raise SystemExit(f"[ERROR] Sin eventos en {args.eventos}")
+
+    import ClonadorMQ5 as clon
+
+    with tempfile.TemporaryDirectory() as tmp:
+        files_dir = Path(tmp) / "Files"
+        files_dir.mkdir()
+        broker = SimBroker(tmp, ipc_latency_ms=args.ipc_ms, order_latency_ms=args.latencia_ms,
+                           jitter_ms=args.jitter_ms, requote_rate=args.requote, fail_rate=args.fallo,
+                           none_rate=args.none, seed=args.semilla)
+        clon.set_backend(broker)
+        clon.EXEC_WORKERS = args.workers
+        clon.QUEUE_REPLAY_FROM_START = True  # Fichero de eventos nuevo: leerlo desde el principio
+        clon.send_push_notification = lambda message: True
+        preloaded = 0 if args.sin_precarga else preload_positions(broker, clon, batches)
+
+        # Latencias por handler y extremo a extremo
+        handler_ms: dict = {"OPEN": [], "CLOSE": [], "MODIFY": []}
+        appended_at: dict = {}
+        e2e_ms: list = []
+
+        def timed(event_type, fn):
+            def inner(ev):
+                start = time.perf_counter()
+                try:
+                    return fn(ev)
+                finally:
+                    handler_ms[event_type].append((time.perf_counter() - start) * 1000)
+            return inner
+
+        clon.open_clone = timed("OPEN", clon.open_clone)
+        clon.close_clone = timed("CLOSE", clon.close_clone)
+        clon.modify_clone = timed("MODIFY", clon.modify_clone)
+        execute_event = clon.execute_event
+
+        def tracked_execute(ev, original_line):
+            keep = execute_event(ev, original_line)
+            if not keep:
+                queued = appended_at.get(original_line)
+                if queued:
+                    e2e_ms.append((time.perf_counter() - queued.pop(0)) * 1000)
+            return keep
+
+        clon.execute_event = tracked_execute
+
+        events_path = files_dir / clon.CSV_NAME
+        events_path.write_text(EVENT_HEADER + "\n", encoding="utf-8")
+        cycle_ms: list = []
+        log = io.StringIO()
+        start = time.perf_counter()
+        cycles = extra = 0
+        with redirect_stdout(log):
+            clon.ensure_mt5_connection(force=True)
+            for batch in batches:
+                now = time.perf_counter()
+                with open(events_path, "a", encoding="utf-8", newline="") as fh:
+                    for line in batch:
+                        fh.write(line + "\n")
+                        appended_at.setdefault(line, []).append(now)
+                t0 = time.perf_counter()
+                clon.process_cycle(str(events_path))
+                cycle_ms.append((time.perf_counter() - t0) * 1000)
+                cycles += 1
+            queue = clon.get_event_queue(str(events_path))
+            while queue.pending and extra < args.ciclos_extra:
+                t0 = time.perf_counter()
+                clon.process_cycle(str(events_path))
+                cycle_ms.append((time.perf_counter() - t0) * 1000)
+                extra += 1
+            elapsed = time.perf_counter() - start
+            pending = len(queue.pending)
+            clon.history_log.close()
+
+        hist_path = files_dir / clon.CSV_HISTORICO
+        hist_rows = hist_path.read_text(encoding="utf-8").splitlines()[1:] if hist_path.exists() else []
+
+    # ========= Informe =========
+    done = len(e2e_ms)
+    print(f"[REPLAY] {args.eventos}: {n_lines} eventos en {len(batches)} lotes | posiciones precargadas: {preloaded}")
+    print(f"[REPLAY] Broker: order_send {args.latencia_ms} ms (+{args.jitter_ms} jitter) | IPC {args.ipc_ms} ms | "
+          f"requote {args.requote:.1%} | fallo {args.fallo:.1%} | None {args.none:.1%} | semilla {args.semilla}")
+    print(f"[REPLAY] EXEC_WORKERS={args.workers} | ciclos {cycles} + {extra} de reintento | pendientes al final: {pending}")
+    print(f"[REPLAY] Tiempo total: {elapsed * 1000:.0f} ms | throughput {done / elapsed if elapsed else 0:.1f} eventos/s")
+    print(f"[REPLAY] Ciclo: p50 {percentile(cycle_ms, 0.5):.1f} ms | máx {max(cycle_ms):.1f} ms")
+    if e2e_ms:
+        print(f"[REPLAY] Extremo a extremo: p50 {percentile(e2e_ms, 0.5):.1f} ms | p95 {percentile(e2e_ms, 0.95):.1f} ms"
+              f" | p99 {percentile(e2e_ms, 0.99):.1f} ms | máx {max(e2e_ms):.1f} ms")
+    for event_type, values in handler_ms.items():
+        if values:
+            print(f"[REPLAY]   {event_type:<6} n={len(values):<6} p50 {percentile(values, 0.5):7.1f} ms | "
+                  f"p95 {percentile(values, 0.95):7.1f} ms | p99 {percentile(values, 0.99):7.1f} ms | máx {max(values):7.1f} ms")
+
+    print("[REPLAY] Resultados (histórico):")
+    for resultado, count in Counter(row.split(";", 2)[1] for row in hist_rows).most_common():
+        print(f"[REPLAY]   {count:>6} | {resultado}")
+
+    names = {broker.TRADE_RETCODE_DONE: "DONE", RETCODE_REQUOTE: "REQUOTE", RETCODE_NO_CONNECTION: "SIN CONEXION",
+             10036: "POSICION CERRADA", None: "None"}
+    actions = {broker.TRADE_ACTION_DEAL: "DEAL", broker.TRADE_ACTION_SLTP: "SLTP"}
+    print("[REPLAY] order_send:")
+    for (action, retcode), count in Counter((f[0], f[3]) for f in broker.fills).most_common():
+        print(f"[REPLAY]   {count:>6} | {actions.get(action, action)} {names.get(retcode, retcode)}")
+    print("[REPLAY] Llamadas al broker: " + ", ".join(f"{k}={v}" for k, v in broker.calls.most_common()))
+    if args.log:
+        Path(args.log).write_text(log.getvalue(), encoding="utf-8")
+        print(f"[REPLAY] Log del clonador: {args.log}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Replay de eventos grabados contra ClonadorMQ5 + broker simulado")
+    ap.add_argument("eventos", help="TradeEvents.txt o TradeEvents_historico.txt grabado")
+    ap.add_argument("--lote", type=int, default=10, help="Líneas por ciclo (solo TradeEvents.txt)")
+    ap.add_argument("--latencia-ms", type=float, default=20.0, help="Latencia de order_send")
+    ap.add_argument("--jitter-ms", type=float, default=10.0, help="Jitter aleatorio añadido a order_send")
+    ap.add_argument("--ipc-ms", type=float, default=0.3, help="Latencia de cada llamada al terminal")
+    ap.add_argument("--requote", type=float, default=0.0, help="Fracción de DEAL con requote (10004)")
+    ap.add_argument("--fallo", type=float, default=0.0, help="Fracción de order_send con 10031")
+    ap.add_argument("--none", type=float, default=0.0, help="Fracción de order_send que retorna None")
+    ap.add_argument("--workers", type=int, default=4, help="EXEC_WORKERS del clonador")
+    ap.add_argument("--semilla", type=int, default=0)
+    ap.add_argument("--ciclos-extra", type=int, default=20, help="Ciclos máximos para vaciar reintentos")
+    ap.add_argument("--sin-precarga", action="store_true", help="No abrir posiciones previas a la grabación")
+    ap.add_argument("--log", default="", help="Guardar la salida del clonador en este fichero")
+    replay(ap.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -3,22 +3,39 @@ Script de verificación de correlación entre históricos
 -------------------------------------------------------
 
 Compara historico_clonacion.txt con historico_WORKER_<account>.txt
-para detectar eventos distribuidos pero no procesados por los Workers.
+para detectar eventos distribuidos pero no procesados por los Workers, y eventos
+ejecutados por un Worker que nunca se le distribuyeron.
+
+Cada archivo se lee una vez y se indexa por ticket_EVENT; las discrepancias salen de
+anti-joins entre esos índices (coste lineal en el tamaño de los históricos).
 
 Uso:
     python verificar_correlacion_historicos.py [--common-dir PATH] [--workers WORKER1,WORKER2]
+        [--horas N | --desde "YYYY.MM.DD HH:MM:SS"] [--hasta "YYYY.MM.DD HH:MM:SS"] [--muestras N]
 """
 
 from __future__ import annotations
 
 import argparse
 import sys
+import time
 from collections import defaultdict
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, List, Set, Tuple
 
+# carga_paralela.py y tiempos.py se mantienen solo en Produccion/V2
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "Produccion" / "V2"))
+
+from carga_paralela import load_files  # noqa: E402
+from tiempos import TimestampColumn, timestamp_to_ms  # noqa: E402
+
+DEFAULT_SAMPLES = 10  # Ejemplos mostrados por tipo de discrepancia
+# El Distribuidor toma un datetime.now() para Historico_Master y otro para historico_clonacion
+# en el mismo ciclo: una línea de clonación es del envío del Master más cercano dentro de esto
+TOLERANCIA_ENVIO_MS = 2000
+
 # Configurar salida UTF-8 para Windows
 if sys.platform == "win32":
     import io
@@ -101,12 +118,26 @@ def leer_historico_clonacion(hist_path: Path) -> List[EventoDistribuido]:
     return eventos
 
 
-def leer_historico_master(hist_path: Path) -> Dict[str, EventoMaster]:
-    """Lee Historico_Master.txt y retorna dict por ticket."""
-    eventos = {}
+@dataclass
+class TablaMaster:
+    """Historico_Master indexado para los joins (una sola pasada por el archivo)"""
+    por_clave: Dict[str, EventoMaster] = field(default_factory=dict)               # ticket_EVENT -> evento (último)
+    envios_por_ticket: Dict[str, List[Tuple[int, str]]] = field(default_factory=dict)  # ticket -> (timestamp ms, event_type) en orden
+    por_ticket: Dict[str, List[str]] = field(default_factory=dict)                 # ticket -> event_types distintos en orden
+    lineas: int = 0
+
+
+def indexar_historico_master(hist_path: Path) -> TablaMaster:
+    """
+    Lee Historico_Master.txt y construye sus índices.
+    envios_por_ticket guarda el timestamp de clonación de cada línea para emparejarla con las
+    de historico_clonacion (ver indexar_distribuciones).
+    """
+    tabla = TablaMaster()
+    ts_envio = TimestampColumn()
     if not hist_path.exists():
         print(f"[WARN] No existe {hist_path}")
-        return eventos
+        return tabla
     
     try:
         with open(hist_path, "r", encoding="utf-8") as f:
@@ -125,12 +156,11 @@ def leer_historico_master(hist_path: Path) -> Dict[str, EventoMaster]:
                     symbol = parts[4].strip() if len(parts) > 4 else ""
                     sl = parts[5].strip() if len(parts) > 5 else ""
                     tp = parts[6].strip() if len(parts) > 6 else ""
-                    timestamp = parts[7].strip() if len(parts) > 7 else ""
+                    # El Distribuidor añade el timestamp de clonación al final de la línea original
+                    timestamp = parts[-1].strip() if len(parts) > 7 else ""
                     
-                    # Usar ticket como clave (puede haber múltiples eventos con mismo ticket si se distribuye varias veces)
-                    # Pero normalmente cada ticket aparece una vez por event_type
                     key = f"{ticket}_{event_type}"
-                    eventos[key] = EventoMaster(
+                    tabla.por_clave[key] = EventoMaster(
                         event_type=event_type,
                         ticket=ticket,
                         order_type=order_type,
@@ -140,12 +170,24 @@ def leer_historico_master(hist_path: Path) -> Dict[str, EventoMaster]:
                         tp=tp,
                         timestamp=timestamp
                     )
+                    envio_ms = ts_envio(timestamp)
+                    if envio_ms is not None:
+                        tabla.envios_por_ticket.setdefault(ticket, []).append((envio_ms, event_type))
+                    tipos = tabla.por_ticket.setdefault(ticket, [])
+                    if event_type not in tipos:
+                        tipos.append(event_type)
+                    tabla.lineas += 1
                 else:
                     print(f"[WARN] Línea {line_num} inválida en Historico_Master.txt: {line}")
     except Exception as e:
         print(f"[ERROR] Error leyendo Historico_Master.txt: {e}")
     
-    return eventos
+    return tabla
+
+
+def leer_historico_master(hist_path: Path) -> Dict[str, EventoMaster]:
+    """Lee Historico_Master.txt y retorna dict por ticket_EVENT."""
+    return indexar_historico_master(hist_path).por_clave
 
 
 def leer_historico_worker(hist_path: Path) -> Dict[str, EventoWorker]:
@@ -208,11 +250,120 @@ def leer_historico_worker(hist_path: Path) -> Dict[str, EventoWorker]:
     return eventos
 
 
+@dataclass
+class ResultadoWorker:
+    """Resultado de los anti-joins de un worker"""
+    worker_id: str
+    distribuidos_ok: int = 0
+    procesados: int = 0
+    procesados_error: int = 0
+    faltantes: List[Tuple[EventoDistribuido, str]] = field(default_factory=list)      # distribuidos, nunca ejecutados
+    no_distribuidos: List[EventoWorker] = field(default_factory=list)                # ejecutados, nunca distribuidos
+    sin_event_type: List[EventoDistribuido] = field(default_factory=list)
+
+
+def indexar_distribuciones(
+    eventos_distribuidos: List[EventoDistribuido],
+    master: TablaMaster,
+) -> Tuple[Dict[str, Dict[str, EventoDistribuido]], Dict[str, Set[str]], Dict[str, List[EventoDistribuido]]]:
+    """
+    Resuelve el event_type de cada línea de clonación y agrupa por worker.
+    Retorna (distribuidos OK por worker: clave -> evento, todas las claves distribuidas por worker
+    (OK o no), distribuciones sin event_type por worker).
+    
+    Cada línea de clonación se empareja con el envío del mismo ticket en el Master de timestamp
+    más cercano, si está a menos de TOLERANCIA_ENVIO_MS: el Distribuidor escribe los dos
+    históricos en el mismo ciclo pero con un datetime.now() cada uno, así que los timestamps
+    difieren en unos ms. Si un envío tenía varios eventos del mismo ticket (mismo timestamp en
+    el Master), se asignan en orden. Sin envío cercano se usan todos los event_types del ticket.
+    """
+    ok_por_worker: Dict[str, Dict[str, EventoDistribuido]] = defaultdict(dict)
+    claves_por_worker: Dict[str, Set[str]] = defaultdict(set)
+    sin_tipo: Dict[str, List[EventoDistribuido]] = defaultdict(list)
+    posicion: Dict[Tuple[str, str, int], int] = defaultdict(int)  # (worker, ticket, envío ms) -> siguiente índice
+    ts_clonacion = TimestampColumn()
+    
+    for ev in eventos_distribuidos:
+        tipos = None
+        envios = master.envios_por_ticket.get(ev.ticket)
+        dist_ms = ts_clonacion(ev.timestamp) if envios else None
+        if dist_ms is not None:
+            envio_ms = min((ms for ms, _ in envios), key=lambda ms: abs(ms - dist_ms))
+            if abs(envio_ms - dist_ms) <= TOLERANCIA_ENVIO_MS:
+                del_envio = [event_type for ms, event_type in envios if ms == envio_ms]
+                pos_key = (ev.worker_id, ev.ticket, envio_ms)
+                idx = posicion[pos_key]
+                posicion[pos_key] = idx + 1
+                tipos = [del_envio[min(idx, len(del_envio) - 1)]]
+        if not tipos:
+            tipos = master.por_ticket.get(ev.ticket)
+        if not tipos:
+            if ev.resultado == "OK":
+                sin_tipo[ev.worker_id].append(ev)
+            continue
+        for event_type in tipos:
+            key = f"{ev.ticket}_{event_type}"
+            claves_por_worker[ev.worker_id].add(key)
+            if ev.resultado == "OK":
+                ok_por_worker[ev.worker_id].setdefault(key, ev)
+    
+    return ok_por_worker, claves_por_worker, sin_tipo
+
+
+def _en_ventana(ts_ms: int | None, desde_ms: int | None, hasta_ms: int | None) -> bool:
+    """Sin ventana todo entra; con ventana, los timestamps no válidos quedan fuera."""
+    if desde_ms is None and hasta_ms is None:
+        return True
+    if ts_ms is None:
+        return False
+    return (desde_ms is None or ts_ms >= desde_ms) and (hasta_ms is None or ts_ms <= hasta_ms)
+
+
+def correlacionar_worker(
+    worker_id: str,
+    distribuidos_ok: Dict[str, EventoDistribuido],
+    claves_distribuidas: Set[str],
+    procesados: Dict[str, EventoWorker],
+    desde_ms: int | None = None,
+    hasta_ms: int | None = None,
+) -> ResultadoWorker:
+    """
+    Anti-joins de un worker por clave ticket_EVENT:
+    - distribuidos OK que no aparecen en su histórico (filtrados por timestamp de distribución)
+    - ejecutados que nunca se le distribuyeron (filtrados por timestamp de ejecución)
+    """
+    res = ResultadoWorker(worker_id=worker_id)
+    con_ventana = desde_ms is not None or hasta_ms is not None
+    ts_distribucion = TimestampColumn()
+    ts_ejecucion = TimestampColumn()
+    
+    for key, ev in distribuidos_ok.items():
+        if con_ventana and not _en_ventana(ts_distribucion(ev.timestamp), desde_ms, hasta_ms):
+            continue
+        res.distribuidos_ok += 1
+        if key not in procesados:
+            res.faltantes.append((ev, key.rsplit("_", 1)[1]))
+    
+    for key, ev in procesados.items():
+        if con_ventana and not _en_ventana(ts_ejecucion(ev.timestamp_ejecucion), desde_ms, hasta_ms):
+            continue
+        res.procesados += 1
+        if ev.resultado.startswith("ERR"):
+            res.procesados_error += 1
+        if key not in claves_distribuidas:
+            res.no_distribuidos.append(ev)
+    
+    return res
+
+
 def verificar_correlacion(
     common_dir: Path,
-    worker_ids: List[str] | None = None
-) -> None:
-    """Verifica correlación entre históricos."""
+    worker_ids: List[str] | None = None,
+    desde_ms: int | None = None,
+    hasta_ms: int | None = None,
+    muestras: int = DEFAULT_SAMPLES,
+) -> List[ResultadoWorker]:
+    """Verifica correlación entre históricos (hash-join por ticket_EVENT, una pasada por archivo)."""
     
     hist_clonacion_path = common_dir / "historico_clonacion.txt"
     hist_master_path = common_dir / "Historico_Master.txt"
@@ -223,117 +374,98 @@ def verificar_correlacion(
     print(f"\nDirectorio base: {common_dir}")
     print(f"historico_clonacion.txt: {hist_clonacion_path}")
     print(f"Historico_Master.txt: {hist_master_path}")
+    if desde_ms is not None or hasta_ms is not None:
+        fmt = lambda ms: datetime.fromtimestamp(ms / 1000).strftime("%Y.%m.%d %H:%M:%S") if ms is not None else "-"
+        print(f"Ventana: {fmt(desde_ms)} -> {fmt(hasta_ms)}")
+    
+    start = time.perf_counter()
     
-    # Leer eventos distribuidos (solo OK)
+    # Leer eventos distribuidos
     print("\n[1] Leyendo historico_clonacion.txt...")
     eventos_distribuidos = leer_historico_clonacion(hist_clonacion_path)
-    eventos_ok = [e for e in eventos_distribuidos if e.resultado == "OK"]
+    total_ok = sum(1 for e in eventos_distribuidos if e.resultado == "OK")
     print(f"   Total eventos distribuidos: {len(eventos_distribuidos)}")
-    print(f"   Eventos con resultado OK: {len(eventos_ok)}")
+    print(f"   Eventos con resultado OK: {total_ok}")
     
-    if not eventos_ok:
-        print("\n[INFO] No hay eventos distribuidos con resultado OK para verificar.")
-        return
+    if not eventos_distribuidos:
+        print("\n[INFO] No hay eventos distribuidos para verificar.")
+        return []
     
-    # Leer eventos del Master para obtener event_type
+    # Leer e indexar el Master para obtener event_type
     print("\n[2] Leyendo Historico_Master.txt...")
-    eventos_master = leer_historico_master(hist_master_path)
-    print(f"   Eventos en Master: {len(eventos_master)}")
+    master = indexar_historico_master(hist_master_path)
+    print(f"   Eventos en Master: {master.lineas} ({len(master.por_clave)} ticket_EVENT distintos)")
     
-    # Agrupar eventos distribuidos por worker_id
-    eventos_por_worker: Dict[str, List[EventoDistribuido]] = defaultdict(list)
-    for ev in eventos_ok:
-        eventos_por_worker[ev.worker_id].append(ev)
+    ok_por_worker, claves_por_worker, sin_tipo = indexar_distribuciones(eventos_distribuidos, master)
     
     # Si no se especifican workers, usar todos los encontrados
     if worker_ids is None:
-        worker_ids = list(eventos_por_worker.keys())
+        worker_ids = sorted(set(claves_por_worker) | set(sin_tipo))
     
     print(f"\n[3] Verificando workers: {', '.join(worker_ids)}")
     
-    # Verificar cada worker
-    total_faltantes = 0
-    total_procesados = 0
+    # Leer los históricos de todos los workers a la vez (un archivo por proceso si compensa)
+    historicos = load_files(leer_historico_worker, [common_dir / f"historico_WORKER_{w}.txt" for w in worker_ids])
     
-    for worker_id in worker_ids:
+    ts_distribucion = TimestampColumn()
+    resultados: List[ResultadoWorker] = []
+    
+    for worker_id, eventos_procesados in zip(worker_ids, historicos):
+        res = correlacionar_worker(
+            worker_id,
+            ok_por_worker.get(worker_id, {}),
+            claves_por_worker.get(worker_id, set()),
+            eventos_procesados,
+            desde_ms,
+            hasta_ms,
+        )
+        res.sin_event_type = [
+            ev for ev in sin_tipo.get(worker_id, [])
+            if _en_ventana(ts_distribucion(ev.timestamp), desde_ms, hasta_ms)
+        ]
+        resultados.append(res)
+        
         print(f"\n{'=' * 80}")
         print(f"WORKER: {worker_id}")
         print(f"{'=' * 80}")
+        print(f"   Eventos distribuidos (OK): {res.distribuidos_ok}")
+        print(f"   Eventos procesados encontrados: {res.procesados} ({res.procesados_error} con error)")
+        print(f"   Eventos FALTANTES (distribuidos, no ejecutados): {len(res.faltantes)}")
+        print(f"   Eventos NO DISTRIBUIDOS (ejecutados, sin distribución): {len(res.no_distribuidos)}")
+        if res.sin_event_type:
+            print(f"   Eventos sin event_type en Master: {len(res.sin_event_type)}")
         
-        # Eventos distribuidos a este worker
-        eventos_worker = eventos_por_worker.get(worker_id, [])
-        if not eventos_worker:
-            print(f"   [INFO] No hay eventos distribuidos para este worker.")
-            continue
-        
-        # Leer histórico del worker
-        hist_worker_path = common_dir / f"historico_WORKER_{worker_id}.txt"
-        print(f"\n   Leyendo: {hist_worker_path}")
-        eventos_procesados = leer_historico_worker(hist_worker_path)
-        print(f"   Eventos procesados encontrados: {len(eventos_procesados)}")
-        
-        # Construir conjunto de eventos esperados (ticket + event_type)
-        eventos_esperados: Set[Tuple[str, str]] = set()
-        eventos_faltantes: List[Tuple[EventoDistribuido, str]] = []
-        eventos_sin_event_type: List[EventoDistribuido] = []
-        
-        # Agrupar eventos distribuidos por ticket para manejar múltiples distribuciones
-        tickets_distribuidos: Dict[str, List[EventoDistribuido]] = defaultdict(list)
-        for ev_dist in eventos_worker:
-            tickets_distribuidos[ev_dist.ticket].append(ev_dist)
-        
-        # Para cada ticket, buscar sus event_types en Master y verificar procesamiento
-        for ticket, distribuciones in tickets_distribuidos.items():
-            # Buscar todos los event_types posibles para este ticket en Master
-            event_types_en_master = []
-            eventos_master_ticket = {}
-            for key, ev_master in eventos_master.items():
-                if ev_master.ticket == ticket:
-                    event_types_en_master.append(ev_master.event_type)
-                    eventos_master_ticket[ev_master.event_type] = ev_master
-            
-            if event_types_en_master:
-                # Verificar cada event_type encontrado en Master
-                for event_type in event_types_en_master:
-                    eventos_esperados.add((ticket, event_type))
-                    key = f"{ticket}_{event_type}"
-                    if key not in eventos_procesados:
-                        # Este event_type falta en el worker
-                        # Usar la primera distribución de este ticket como referencia
-                        eventos_faltantes.append((distribuciones[0], event_type))
-            else:
-                # No se encontró event_type en Master para este ticket
-                eventos_sin_event_type.extend(distribuciones)
-        
-        # Mostrar resultados
-        print(f"\n   Eventos distribuidos (OK): {len(eventos_worker)}")
-        print(f"   Eventos procesados encontrados: {len(eventos_procesados)}")
-        print(f"   Eventos esperados (con event_type): {len(eventos_esperados)}")
-        print(f"   Eventos FALTANTES: {len(eventos_faltantes)}")
-        if eventos_sin_event_type:
-            print(f"   Eventos sin event_type en Master: {len(eventos_sin_event_type)}")
-        
-        if eventos_faltantes:
+        if res.faltantes:
             print(f"\n   [ALERTA] EVENTOS DISTRIBUIDOS PERO NO PROCESADOS:")
             print(f"   {'-' * 76}")
-            for ev_dist, event_type in eventos_faltantes:
+            for ev_dist, event_type in res.faltantes[:muestras]:
                 # Buscar info adicional en Master
-                key = f"{ev_dist.ticket}_{event_type}"
-                ev_master = eventos_master.get(key)
+                ev_master = master.por_clave.get(f"{ev_dist.ticket}_{event_type}")
                 symbol_info = f" ({ev_master.symbol})" if ev_master else ""
                 
                 print(f"   - Ticket: {ev_dist.ticket:>10} | Tipo: {event_type:>6} | "
                       f"Distribuido: {ev_dist.timestamp}{symbol_info}")
+            if len(res.faltantes) > muestras:
+                print(f"   ... y {len(res.faltantes) - muestras} más")
+        
+        if res.no_distribuidos:
+            print(f"\n   [ALERTA] EVENTOS EJECUTADOS SIN DISTRIBUCIÓN REGISTRADA:")
+            print(f"   {'-' * 76}")
+            for ev in res.no_distribuidos[:muestras]:
+                print(f"   - Ticket: {ev.ticket:>10} | Tipo: {ev.event_type:>6} | "
+                      f"Resultado: {ev.resultado[:30]:<30} | Ejecutado: {ev.timestamp_ejecucion}")
+            if len(res.no_distribuidos) > muestras:
+                print(f"   ... y {len(res.no_distribuidos) - muestras} más")
         
-        if eventos_sin_event_type:
+        if res.sin_event_type:
             print(f"\n   [WARN] EVENTOS DISTRIBUIDOS SIN EVENT_TYPE EN MASTER:")
             print(f"   {'-' * 76}")
-            for ev_dist in eventos_sin_event_type[:10]:  # Mostrar solo los primeros 10
+            for ev_dist in res.sin_event_type[:muestras]:
                 print(f"   - Ticket: {ev_dist.ticket:>10} | Distribuido: {ev_dist.timestamp}")
-            if len(eventos_sin_event_type) > 10:
-                print(f"   ... y {len(eventos_sin_event_type) - 10} más")
+            if len(res.sin_event_type) > muestras:
+                print(f"   ... y {len(res.sin_event_type) - muestras} más")
         
-        if not eventos_faltantes and not eventos_sin_event_type:
+        if not res.faltantes and not res.no_distribuidos and not res.sin_event_type:
             print(f"\n   [OK] Todos los eventos distribuidos fueron procesados.")
         
         # Mostrar algunos eventos procesados como referencia
@@ -343,17 +475,21 @@ def verificar_correlacion(
             for ev in eventos_lista[-5:]:
                 print(f"   - Ticket: {ev.ticket:>10} | Tipo: {ev.event_type:>6} | "
                       f"Resultado: {ev.resultado[:30]:<30} | Ejecutado: {ev.timestamp_ejecucion}")
-        
-        total_faltantes += len(eventos_faltantes)
-        total_procesados += len(eventos_procesados)
+    
+    total_distribuidos = sum(r.distribuidos_ok for r in resultados)
+    total_procesados = sum(r.procesados for r in resultados)
+    total_faltantes = sum(len(r.faltantes) for r in resultados)
+    total_no_distribuidos = sum(len(r.no_distribuidos) for r in resultados)
     
     # Resumen final
     print(f"\n{'=' * 80}")
     print("RESUMEN FINAL")
     print(f"{'=' * 80}")
-    print(f"Total eventos distribuidos (OK): {len(eventos_ok)}")
+    print(f"Total eventos distribuidos (OK): {total_distribuidos}")
     print(f"Total eventos procesados: {total_procesados}")
     print(f"Total eventos FALTANTES: {total_faltantes}")
+    print(f"Total eventos ejecutados sin distribución: {total_no_distribuidos}")
+    print(f"Tiempo de verificación: {time.perf_counter() - start:.2f}s")
     
     if total_faltantes > 0:
         print(f"\n[ALERTA] Se encontraron {total_faltantes} eventos distribuidos que no aparecen en los históricos de los workers.")
@@ -364,6 +500,8 @@ def verificar_correlacion(
         print("   - Error crítico antes de AppendHistory")
     else:
         print(f"\n[OK] Todos los eventos distribuidos fueron procesados correctamente.")
+    
+    return resultados
 
 
 def main():
@@ -382,6 +520,30 @@ def main():
         default=None,
         help="Lista de worker IDs separados por coma (ej: 511029358,3037589). Por defecto: todos los encontrados"
     )
+    parser.add_argument(
+        "--horas",
+        type=float,
+        default=None,
+        help="Solo eventos de las últimas N horas"
+    )
+    parser.add_argument(
+        "--desde",
+        type=str,
+        default=None,
+        help="Inicio de la ventana (YYYY.MM.DD HH:MM:SS o ms epoch)"
+    )
+    parser.add_argument(
+        "--hasta",
+        type=str,
+        default=None,
+        help="Fin de la ventana (YYYY.MM.DD HH:MM:SS o ms epoch)"
+    )
+    parser.add_argument(
+        "--muestras",
+        type=int,
+        default=DEFAULT_SAMPLES,
+        help=f"Ejemplos a mostrar por tipo de discrepancia (por defecto: {DEFAULT_SAMPLES})"
+    )
     
     args = parser.parse_args()
     
@@ -400,8 +562,17 @@ def main():
     if args.workers:
         worker_ids = [w.strip() for w in args.workers.split(",") if w.strip()]
     
+    # Ventana temporal
+    desde_ms = timestamp_to_ms(args.desde) if args.desde else None
+    hasta_ms = timestamp_to_ms(args.hasta) if args.hasta else None
+    if (args.desde and desde_ms is None) or (args.hasta and hasta_ms is None):
+        print("[ERROR] Formato de fecha no válido (use YYYY.MM.DD HH:MM:SS o ms epoch)")
+        return 1
+    if args.horas is not None:
+        desde_ms = int((time.time() - args.horas * 3600) * 1000)
+    
     try:
-        verificar_correlacion(common_dir, worker_ids)
+        verificar_correlacion(common_dir, worker_ids, desde_ms, hasta_ms, args.muestras)
         return 0
     except Exception as e:
         print(f"\n[ERROR] Error durante la verificación: {e}")
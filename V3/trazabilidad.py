@@ -15,9 +15,14 @@ from pathlib import Path
 from typing import Dict, List, Optional
 import csv
 import os
+import sys
 from datetime import datetime
 import math
 
+# Decodificación de timestamps: tiempos.py se mantiene solo en Produccion/V2
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "Produccion" / "V2"))
+from tiempos import TimestampColumn, nearest_hour_offset_ms as _nearest_hour_offset_ms, timestamp_to_ms  # noqa: E402
+
 # Configuración por defecto
 DEFAULT_COMMON_FILES_DIR = Path.home() / "AppData" / "Roaming" / "MetaQuotes" / "Terminal" / "Common" / "Files"
 V3_PHOENIX_DIR = Path("V3") / "Phoenix"
@@ -198,23 +203,6 @@ def read_worker_hist(hist_path: Path) -> Dict[str, Dict[str, str]]:
     return worker_data
 
 
-def _nearest_hour_offset_ms(delta_ms: int, max_jitter_ms: int = 120_000) -> Optional[int]:
-    """
-    Si delta_ms está cerca de un múltiplo de 1 hora (3600s), devuelve ese offset en ms.
-    Sirve para corregir desfaces UTC vs hora servidor MT4 cuando se comparan timestamps de distintos sistemas.
-    """
-    hour_ms = 3_600_000
-    if delta_ms == 0:
-        return 0
-    k = int(round(delta_ms / hour_ms))
-    if k == 0:
-        return 0
-    candidate = k * hour_ms
-    if abs(delta_ms - candidate) <= max_jitter_ms:
-        return candidate
-    return None
-
-
 def aggregate_worker_data(all_worker_data: List[Dict[str, Dict[str, str]]]) -> Dict[str, Dict[str, str]]:
     """
     Agrega datos de múltiples workers.
@@ -230,42 +218,6 @@ def aggregate_worker_data(all_worker_data: List[Dict[str, Dict[str, str]]]) -> D
     return aggregated
 
 
-def timestamp_to_ms(timestamp_str: str) -> Optional[int]:
-    """
-    Convierte timestamp a milisegundos.
-    Acepta formato: milisegundos (string numérico) o fecha (YYYY.MM.DD HH:MM:SS.mmm)
-    """
-    if not timestamp_str or timestamp_str.strip() == "":
-        return None
-    
-    timestamp_str = timestamp_str.strip()
-    
-    # Si es numérico, asumir que ya está en milisegundos
-    try:
-        ms = int(float(timestamp_str))
-        # Si el número es muy pequeño (< 1000000000), asumir que está en segundos
-        if ms < 1000000000:
-            ms = ms * 1000
-        return ms
-    except ValueError:
-        pass
-    
-    # Intentar parsear como fecha: YYYY.MM.DD HH:MM:SS.mmm
-    try:
-        # Formato: 2026.01.05 20:04:09.433
-        dt = datetime.strptime(timestamp_str, "%Y.%m.%d %H:%M:%S.%f")
-        return int(dt.timestamp() * 1000)
-    except ValueError:
-        try:
-            # Formato sin milisegundos: 2026.01.05 20:04:09
-            dt = datetime.strptime(timestamp_str, "%Y.%m.%d %H:%M:%S")
-            return int(dt.timestamp() * 1000)
-        except ValueError:
-            pass
-    
-    return None
-
-
 def calculate_diff_ms(event_time_ms: Optional[int], timestamp_str: str) -> Optional[int]:
     """
     Calcula la diferencia en milisegundos entre event_time y otro timestamp.
@@ -347,6 +299,9 @@ def generate_traceability(common_dir: Path, output_path: Path, filter_today: boo
     # Generar trazabilidad
     output_path.parent.mkdir(parents=True, exist_ok=True)
     
+    # Un conversor por campo: el formato se detecta una vez por columna
+    ts = {name: TimestampColumn() for name in ("event_time", "export_time", "read_time", "distribute_time", "worker_read_time", "worker_exec_time")}
+    
     with open(output_path, "w", encoding="utf-8") as f:
         # Header con diferencias y total
         f.write("ticket_event|event_time|export_time|read_time|distribute_time|worker_read_time|worker_exec_time|diff_export_ms|diff_read_ms|diff_distribute_ms|diff_worker_read_ms|diff_worker_exec_ms|total_ms\n")
@@ -363,12 +318,12 @@ def generate_traceability(common_dir: Path, output_path: Path, filter_today: boo
             worker_exec_time = worker_info.get("worker_exec_time", "")
             
             # Convertir todos los timestamps a milisegundos
-            event_time_ms = timestamp_to_ms(event_time)
-            export_time_ms = timestamp_to_ms(export_time)
-            read_time_ms = timestamp_to_ms(read_time)
-            distribute_time_ms = timestamp_to_ms(distribute_time)
-            worker_read_time_ms = timestamp_to_ms(worker_read_time)
-            worker_exec_time_ms = timestamp_to_ms(worker_exec_time)
+            event_time_ms = ts["event_time"](event_time)
+            export_time_ms = ts["export_time"](export_time)
+            read_time_ms = ts["read_time"](read_time)
+            distribute_time_ms = ts["distribute_time"](distribute_time)
+            worker_read_time_ms = ts["worker_read_time"](worker_read_time)
+            worker_exec_time_ms = ts["worker_exec_time"](worker_exec_time)
 
             # Normalización:
             # - export/read/distribute vienen de Python/Extractor en UTC ms.